@@ -6,25 +6,48 @@ import argparse
 import ntpath
 import re
 import sys
-from PyQt5 import QtGui
-from PyQt5 import QtWidgets
-from PyQt5 import QtCore
+
+# Headless mode (used by the pipeline) needs neither Qt, which is slow to import, nor a display
+# Flags can't be abbreviated (see parse_command_line), so an abbreviation is rejected when parsing, without importing Qt first.
+HEADLESS= any( 
+    len( arg.split('=')[0] ) > 2 and headless_flag.startswith( arg.split('=')[0] ) 
+    for arg in sys.argv[1:] if arg.startswith('--') 
+    for headless_flag in ['--no_gui', '--update_mdoc', '--catalog', '--watch'] 
+    )
+if not HEADLESS:
+    from PyQt5 import QtGui
+    from PyQt5 import QtWidgets
+    from PyQt5 import QtCore
+    QMainWindow= QtWidgets.QMainWindow
+    QStandardItem= QtGui.QStandardItem
+    QStyledItemDelegate= QtWidgets.QStyledItemDelegate
+    QStandardItemModel= QtGui.QStandardItemModel
+    QObject= QtCore.QObject
+    QRunnable= QtCore.QRunnable
+    pyqtSignal= QtCore.pyqtSignal
+else:
+    QMainWindow= QStandardItem= QStyledItemDelegate= QStandardItemModel= QObject= QRunnable= object
+    pyqtSignal= lambda *types: None
 import glob
+import fnmatch
 from functools import partial
 import subprocess 
 import shutil
-import tqdm
+import struct
+import sqlite3
+import concurrent.futures
 import inspect
+import contextlib
+import itertools
+import time
+import threading
+import hashlib
+import collections
 try:
-    import mrcfile
+    import fcntl
 except ImportError:
-    print("ERROR!! mrcfile must be installed", file=sys.stderr)
-    exit(1)
-# Image creation manipulation imports
-import numpy as np
-import matplotlib.pyplot as plt
-from PIL import Image
-import copy
+    fcntl= None  # Not available on Windows, in which case files won't be locked
+# Image creation & manipulation imports (mrcfile, numpy, matplotlib, PIL) and tqdm are deferred until needed
 import webbrowser
 from datetime import datetime
 
@@ -61,8 +84,35 @@ desired_items_tilt = ['[ZValue', 'TiltAngle', 'DoseRate', 'SubFramePath', 'DateT
 # IMOD executables to check
 IMOD_EXE_LIST= ['header', '3dmod', '3dmodv']
 
-class MdocTreeView(QtWidgets.QMainWindow):
+# Threads used for file-system queries, which are mostly spent waiting on the (network) file system
+IO_WORKERS= 16
+
+# Micrograph paths which are generated from templates (see pathTemplates)
+PATH_KEYS= ['MoviePath', 'McorrMic', 'TiffFile', 'MicThumbnail', 'CtfThumbnail', 'DenoiseMic']
+
+# Top-level JSON key under which the path templates are saved (it's not a target file)
+PATHS_KEY= '__paths__'
+
+# Key, for tilt series (in the header dictionary) and for target files, under which summary statistics are kept (see tiltSeriesRollup)
+ROLLUP_KEY= 'Rollup'
+
+# Files counted in the rollups, for each tilt series and for each micrograph
+TS_ARTIFACT_KEYS= ['CtfSummary', 'CentralSlice', 'CtfBytsPlot', 'DosefitPlot']
+MIC_ARTIFACT_KEYS= ['MoviePath', 'TiffFile', 'McorrMic', 'MicThumbnail', 'CtfThumbnail', 'DenoiseMic']
+
+# Parsed CTF summaries, with the filename as the key (see indexCtfSummary)
+CTF_SUMMARY_CACHE= {}
+
+# Parsed MDOC files, with the filename as the key (see scanMdoc)
+MDOC_CACHE= {}
+
+# Parsed MRC headers, with (filename, mtime) as the key (see readMrcHeader)
+MRC_HEADER_CACHE= {}
+
+class HeatwaveSession:
     """
+    Builds & saves the metadata, without any GUI (and without Qt)
+    
     Outline:
         checkJson
             countData
@@ -74,19 +124,15 @@ class MdocTreeView(QtWidgets.QMainWindow):
             parseMdoc
                 readCtf
                 setPathAndWarn
+            storeMdoc
+            makeThumbnails
         cleanJsonData
         countData
-        buildStatMap
-        buildGUI
-            drawButtons
-            drawTargetData
-                buildStatList
-                    addMicWidget
+        watchSession
+            updateMdoc
     """
 
     def __init__(self, options, debug=False):
-        super().__init__()
-
         # Set parameters
         self.options= options
         self.target_files= options.target_files
@@ -102,6 +148,10 @@ class MdocTreeView(QtWidgets.QMainWindow):
         self.debug= options.debug
         self.json= self.options.json
         self.ctfbyts_tgts= self.options.ctfbyts_tgts
+        self.manifest_file= self.options.manifest if self.options.manifest else self.json + '.manifest'
+        self.journal_file= self.json + '.journal'
+        self.sqlite_store= None
+        if self.options.store == 'sqlite': self.sqlite_store= SqliteStore( os.path.splitext(self.json)[0] + '.sqlite' )
         
         # Initialize
         self.loaded_json= False
@@ -126,9 +176,34 @@ class MdocTreeView(QtWidgets.QMainWindow):
         self.incinerate_dir= re.sub('\$IN_DIR', self.options.in_dir, self.options.incinerate_dir)
         self.did_warn_thumbs= False
         self.did_warn_ctfs= False
+        self.did_warn_mrcfile= False
         self.exe_dict= {}
+        self.manifest= {}  # Input-file signatures from the previous build, for each MDOC
+        self.new_manifest= {}  # Input-file signatures from the current build
+        self.reuse_data= {}  # Tilt-series data from the previous build, which can be reused if inputs are unchanged
+        self.num_reused= 0
+        self.fs_snapshot= DirectorySnapshot()  # Directory listings, to avoid one network round trip per file
+        self.list_ctfplots= None               # Target-file CTF plots, globbed once (see findCtfbytsPlots)
+        self.missing_thumbs= []  # Micrograph thumbnails to be created: [micrograph data, micrograph, thumbnail]
+        self.written_paths= set()  # Thumbnails made by this process, whose changes '--watch' ignores
+        self.state_lock= threading.Lock()  # Protects missing_thumbs, new_manifest & num_reused, which parseMdoc workers modify while checkpoints are saved
+        self.pending_changes= []  # Edits not yet saved: [target, MDOC, tilt key (None for the tilt series), field key (None unless only that field changed)]
+        self.dirty_mdocs= set()  # Tilt series whose checkboxes have changed since the last save
+        self.journal_length= 0  # Number of edits in the journal, i.e., not yet in the JSON file
+        self.journal_offset= 0  # Size of the journal when last read or written by this process
+        self.json_signature= None  # Signature of the JSON file when last read or written by this process
+        self.checkpoint_file= self.json + '.ckpt'
+        self.dose_per_image= None  # Read once (see get_dose_per_image)
+        self.completed_mdocs= set()  # Tilt series already built when resuming from a checkpoint
+        self.loaded_mdocs= set()  # Tilt series in the store when last read or written (others were added by another process, and missing ones were removed by this one)
 
         # Do stuff
+        if self.sqlite_store: self.checkSqlite()
+        
+        if self.options.update_mdoc:
+            self.updateMdoc(self.options.update_mdoc)
+            return
+        
         self.checkJson()
         self.parseTargetsOrMdocs()
         
@@ -145,17 +220,7 @@ class MdocTreeView(QtWidgets.QMainWindow):
             else:
                 self.countData()
         
-        if not self.options.no_gui:
-            # Set column widths & formats
-            self.stat_map= self.buildStatMap(debug=debug)
-            
-            # Initialize column list (in the order in which they will be displayed)
-            self.list_columns=['Micrograph', 'CtfFind4'] + self.stat_map.keys
-            
-            # Draw GUI
-            self.buildGUI()
-        else:
-            exit(0)
+        if self.options.watch: self.watchSession()
 
     def checkJson(self):
         """
@@ -167,24 +232,251 @@ class MdocTreeView(QtWidgets.QMainWindow):
             self.data4json : dictionary of dictionaries
         """
         
+        store_file= self.sqlite_store.db_file if self.sqlite_store else self.json
+        
         if self.options.new:
-            if not os.path.exists(self.json):
+            if not os.path.exists(store_file):
                 if self.verbosity>=1 : print("Building new JSON file...")
             else:
-                backup_json= self.json + '.BAK'
-                if self.verbosity>=1 : print(f"Backing up JSON file '{self.json}' to '{backup_json}'...")
+                backup_json= store_file + '.BAK'
+                if self.verbosity>=1 : print(f"Backing up JSON file '{store_file}' to '{backup_json}'...")
 
                 # On NFS-mounted drives, might have problems copying attributes
-                shutil.copyfile(self.json, backup_json)  # WAS shutil.copy2(self.json, backup_json)
+                shutil.copyfile(store_file, backup_json)  # WAS shutil.copy2(self.json, backup_json)
+                
+                # Everything saved until now will be replaced (see self.loaded_mdocs), 
+                # but tilt series added by other processes in the meantime, and later edits, will be merged
+                old_data= self.readStore()
+                
+                # Tilt series whose inputs haven't changed won't need to be re-parsed
+                self.manifest= readManifest(self.manifest_file, verbosity=self.verbosity)
+                if self.manifest:
+                    for curr_target in old_data.keys():
+                        for curr_mdoc in old_data[curr_target].keys():
+                            if isinstance(old_data[curr_target][curr_mdoc], list):
+                                self.reuse_data[curr_mdoc]= old_data[curr_target][curr_mdoc]
         else:
+            self.manifest= readManifest(self.manifest_file, verbosity=self.verbosity)
+            
             # Check if json is present
-            if os.path.exists(self.json):
-                if self.verbosity>=1 : print(f"Found JSON file: {self.json}")
-                self.data4json = read_json(self.json)
+            if os.path.exists(store_file):
+                if self.verbosity>=1 : print(f"Found JSON file: {store_file}")
+                self.data4json = self.readStore()
                 self.loaded_json = True
                 self.countData(post_msg=' of old files')
         # End new-json IF-THEN
     
+    def checkSqlite(self):
+        """
+        If using an SQLite store which doesn't exist yet, imports the JSON file, if present
+        """
+        
+        if not os.path.exists(self.sqlite_store.db_file) and os.path.exists(self.json) and not self.options.new:
+            if self.verbosity>=1 : print(f"Importing JSON file '{self.json}' into '{self.sqlite_store.db_file}'...")
+            self.sqlite_store.write( self.readJson(self.json) )
+    
+    def readStore(self):
+        """
+        Reads metadata from the JSON file or SQLite store
+        
+        Returns:
+            metadata, in the JSON layout
+        """
+        
+        if self.sqlite_store:
+            json_data= self.sqlite_store.read()
+        else:
+            # Other processes may be writing at the same time
+            with lockFile(self.json, shared=True):
+                json_data= self.readJson(self.json)
+                self.json_signature= fileSignature(self.json)
+                
+                # Apply edits saved since the JSON file was last written
+                self.journal_length= replayJournal(json_data, self.journal_file)
+                self.journal_offset= journalSize(self.journal_file)
+            
+            if self.journal_length>0 and self.verbosity>=2: 
+                print(f"Applied {self.journal_length} edits from journal '{self.journal_file}'")
+        
+        self.loaded_mdocs= set( curr_mdoc for curr_target in json_data.keys() for curr_mdoc, general_and_tilt in iterTiltSeries(json_data[curr_target]) )
+        
+        # Target-file rollups aren't saved, and files may have been added or removed since the tilt-series rollups were stored
+        typeJsonData(json_data)
+        self.updateRollups(json_data, check_files=True)
+        
+        return json_data
+    
+    def writeStore(self):
+        """
+        Writes all metadata to the JSON file or SQLite store
+        """
+        
+        if self.sqlite_store:
+            # Tilt series added by other processes in the meantime will be kept
+            self.sqlite_store.write(self.data4json, known_mdocs=self.loaded_mdocs)
+            if self.verbosity>=1: print(f'Data exported and saved as {self.sqlite_store.db_file}')
+            if self.options.export_json: self.saveJson(self.data4json, self.json)
+        else:
+            with lockFile(self.json):
+                self.mergeStore()
+                self.saveJson(self.data4json, self.json)
+                self.json_signature= fileSignature(self.json)
+                
+                # The journal, if any, was applied when reading (or merging), and is now part of the JSON file
+                self.removeJournal()
+        
+        self.loaded_mdocs= set( curr_mdoc for curr_target in self.data4json.keys() for curr_mdoc, general_and_tilt in iterTiltSeries(self.data4json[curr_target]) )
+        self.pending_changes= []
+    
+    def mergeStore(self):
+        """
+        Merges into self.data4json what other processes saved to the JSON file since this process read it
+            Edits in the journal are applied, if the JSON file hasn't been rewritten in the meantime.
+            Otherwise, only tilt series which weren't there before are added.
+        
+        The lock (see lockFile) needs to be held.
+        """
+        
+        if not os.path.exists(self.json): return
+        
+        if fileSignature(self.json) == self.json_signature:
+            num_entries= replayJournal(self.data4json, self.journal_file, offset=self.journal_offset)
+            typeJsonData(self.data4json)
+        else:
+            disk_data= self.readJson(self.json)
+            num_entries= replayJournal(disk_data, self.journal_file)
+            
+            for curr_target in disk_data.keys():
+                for curr_mdoc, general_and_tilt in iterTiltSeries(disk_data[curr_target]):
+                    # Tilt series which were known, but which are missing now, were removed by this process
+                    if curr_mdoc in self.loaded_mdocs: continue
+                    
+                    if curr_target not in self.data4json: self.data4json[curr_target]= {}
+                    if curr_mdoc not in self.data4json[curr_target]:
+                        self.data4json[curr_target][curr_mdoc]= TiltSeries(general_and_tilt)
+                    if 'CtfBytsPlot' in disk_data[curr_target] and 'CtfBytsPlot' not in self.data4json[curr_target]:
+                        self.data4json[curr_target]['CtfBytsPlot']= disk_data[curr_target]['CtfBytsPlot']
+            # End target loop
+            
+            self.json_signature= fileSignature(self.json)
+        
+        self.journal_offset= journalSize(self.journal_file)
+        self.updateRollups()
+        if num_entries>0 and self.verbosity>=2: print(f"Merged {num_entries} edits saved by another process")
+    
+    def saveChanges(self):
+        """
+        Saves edits (self.pending_changes)
+        
+        The SQLite store updates only the changed rows.
+        The JSON store appends the edits to a journal, and rewrites the JSON file only once the journal gets long.
+        """
+        
+        if self.sqlite_store:
+            self.sqlite_store.updateRows(self.data4json, self.pending_changes)
+            if self.verbosity>=1: print(f'Saved {len(self.pending_changes)} changes to {self.sqlite_store.db_file}')
+            if self.options.export_json: self.saveJson(self.data4json, self.json)
+        
+        elif self.journal_length + len(self.pending_changes) > self.options.journal_max:
+            self.writeStore()
+        
+        elif len(self.pending_changes) == 0:
+            if self.verbosity>=1: print("No changes to save")
+        
+        else:
+            entry_list= []
+            
+            for curr_target, curr_mdoc, tilt_key, field_key in self.pending_changes:
+                entry= {'target': curr_target, 'mdoc': curr_mdoc, 'tilt': tilt_key}
+                target_data= self.data4json.get(curr_target, {})
+                
+                # Only the edited field, if known, so that data updated by other processes in the meantime aren't overwritten
+                if curr_mdoc not in target_data:
+                    entry['data']= None
+                elif field_key is None:
+                    entry['data']= target_data[curr_mdoc] if tilt_key is None else target_data[curr_mdoc][1][tilt_key]
+                elif tilt_key is None:
+                    entry['general']= {field_key: target_data[curr_mdoc][0].get(field_key)}
+                else:
+                    entry['micrograph']= {field_key: target_data[curr_mdoc][1][tilt_key].get(field_key)}
+                
+                entry_list.append(entry)
+            # End change loop
+            
+            with lockFile(self.json):
+                # Edits appended by other processes in the meantime come first
+                self.mergeStore()
+                appendJournal(entry_list, self.journal_file)
+                self.journal_offset= journalSize(self.journal_file)
+            
+            # Merged edits (e.g., from '--update_mdoc') may have replaced the edited tilt series in memory
+            for entry in entry_list:
+                if 'general' in entry or 'micrograph' in entry:
+                    general_and_tilt= applyJournalEntry(self.data4json, entry)
+                    if general_and_tilt is not None: updateSelectionRollup(general_and_tilt)
+            
+            self.journal_length+= len(entry_list)
+            if self.verbosity>=1: print(f'Saved {len(entry_list)} changes to {self.journal_file}')
+        
+        self.pending_changes= []
+    
+    def compactJournal(self):
+        """
+        Rewrites the JSON file with the journal applied, and removes the journal
+        """
+        
+        if self.sqlite_store or not os.path.exists(self.journal_file): return
+        
+        # Only saved edits, i.e., not what's in memory
+        with lockFile(self.json):
+            json_data= self.readJson(self.json)
+            num_entries= replayJournal(json_data, self.journal_file)
+            self.saveJson(json_data, self.json)
+            self.removeJournal()
+        
+        # The JSON file may now contain edits by other processes which aren't in memory
+        self.json_signature= None
+        if self.verbosity>=2: print(f"Merged {num_entries} journaled edits into {self.json}")
+    
+    def readJson(self, json_file):
+        """
+        Reads metadata from a JSON file, expanding compressed micrograph paths
+        
+        Parameter:
+            json_file : JSON filename
+        
+        Returns:
+            metadata, in the JSON layout
+        """
+        
+        return expandPaths( read_json(json_file) )
+    
+    def saveJson(self, json_data, json_file):
+        """
+        Saves metadata to a JSON file
+        With '--compact_paths', micrograph paths matching the templates (see pathTemplates) aren't saved. 
+        This isn't the default, since builds from before the templates can't read such files.
+        
+        Parameters:
+            json_data : metadata, in the JSON layout
+            json_file : JSON filename
+        """
+        
+        # Target-file rollups are recomputed when read (see updateRollups), and builds from before rollups would reject them as unknown entries
+        json_data= { curr_target: {curr_key: json_data[curr_target][curr_key] for curr_key in json_data[curr_target].keys() if curr_key != ROLLUP_KEY} for curr_target in json_data.keys() }
+        
+        if self.options.compact_paths: json_data= compactPaths(json_data, self.pathTemplates())
+        save_json(json_data, filename=json_file, verbosity=self.verbosity)
+    
+    def removeJournal(self):
+        """
+        Deletes the journal, once its edits are in the JSON file
+        """
+        
+        if os.path.exists(self.journal_file): os.remove(self.journal_file)
+        self.journal_length= 0
+        self.journal_offset= 0
+    
     def countData(self, post_msg=''):
         """
         Summarized data types encountered in JSON data
@@ -197,61 +489,45 @@ class MdocTreeView(QtWidgets.QMainWindow):
         num_targets= 0
         num_mdocs= 0
         num_movies= 0
-        mdoc_keys= ['CtfSummary',   'CentralSlice',         'CtfBytsPlot',                  'DosefitPlot']
+        mdoc_keys= TS_ARTIFACT_KEYS
         mdoc_tags= ['CTF summaries','tilt-series CTF plots','reconstruction central slices','dose-fitting plots']
-        mic_keys= ['MoviePath',        'TiffFile',  'McorrMic',                    'MicThumbnail',         'CtfThumbnail',             'DenoiseMic']
+        mic_keys= MIC_ARTIFACT_KEYS
         mic_tags= ['micrograph movies','TIFF files','motion-corrected micrographs','micrograph thumbnails','power-spectrum thumbnails','denoised micrographs']
         found_dict= {key: 0 for key in ['target_files','target_ctfplots','target_ctfplots','mdocs','selected_mdocs','MdocSelected'] + mdoc_keys + mic_keys }
         num_targets= len( self.data4json.keys() )
         disableTF= self.verbosity<3 or self.verbosity>6 or self.debug
+        
+        # Rollups are only computed for tilt series which don't have one (artifacts of stored tilt series were checked by readStore)
+        self.updateRollups()
 
         # Loop through target files (real or virtual) (TODO: Move to function)
         for curr_target in self.data4json.keys():
-            if os.path.exists(curr_target) : found_dict['target_files']+= 1
+            if self.fs_snapshot.exists(curr_target) : found_dict['target_files']+= 1
             if not disableTF: print(f"\nCollecting data from target file '{curr_target}'...")
-            if definedAndExists('CtfBytsPlot', self.data4json[curr_target]) : found_dict['target_ctfplots']+= 1
+            if definedAndExists('CtfBytsPlot', self.data4json[curr_target], snapshot=self.fs_snapshot) : found_dict['target_ctfplots']+= 1
             target_data= self.data4json[curr_target]
             
-            # Loop through (possible) MDOC files
-            for curr_mdoc in tqdm.tqdm(target_data.keys(), unit=' mdoc', disable=disableTF):
-                # Might be the CtfByTS plot
-                if isinstance(target_data[curr_mdoc], list):
-                    num_mdocs+= 1
-                    if os.path.exists(curr_mdoc) : found_dict['mdocs']+= 1
-                    
-                    for curr_key in mdoc_keys:
-                        if definedAndExists(curr_key, target_data[curr_mdoc][0]) : found_dict[curr_key]+= 1
-                        
-                    # Check if MDOC selection should be 0, 1, or 2
-                    all_selected= True
-                    none_selected= True
-                    
-                    # Loop through micrographs
-                    for mic_idx, curr_mic in enumerate(target_data[curr_mdoc][1]):
-                        num_movies+= 1
-                        for curr_key in mic_keys:
-                            if definedAndExists(curr_key, target_data[curr_mdoc][1][curr_mic]) : found_dict[curr_key]+= 1
-                            
-                        if 'MicSelected' in target_data[curr_mdoc][1][curr_mic]:
-                            mic_selected= target_data[curr_mdoc][1][curr_mic]['MicSelected']
-                            if mic_selected:     none_selected= False
-                            if not mic_selected: all_selected= False
-                        else: 
-                            self.data4json[curr_target][curr_mdoc][1][curr_mic]['MicSelected'] = True
-                    # End micrograph loop
-                    
-                    # Set MDOC selection value
-                    if 'MdocSelected' in target_data[curr_mdoc][0]:
-                        if target_data[curr_mdoc][0]['MdocSelected'] > 0 : found_dict['MdocSelected']+= 1
-                    else:
-                        if all_selected:
-                            self.data4json[curr_target][curr_mdoc][0]['MdocSelected'] = 2
-                        else:
-                            if none_selected: 
-                                self.data4json[curr_target][curr_mdoc][0]['MdocSelected'] = 0
-                            else:
-                                self.data4json[curr_target][curr_mdoc][0]['MdocSelected'] = 1
-                # End MDOC IF-THEN
+            # Micrograph counts are summed over the tilt series already
+            target_rollup= target_data[ROLLUP_KEY]
+            num_movies+= target_rollup['NumMics']
+            for curr_key in mdoc_keys + mic_keys:
+                found_dict[curr_key]+= target_rollup['Artifacts'][curr_key]
+            
+            # Loop through MDOC files (skipping the CtfByTS plot)
+            for curr_mdoc, general_and_tilt in progressBar(iterTiltSeries(target_data), unit=' mdoc', disable=disableTF):
+                num_mdocs+= 1
+                if self.fs_snapshot.exists(curr_mdoc) : found_dict['mdocs']+= 1
+                
+                # Set MDOC selection value, to 0, 1, or 2
+                general= general_and_tilt[0]
+                if 'MdocSelected' in general:
+                    if general['MdocSelected'] > 0 : found_dict['MdocSelected']+= 1
+                elif general[ROLLUP_KEY]['NumDeselected'] == 0:
+                    general['MdocSelected'] = 2
+                elif general[ROLLUP_KEY]['NumSelected'] == 0:
+                    general['MdocSelected'] = 0
+                else:
+                    general['MdocSelected'] = 1
             # End MDOC loop
         # End target loop
         
@@ -276,6 +552,28 @@ class MdocTreeView(QtWidgets.QMainWindow):
                 print(f"  Found {found_dict[curr_key]}/{num_movies} {curr_tag}")
             print()
         
+    def updateRollups(self, json_data=None, check_files=False):
+        """
+        Computes rollups (see tiltSeriesRollup) for tilt series which don't have one yet, i.e., those which are new or were rebuilt, 
+        and updates those of the target files
+        
+        Parameters:
+            json_data (dict, optional) : metadata, in the JSON layout (default: self.data4json)
+            check_files (bool) : flag to also recount the artifacts of existing rollups, since files may have been added or removed since they were stored
+        """
+        
+        if json_data is None: json_data= self.data4json
+        
+        for curr_target in json_data.keys():
+            for curr_mdoc, general_and_tilt in iterTiltSeries(json_data[curr_target]):
+                if ROLLUP_KEY not in general_and_tilt[0]: 
+                    tiltSeriesRollup(general_and_tilt, snapshot=self.fs_snapshot)
+                elif check_files:
+                    general_and_tilt[0][ROLLUP_KEY]['Artifacts']= artifactRollup(general_and_tilt, snapshot=self.fs_snapshot)
+            
+            targetRollup(json_data[curr_target])
+        # End target loop
+    
     def parseTargetsOrMdocs(self):
         """
         Reads either target files or MDOC files
@@ -402,6 +700,10 @@ class MdocTreeView(QtWidgets.QMainWindow):
         self.ts_dir=       re.sub('\$IN_DIR', self.options.in_dir, self.options.ts_dir)
         self.ctfbyts_tgts= re.sub('\$IN_DIR', self.options.in_dir, self.options.ctfbyts_tgts)
         
+        self.resumeCheckpoint()
+        num_since_checkpoint= 0
+        last_checkpoint_time= time.time()
+        
         # Loop through target files
         for tgt_idx in range( len(self.new_targets) ):
             curr_target=self.new_targets[tgt_idx]
@@ -429,188 +731,575 @@ class MdocTreeView(QtWidgets.QMainWindow):
             
             disableTF= self.verbosity!=6 or self.debug
 
-            # Loop through tilt series
-            for mdoc_idx, curr_mdoc in enumerate( tqdm.tqdm(curr_list_mdocs, unit=' mdoc', disable=disableTF) ):
-                self.parseMdoc(curr_mdoc, curr_target)
-                
-                # Add MDOC, if necessary
-                if not curr_mdoc in self.list_mdocs: 
-                    self.list_mdocs.append(curr_mdoc)
+            # Tilt series in the checkpoint are already in self.data4json
+            for curr_mdoc in curr_list_mdocs:
+                if curr_mdoc in self.completed_mdocs:
+                    if not curr_mdoc in self.list_mdocs: self.list_mdocs.append(curr_mdoc)
                     self.mdoc_lut[os.path.basename(curr_mdoc)] = curr_mdoc
-            # End MDOC loop
+            curr_list_mdocs= [curr_mdoc for curr_mdoc in curr_list_mdocs if curr_mdoc not in self.completed_mdocs]
+            
+            # Read tilt series (in parallel if requested), results come back in the original order
+            list_results= parallelMap(self.parseMdoc, curr_list_mdocs, jobs=self.options.jobs)
+            
+            # Loop through tilt series
+            try:
+                for curr_mdoc, general_and_tilt in zip( progressBar(curr_list_mdocs, unit=' mdoc', disable=disableTF), list_results ):
+                    self.storeMdoc(curr_mdoc, curr_target, general_and_tilt)
+                    self.completed_mdocs.add(curr_mdoc)
+                    
+                    # Add MDOC, if necessary
+                    if not curr_mdoc in self.list_mdocs: 
+                        self.list_mdocs.append(curr_mdoc)
+                        self.mdoc_lut[os.path.basename(curr_mdoc)] = curr_mdoc
+                    
+                    # Save progress periodically
+                    num_since_checkpoint+= 1
+                    if ( self.options.checkpoint_every > 0 and num_since_checkpoint >= self.options.checkpoint_every ) or \
+                       ( self.options.checkpoint_secs > 0 and time.time() - last_checkpoint_time >= self.options.checkpoint_secs ):
+                        self.saveCheckpoint()
+                        num_since_checkpoint= 0
+                        last_checkpoint_time= time.time()
+                # End MDOC loop
+            except KeyboardInterrupt:
+                print(f"\nInterrupted, saving progress to '{self.checkpoint_file}'...")
+                list_results.close()  # Cancels tilt series not yet started, and waits for the others
+                self.saveCheckpoint()
+                raise
             
             if not curr_target in self.temp_targets: self.temp_targets.append(curr_target)
         # End target loop
-
-    '''
-    START OF CUMULATIVE DATA FUNCTION STUFF :)
-    '''
-    def add_cumulative_data(self):
-        '''
-        BUILD CUMULATIVE STUFF HERE!
-            - Get MDOC file locations from mdoc_lut dictionary
-            - Calculate cumulative exposure & dose for original mdoc file
-            - Then transfer values to respective tilts via subframepath identifier
-        '''
         
-        # Create dictionary of original mdoc files (here assumed as the mdoc-path + '.orig' appended at the end)
-        self.mdoc_origs = {}
-        for mdoc in self.mdoc_lut.keys():
-            self.mdoc_origs[mdoc] = {}
-            
-            # Stem is everything up to first dot
-            orig_base= os.path.basename(self.mdoc_lut[mdoc]).split('.')[0] + self.options.orig_mdoc_suffix
-            mdoc_dir= os.path.dirname(self.mdoc_lut[mdoc])
-            self.mdoc_origs[mdoc]['FilePath'] = os.path.join(mdoc_dir, orig_base)
+        if self.missing_thumbs: self.makeThumbnails()
+    
+    def checkpointKey(self):
+        """
+        Returns:
+            inputs of the build, which need to be the same in order to resume from a checkpoint
+        """
         
-        # For each mdoc in the original mdoc dictionary, calculate cumulative exposure and dose
-        for mdoc_orig in self.mdoc_origs.keys():
-            orig_path= self.mdoc_origs[mdoc_orig]['FilePath']
-            
-            if os.path.exists(orig_path):
-                # Read general & tilt information for original mdoc
-                general, tilt = readMdocHeader(orig_path)
-                
-                # Calculate exposure and dose based on tilt information available in the original mdoc, save into dictionary
-                path_exposure_dose = self.get_cumulative_data(tilt)
-                self.mdoc_origs[mdoc_orig]['CumulativeData'] = path_exposure_dose
-            else:
-                if not self.warn_dict['OrigMdoc']:
-                    if self.verbosity >= 1: print(f"WARNING! Original MDOC not found for '{mdoc_orig}', setting dose/exposure to -1")
-                    self.warn_dict['OrigMdoc'] = True
+        return {'json': self.json, 'targets': self.new_targets, 'mdocs': self.new_mdocs, 'new': self.options.new}
+    
+    def saveCheckpoint(self):
+        """
+        Saves the partially built metadata, and which tilt series are finished, to self.checkpoint_file
+        """
         
-        # Transfer cumulative values to JSON
-        for targets_file in self.data4json.keys():
-            for mdoc in self.data4json[targets_file].keys():
-                if mdoc == 'CtfBytsPlot':
-                    continue
-                for tilt_num in self.data4json[targets_file][mdoc][1].keys():
-                    subframepath = self.data4json[targets_file][mdoc][1][tilt_num]['SubFramePath']
-                    mdoc_base= os.path.basename(mdoc)  # mdoc.split('/')[-1]
-                    self.data4json[targets_file][mdoc][1][tilt_num]['CumExposure'] = -1
-                    self.data4json[targets_file][mdoc][1][tilt_num]['CumDose'] = -1
-                    if 'CumulativeData' in self.mdoc_origs[mdoc_base]:
-                        if subframepath in self.mdoc_origs[mdoc_base]['CumulativeData']:
-                            cum_exposure, cum_dose = self.mdoc_origs[mdoc_base]['CumulativeData'][subframepath]
-                        
-                            # Save cumulative exposure/dose into data4json
-                            self.data4json[targets_file][mdoc][1][tilt_num]['CumExposure'] = cum_exposure
-                            self.data4json[targets_file][mdoc][1][tilt_num]['CumDose'] = cum_dose
-                            
-    def get_cumulative_data(self, tilt_data):
-        '''
-        Args:
-            tilt_data: List of z_blocks from parsing an .mdoc file.
-
-        Returns:
-            path_dose_exposure: Dictionary, where each key is the absolute path of an .eer file and the item is a list of two numbers: 
-                1) accumulated exposure time (read from the .mdoc z_blocks) and 
-                2) accumulated dose. 
-              
-            If the dose per image could not be calculated (because of a missing motioncor-frame.txt file for example), it will be set to -1.
-        '''
-        # Define cumulative data dictionary
-        path_dose_exposure = {}
+        # Queued thumbnails are made now, since the tilt series won't be parsed again after resuming
+        if self.missing_thumbs: self.makeThumbnails()
         
-        # Try to get dose per image
-        dose_per_image = self.get_dose_per_image()
-        cum_dose = 0
-        cum_exposure = 0
-        
-        # Loop through each tilt and calculate cumulative exposure time and dosage (if possible)
-        for tilt_information in tilt_data:
-            frame_path = ''
-            for line in tilt_information:
-                if "SubFramePath" in line:
-                    # Saves frame path
-                    frame_path = line.strip().split()[2]
-                elif "ExposureTime" in line:
-                    # Saves exposure time
-                    exposure_time = float(line.strip().split()[2])
-            
-            # Create entry in data dictionary for each tilt and add cumulative exposure first
-            cum_exposure += exposure_time
-            path_dose_exposure[frame_path] = [cum_exposure]
-            
-            # If cumulative dose was found, add cumulative dose to data dictionary, otherwise add -1
-            if cum_dose == -1:
-                path_dose_exposure[frame_path].append(-1)
-            else:
-                cum_dose += dose_per_image
-                path_dose_exposure[frame_path].append(cum_dose)
-            
-        return path_dose_exposure
-
-    def get_dose_per_image(self):
-        '''
-        Returns:
-            Dose per image calculated from found motioncor-frame.txt file.
-
-            Tries to get the name of the motioncor-frame file from the SNARTomo settings file
-            (should be saved in <SNARTomoDir>/Logs/settings.txt). The motioncor-frame file is assumed to be saved in the
-            same directory from which SNARTomo was originally executed.
-
-            Will return -1 if it couldn't read a frames file.
-        '''
+        # Workers may still be adding to the manifest
+        with self.state_lock: curr_manifest= dict(self.new_manifest)
         
-        dose_per_image= -1  # default
+        checkpoint= {
+            'key'      : self.checkpointKey(), 
+            'completed': sorted(self.completed_mdocs), 
+            'manifest' : curr_manifest, 
+            'data'     : compactPaths(self.data4json, self.pathTemplates()), 
+            }
+        save_json(checkpoint, filename=self.checkpoint_file)
+        if self.verbosity>=3: print(f"  Saved checkpoint after {len(self.completed_mdocs)} tilt series to '{self.checkpoint_file}'")
+    
+    def resumeCheckpoint(self):
+        """
+        If a checkpoint from an interrupted build with the same inputs exists, continues from there
         
-        if self.options.dose:
-            dose_per_image = self.options.dose
+        Modifies:
+            self.data4json
+            self.completed_mdocs
+            self.new_manifest
+        """
         
-        else:
-            # Find name of motioncor frames file
-            if os.path.exists(self.options.frame_file):
-                frames_file= self.options.frame_file  # "motioncor-frame.txt"
-            else:
-                # Read settings.txt file (saved under SNARTomo/settings.txt
-                settings_file= re.sub('\$IN_DIR', self.options.in_dir, self.options.settings)  #### os.path.join(self.indir, 'settings.txt')
-                
-                if os.path.exists(settings_file):
-                    with open(settings_file) as settings_fin:
-                        for line in settings_fin:
-                            if "--frame_file" in line:
-                                frames_file = line.strip().split(' ')[1].replace('\t', '')
-            # END frames-file IF-THEN
-            
-            if os.path.exists(frames_file):
-                # read frame file and calculate dose per image
-                with open(frames_file) as frame_fin:
-                    frames, grouping, dose_per_frame = frame_fin.readline().split()
-                    dose_per_image = float(frames) * float(dose_per_frame)
-        return dose_per_image
-
-    '''
-    END OF CUMULATIVE DATA FUNCTION STUFF :(
-    '''
-
-    def parseTargetFile(self, target_file, ts_dir=None, tgt_idx=None, msg='Parsing target file'):
+        if not os.path.exists(self.checkpoint_file): return
+        
+        try:
+            checkpoint= read_json(self.checkpoint_file)
+        except ValueError:
+            print(f"WARNING! Couldn't read checkpoint '{self.checkpoint_file}', starting from the beginning")
+            return
+        
+        if checkpoint.get('key') != self.checkpointKey():
+            if self.verbosity>=1: print(f"WARNING! Checkpoint '{self.checkpoint_file}' is from a build with different inputs, ignoring...")
+            return
+        
+        self.data4json= typeJsonData( expandPaths(checkpoint['data']) )
+        self.completed_mdocs= set(checkpoint['completed'])
+        self.new_manifest.update(checkpoint['manifest'])
+        if self.verbosity>=1: print(f"Resuming from checkpoint '{self.checkpoint_file}' after {len(self.completed_mdocs)} tilt series")
+    
+    def updateMdoc(self, curr_mdoc, keep_edits=False):
         """
-        Within a target file, finds MDOC files
+        Parses a single tilt series, and adds it to the store (or replaces it).
+        The other tilt series aren't read, so the time needed doesn't depend on the size of the session.
         
         Parameters:
-            target_file : target file
-            ts_dir (optional) : directory in which to look for MDOC
-            tgt_idx : (optional) counter for target files for display
-            msg : (optional) message to display
-            
-        Returns:
-            list of MDOCs
+            curr_mdoc (str) : MDOC file
+            keep_edits (bool) : flag to keep the selections and notes of the stored tilt series (see carryEdits), which requires reading the store
         """
         
-        if self.verbosity>=2: 
-            msg= f"  {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}: {msg} {target_file}"
-            if tgt_idx:
-                msg+= f"({tgt_idx}/{len(self.temp_targets)})"
-            print(msg + '...')
-
-        # Grep target file for 'tsfile'
-        result= grep('tsfile', target_file)
-        curr_list_mdocs=[]
-
-        for line in result:
-            mdoc_stem= re.sub( '.mrc', '', line.split('=')[1].strip() )
-            mdoc_base= mdoc_stem + '.mrc.mdoc'
+        if not os.path.exists(curr_mdoc):
+            print(f"ERROR!! MDOC file '{curr_mdoc}' not found! Exiting...", file=sys.stderr)
+            exit(10)
+        if self.options.new and self.verbosity>=1 and not keep_edits: print("WARNING! Flag '--new' is ignored with '--update_mdoc'")
+        
+        # Perform some substitutions (as in buildJson)
+        self.ts_dir=       re.sub('\$IN_DIR', self.options.in_dir, self.options.ts_dir)
+        self.ctfbyts_tgts= re.sub('\$IN_DIR', self.options.in_dir, self.options.ctfbyts_tgts)
+        
+        curr_target= self.findMdocTarget(curr_mdoc)
+        if self.verbosity>=2: print(f"Updating '{curr_mdoc}' in target '{curr_target}'...")
+        
+        general_and_tilt= self.parseMdoc(curr_mdoc)
+        if self.missing_thumbs: self.makeThumbnails()
+        self.applyCumulativeData( general_and_tilt[1], self.cumulativeData(curr_mdoc) )
+        tiltSeriesRollup(general_and_tilt, snapshot=self.fs_snapshot)
+        
+        # Only this tilt series (and its target file) will be written
+        self.data4json= { curr_target: {curr_mdoc: general_and_tilt} }
+        if self.do_show_imgs:
+            target_base= os.path.basename(curr_target) if curr_target != VIRTUAL_TARGET_FILE else ''
+            ctfbyts_plot= self.findCtfbytsPlots(target_base, debug=self.debug)
+            if ctfbyts_plot: self.data4json[curr_target]['CtfBytsPlot'] = ctfbyts_plot
+        
+        if self.sqlite_store:
+            if keep_edits:
+                old_entry= self.sqlite_store.readMdoc(curr_mdoc)
+                if old_entry: carryEdits(general_and_tilt, old_entry)
+            
+            self.sqlite_store.upsertMdoc(curr_target, curr_mdoc, self.data4json[curr_target])
+            self.updateManifest(curr_mdoc)
+            if self.verbosity>=1: print(f"Saved '{curr_mdoc}' to {self.sqlite_store.db_file}")
+            return
+        
+        # Other tilt series may be updated at the same time
+        with lockFile(self.json):
+            if not os.path.exists(self.json):
+                self.updateRollups()
+                self.saveJson(self.data4json, self.json)
+                self.updateManifest(curr_mdoc)
+                return
+            
+            # Read while holding the lock, so that edits saved in the meantime can't be overwritten
+            if keep_edits:
+                old_data= self.readJson(self.json)
+                replayJournal(old_data, self.journal_file)
+                old_entry= old_data.get(curr_target, {}).get(curr_mdoc)
+                if isinstance(old_entry, list): carryEdits(general_and_tilt, old_entry)
+            
+            # Appended to the journal, which is merged into the JSON file once it gets long
+            entry_list= [ {'target': curr_target, 'mdoc': curr_mdoc, 'tilt': None, 'data': general_and_tilt} ]
+            if 'CtfBytsPlot' in self.data4json[curr_target]:
+                entry_list.append( {'target': curr_target, 'mdoc': 'CtfBytsPlot', 'tilt': None, 'data': self.data4json[curr_target]['CtfBytsPlot']} )
+            appendJournal(entry_list, self.journal_file)
+            
+            with open(self.journal_file, 'r') as f:
+                journal_length= sum(1 for line in f)
+        
+        self.updateManifest(curr_mdoc)
+        if self.verbosity>=1: print(f"Saved '{curr_mdoc}' to {self.journal_file}")
+        if journal_length > self.options.journal_max: self.compactJournal()
+    
+    def watchSession(self):
+        """
+        Runs until interrupted, updating tilt series (see updateMdoc) as files are added or modified
+        
+        The directories watched are those of the tilt series, those of the micrographs (see pathTemplates), 
+        and the parents of the tilt-series directories (for new tilt series, if '--mdoc_files' was given).
+        Changes are collected until there have been none for --debounce_secs, so that a burst of writes causes one update.
+        A tilt series which can't be updated yet (e.g., while its files are still being written) is tried again after the next change.
+        """
+        
+        watcher= DirectoryWatcher(poll_secs=self.options.watch_secs)
+        self.watch_dirs= {}  # Tilt series (set of MDOCs) affected by any change in a directory, or None if new tilt series may have been added
+        self.watch_paths= {}  # Tilt series affected by a file in a shared directory, with the path as the key
+        
+        known_mdocs= [curr_mdoc for curr_target in self.data4json.keys() for curr_mdoc, general_and_tilt in iterTiltSeries(self.data4json[curr_target])]
+        for curr_mdoc in known_mdocs: self.watchMdoc(curr_mdoc, watcher, general_and_tilt=self.mdocData(curr_mdoc))
+        
+        if self.verbosity>=1: 
+            print(f"Watching {len(watcher.dirs())} directories for {len(known_mdocs)} tilt series ({watcher.method()}), press Ctrl+C to stop...")
+        
+        pending_paths= set()
+        retry_mdocs= set()  # Tilt series whose update failed
+        last_change= None
+        
+        try:
+            while True:
+                changed_paths= watcher.wait(self.options.debounce_secs)
+                
+                # Thumbnails made by the last update aren't changes (their events have arrived once it's quiet)
+                if not changed_paths: self.written_paths.clear()
+                changed_paths-= self.written_paths
+                
+                # A new tilt-series directory needs to be watched itself, since its MDOC may not be there yet
+                for changed_path in changed_paths:
+                    changed_path= os.path.normpath(changed_path)
+                    parent_dir= os.path.dirname(changed_path)
+                    if parent_dir in self.watch_dirs and self.watch_dirs[parent_dir] is None and os.path.isdir(changed_path):
+                        self.watch_dirs.setdefault(changed_path, None)
+                        watcher.add(changed_path)
+                # End path loop
+                
+                if changed_paths:
+                    pending_paths.update(changed_paths)
+                    last_change= time.time()
+                    continue
+                
+                # Wait for a quiet period
+                if not pending_paths or time.time() - last_change < self.options.debounce_secs: continue
+                
+                update_list= sorted( set( self.affectedMdocs(pending_paths, known_mdocs) ) | retry_mdocs )
+                pending_paths= set()
+                retry_mdocs= set()
+                
+                for curr_mdoc in update_list:
+                    if not os.path.exists(curr_mdoc): continue
+                    
+                    # Files may have appeared since the directories were last listed
+                    self.fs_snapshot.invalidate()
+                    self.list_ctfplots= None
+                    
+                    try:
+                        self.updateMdoc(curr_mdoc, keep_edits=True)
+                    except Exception as e:
+                        print(f"WARNING! Couldn't update '{curr_mdoc}' ({type(e).__name__}: {e}), will try again after the next change")
+                        retry_mdocs.add(curr_mdoc)
+                        continue
+                    
+                    self.watchMdoc(curr_mdoc, watcher, general_and_tilt=self.mdocData(curr_mdoc))
+                    if curr_mdoc not in known_mdocs: known_mdocs.append(curr_mdoc)
+                # End MDOC loop
+            # End watch loop
+        except KeyboardInterrupt:
+            if self.verbosity>=1: print("\nStopped watching")
+        finally:
+            watcher.close()
+    
+    def mdocData(self, curr_mdoc):
+        """
+        Returns:
+            tilt-series data from self.data4json, or None if absent
+        """
+        
+        for curr_target in self.data4json.keys():
+            if isinstance(self.data4json[curr_target].get(curr_mdoc), list): return self.data4json[curr_target][curr_mdoc]
+        
+        return None
+    
+    def watchMdoc(self, curr_mdoc, watcher, general_and_tilt=None):
+        """
+        Adds the directories of a tilt series to the watcher, and remembers which changes affect it
+        
+        Parameters:
+            curr_mdoc : MDOC file
+            watcher : DirectoryWatcher object
+            general_and_tilt (optional) : tilt-series data, from which the micrograph paths are generated
+        """
+        
+        ts_dir= os.path.normpath( os.path.dirname(curr_mdoc) )
+        dir_list= [ts_dir]
+        
+        # A new tilt-series directory is only noticed from its parent
+        if self.mdoc_files:
+            parent_dir= os.path.dirname(ts_dir)
+            self.watch_dirs[parent_dir]= None
+            watcher.add(parent_dir)
+        
+        path_templates= self.pathTemplates()
+        
+        for path_key in PATH_KEYS:
+            if path_templates[path_key]['in_mdoc_dir']: dir_list.append( os.path.normpath( os.path.join(ts_dir, path_templates[path_key]['dir']) ) )
+        
+        for dir_name in dir_list:
+            if not self.watch_dirs.get(dir_name): self.watch_dirs[dir_name]= set()
+            self.watch_dirs[dir_name].add(curr_mdoc)
+            watcher.add(dir_name)
+        
+        if general_and_tilt is None: return
+        
+        # Micrographs in directories shared by all tilt series
+        mdoc_base= mdocStem(curr_mdoc)
+        for sorted_idx, tilt_key in enumerate( sortTiltKeys(general_and_tilt[1]) ):
+            movie_base= ntpath.basename( general_and_tilt[1][tilt_key].get('SubFramePath', '') )
+            
+            for path_key in PATH_KEYS:
+                if path_templates[path_key]['in_mdoc_dir']: continue
+                mic_path= os.path.normpath( micPath(path_templates[path_key], curr_mdoc, mdoc_base, movie_base, sorted_idx) )
+                self.watch_paths[mic_path]= curr_mdoc
+                watcher.add( os.path.dirname(mic_path) )
+        # End micrograph loop
+    
+    def affectedMdocs(self, changed_paths, known_mdocs):
+        """
+        Parameters:
+            changed_paths (set) : files added, modified, or removed
+            known_mdocs (list) : MDOC files already in the store
+        
+        Returns:
+            list of MDOC files to update, including new ones
+        """
+        
+        update_set= set()
+        do_rescan= False
+        
+        for changed_path in changed_paths:
+            changed_path= os.path.normpath(changed_path)
+            dir_name= os.path.dirname(changed_path)
+            
+            if changed_path in self.watch_paths:
+                update_set.add(self.watch_paths[changed_path])
+            elif self.watch_dirs.get(dir_name):
+                update_set.update(self.watch_dirs[dir_name])
+            elif dir_name in self.watch_dirs:
+                do_rescan= True
+        # End path loop
+        
+        # Look for new tilt series
+        if do_rescan:
+            for curr_mdoc in expandInputFiles(self.mdoc_files):
+                if curr_mdoc not in known_mdocs: 
+                    if self.verbosity>=2: print(f"Found new MDOC file: {curr_mdoc}")
+                    update_set.add(curr_mdoc)
+        
+        return sorted(update_set)
+    
+    def findMdocTarget(self, curr_mdoc):
+        """
+        Finds the target file listing an MDOC file
+        
+        Parameter:
+            curr_mdoc (str) : MDOC file
+        
+        Returns:
+            target file, or the virtual target file if none of '--target_files' lists the MDOC
+        """
+        
+        if not self.target_files: return VIRTUAL_TARGET_FILE
+        
+        # Target files list the tilt-series stack (see parseTargetFile)
+        mdoc_stem= os.path.basename(curr_mdoc).split('.')[0]
+        for target_file in expandInputFiles(self.target_files):
+            for line in grep('tsfile', target_file):
+                if re.sub( '.mrc', '', line.split('=')[1].strip() ) == mdoc_stem: return target_file
+        
+        if self.verbosity>=1: print(f"WARNING! '{curr_mdoc}' not found in any target file, adding it to '{VIRTUAL_TARGET_FILE}'")
+        
+        return VIRTUAL_TARGET_FILE
+    
+    def makeThumbnails(self, binning=16):
+        """
+        Creates missing micrograph thumbnails from motion-corrected micrographs, using a pool of --jobs workers
+        
+        Parameter:
+            binning (int) : downsampling factor
+        
+        Modifies:
+            self.missing_thumbs : emptied
+        """
+        
+        # Thumbnails queued by workers from now on will be made next time
+        with self.state_lock: thumb_list, self.missing_thumbs= self.missing_thumbs, []
+        
+        # Only imported now, since it's not needed if the thumbnails exist (without it, they stay 'null', so that '--watch' keeps running)
+        try:
+            import mrcfile
+        except ImportError:
+            if not self.did_warn_mrcfile: print("WARNING! mrcfile isn't installed, so missing micrograph thumbnails can't be created")
+            self.did_warn_mrcfile= True
+            return
+        
+        if self.verbosity>=2: print(f"Creating {len(thumb_list)} missing micrograph thumbnails...")
+        
+        def makeOneThumbnail(thumb_info):
+            mic_path, thumb_path= thumb_info[1:]
+            try:
+                makeThumbnail(mic_path, thumb_path, binning=binning)
+                return True
+            except Exception as e:
+                print(f"  Could not create thumbnail image from '{mic_path}' ({type(e).__name__}: {e}). Make sure motion-corrected MRCs exist!")
+                return False
+        
+        disableTF= self.verbosity<3 or self.verbosity>6 or self.debug
+        list_results= parallelMap(makeOneThumbnail, thumb_list, jobs=self.options.jobs)
+        
+        for thumb_info, did_save in zip( progressBar(thumb_list, unit=' thumb', disable=disableTF), list_results ):
+            if did_save:
+                mic_dict, thumb_path= thumb_info[0], thumb_info[2]
+                mic_dict['MicThumbnail'] = thumb_path
+                self.fs_snapshot.add(thumb_path)
+                self.written_paths.update( [os.path.normpath(thumb_path), os.path.normpath( os.path.dirname(thumb_path) )] )  # The directory may be new too
+                if self.verbosity >= 7: print('  Saved thumbnail from motion-corrected micrograph under ' + thumb_path)
+
+    '''
+    START OF CUMULATIVE DATA FUNCTION STUFF :)
+    '''
+    def add_cumulative_data(self):
+        '''
+        BUILD CUMULATIVE STUFF HERE!
+            - Get MDOC file locations from mdoc_lut dictionary
+            - Calculate cumulative exposure & dose for original mdoc file
+            - Then transfer values to respective tilts via subframe stem
+        '''
+        
+        for targets_file in self.data4json.keys():
+            for mdoc, general_and_tilt in iterTiltSeries(self.data4json[targets_file]):
+                mdoc_path= self.mdoc_lut.get(os.path.basename(mdoc), mdoc)
+                self.applyCumulativeData( general_and_tilt[1], self.cumulativeData(mdoc_path) )
+    
+    def cumulativeData(self, curr_mdoc):
+        """
+        Calculates cumulative exposure & dose for a tilt series
+        
+        Parameter:
+            curr_mdoc (str) : MDOC file (the original MDOC is assumed to be in the same directory)
+        
+        Returns:
+            dictionary of cumulative exposure & dose (see get_cumulative_data), or None if no original MDOC
+        """
+        
+        # Stem is everything up to first dot
+        orig_base= os.path.basename(curr_mdoc).split('.')[0] + self.options.orig_mdoc_suffix
+        orig_path= os.path.join(os.path.dirname(curr_mdoc), orig_base)
+        
+        if os.path.exists(orig_path):
+            # Read tilt information for original mdoc
+            header_lines, zvalue_list = scanMdoc(orig_path)
+            
+            # Calculate exposure and dose based on tilt information available in the original mdoc
+            return self.get_cumulative_data(zvalue_list)
+        else:
+            if not self.warn_dict['OrigMdoc']:
+                if self.verbosity >= 1: print(f"WARNING! Original MDOC not found for '{os.path.basename(curr_mdoc)}', setting dose/exposure to -1")
+                self.warn_dict['OrigMdoc'] = True
+            
+            return None
+    
+    def applyCumulativeData(self, tilt_data, stem_exposure_dose):
+        """
+        Copies cumulative exposure & dose to each micrograph, matched by subframe stem
+        
+        Parameters:
+            tilt_data (dict, modified) : data for each micrograph
+            stem_exposure_dose (dict) : output of get_cumulative_data (-1 if None)
+        """
+        
+        if stem_exposure_dose is None: stem_exposure_dose= {}
+        
+        for mic_data in tilt_data.values():
+            cum_exposure, cum_dose = stem_exposure_dose.get( subframeStem(mic_data['SubFramePath']), (-1, -1) )
+            
+            # Save cumulative exposure/dose into data4json
+            mic_data['CumExposure'] = cum_exposure
+            mic_data['CumDose'] = cum_dose
+                            
+    def get_cumulative_data(self, tilt_data):
+        '''
+        Args:
+            tilt_data: List of MdocZValue records from parsing an .mdoc file, in acquisition order.
+
+        Returns:
+            stem_exposure_dose: Dictionary, where each key is the stem of an .eer file (see subframeStem) and the item is a list of two numbers: 
+                1) accumulated exposure time (read from the .mdoc z_blocks) and 
+                2) accumulated dose. 
+              
+            If the dose per image could not be calculated (because of a missing motioncor-frame.txt file for example), it will be set to -1.
+        '''
+        
+        # Try to get dose per image
+        dose_per_image = self.get_dose_per_image()
+        
+        # Running sums over the tilts (missing exposure times count as 0)
+        cum_exposures = itertools.accumulate( tilt_information.exposure_time or 0 for tilt_information in tilt_data )
+        if dose_per_image == -1:
+            cum_doses = itertools.repeat(-1)
+        else:
+            cum_doses = itertools.accumulate( itertools.repeat( dose_per_image, len(tilt_data) ) )
+        
+        frame_stems = [subframeStem(tilt_information.subframe_path) for tilt_information in tilt_data]
+        
+        return { frame_stem: [cum_exposure, cum_dose] for frame_stem, cum_exposure, cum_dose in zip(frame_stems, cum_exposures, cum_doses) }
+
+    def get_dose_per_image(self):
+        '''
+        Returns:
+            Dose per image calculated from found motioncor-frame.txt file.
+
+            Tries to get the name of the motioncor-frame file from the SNARTomo settings file
+            (should be saved in <SNARTomoDir>/Logs/settings.txt). The motioncor-frame file is assumed to be saved in the
+            same directory from which SNARTomo was originally executed.
+
+            Will return -1 if it couldn't read a frames file.
+            
+            The files are read only once per session.
+        '''
+        
+        if self.dose_per_image is not None: return self.dose_per_image
+        
+        dose_per_image= -1  # default
+        
+        if self.options.dose:
+            dose_per_image = self.options.dose
+        
+        else:
+            frames_file= None
+            
+            # Find name of motioncor frames file
+            if os.path.exists(self.options.frame_file):
+                frames_file= self.options.frame_file  # "motioncor-frame.txt"
+            else:
+                # Read settings.txt file (saved under SNARTomo/settings.txt
+                settings_file= re.sub('\$IN_DIR', self.options.in_dir, self.options.settings)  #### os.path.join(self.indir, 'settings.txt')
+                
+                if os.path.exists(settings_file):
+                    with open(settings_file) as settings_fin:
+                        for line in settings_fin:
+                            if "--frame_file" in line:
+                                frames_file = line.strip().split(' ')[1].replace('\t', '')
+            # END frames-file IF-THEN
+            
+            if frames_file and os.path.exists(frames_file):
+                # read frame file and calculate dose per image
+                with open(frames_file) as frame_fin:
+                    frames, grouping, dose_per_frame = frame_fin.readline().split()
+                    dose_per_image = float(frames) * float(dose_per_frame)
+            elif self.verbosity >= 1:
+                print(f"WARNING! Dose per image unknown (no '--dose', and frames file '{frames_file or self.options.frame_file}' not found), setting cumulative dose to -1")
+        
+        self.dose_per_image= dose_per_image
+        
+        return dose_per_image
+
+    '''
+    END OF CUMULATIVE DATA FUNCTION STUFF :(
+    '''
+
+    def parseTargetFile(self, target_file, ts_dir=None, tgt_idx=None, msg='Parsing target file'):
+        """
+        Within a target file, finds MDOC files
+        
+        Parameters:
+            target_file : target file
+            ts_dir (optional) : directory in which to look for MDOC
+            tgt_idx : (optional) counter for target files for display
+            msg : (optional) message to display
+            
+        Returns:
+            list of MDOCs
+        """
+        
+        if self.verbosity>=2: 
+            msg= f"  {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}: {msg} {target_file}"
+            if tgt_idx:
+                msg+= f"({tgt_idx}/{len(self.temp_targets)})"
+            print(msg + '...')
+
+        # Grep target file for 'tsfile'
+        result= grep('tsfile', target_file)
+        curr_list_mdocs=[]
+        list_candidates=[]
+
+        for line in result:
+            mdoc_stem= re.sub( '.mrc', '', line.split('=')[1].strip() )
+            mdoc_base= mdoc_stem + '.mrc.mdoc'
 
             # If MDOC directory specified, then use it
             if ts_dir:
@@ -625,17 +1314,22 @@ class MdocTreeView(QtWidgets.QMainWindow):
                     os.path.dirname(target_file),
                     mdoc_base
                     )
-
-            if os.path.exists(mdoc_path):
+            
+            list_candidates.append(mdoc_path)
+        # End line loop
+        
+        # Check that the MDOCs exist (concurrently, since each is in its own directory)
+        for mdoc_path, does_exist in zip( list_candidates, parallelMap(os.path.exists, list_candidates, jobs=IO_WORKERS) ):
+            if does_exist:
                 curr_list_mdocs.append(mdoc_path)
                 if self.verbosity>=7: print(f"  Found MDOC file: {mdoc_path}")
             else:
                 print(f"  WARNING! Couldn't find MDOC file: {mdoc_path}")
-        # End line loop
+        # End MDOC loop
         
         return curr_list_mdocs
     
-    def parseMdoc(self, curr_mdoc, curr_target):
+    def parseMdoc(self, curr_mdoc):
         """
         Extracts information from for each tilt series:
             MDOC file
@@ -643,81 +1337,57 @@ class MdocTreeView(QtWidgets.QMainWindow):
             image paths
             CTF and dose-fitting plots
         
+        Doesn't modify self.data4json, so that it can be run in parallel (see storeMdoc).
+        
         Parameters:
             curr_mdoc : MDOC file
-            curr_target : target file (real or virtual)
+        
+        Returns:
+            list of dictionaries (general & tilt-specific information)
         """
         
-        # TFS MDOCs may end in simply '.mdoc' rahter than '.mrc.mdoc'
-        if os.path.basename(curr_mdoc).endswith('.mrc.mdoc'):
-            mdoc_base= re.sub( '.mrc.mdoc$', '', os.path.basename(curr_mdoc) )
-        elif os.path.basename(curr_mdoc).endswith('.mdoc'):
-            mdoc_base= re.sub( '.mdoc$', '', os.path.basename(curr_mdoc) )
-        else:
+        mdoc_base= mdocStem(curr_mdoc)
+        if mdoc_base is None:
             print(f"\nERROR!! Unknown extension for MDOC: {curr_mdoc}", file=sys.stderr)
             print("  Exiting...\n")
             exit()
-        general_and_tilt = read_mdoc(curr_mdoc)
+        
+        # If none of the inputs have changed since the previous build, reuse the stored entry
+        reused_entry= self.reuseMdoc(curr_mdoc)
+        if reused_entry: return reused_entry
+        input_signature= self.mdocSignature(curr_mdoc)
+        
+        general_and_tilt = TiltSeries( read_mdoc(curr_mdoc) )
         
         # Read CTF information from summary file
         curr_ctf_summary= os.path.join(os.path.dirname(curr_mdoc), self.options.ctf_summary)
         general_and_tilt[1] = self.readCtf(general_and_tilt[1], curr_ctf_summary)
-        if os.path.exists(curr_ctf_summary) : general_and_tilt[0]['CtfSummary'] = curr_ctf_summary
+        if self.fs_snapshot.exists(curr_ctf_summary) : general_and_tilt[0]['CtfSummary'] = curr_ctf_summary
+        
+        # List the tilt-series directory once
+        ts_scan= self.scanTsDir( os.path.dirname(curr_mdoc) )
         
         # Get central-slice JPEG(s)
-        slice_jpg= getLatest(
-            mdoc_base + '*' + self.options.slice_jpg, 
-            os.path.join(os.path.dirname(curr_mdoc))
-            )
+        slice_jpg= ts_scan.latest('slices', prefix=mdoc_base)
         
-        if os.path.exists(curr_ctf_summary) : 
+        if self.fs_snapshot.exists(curr_ctf_summary) : 
             general_and_tilt[0]['CentralSlice'] = slice_jpg
         else:
             if self.do_show_imgs and self.verbosity>=1 and not self.warn_dict['slices']: 
                 print(f"  WARNING! Central slice '{slice_jpg}' not found, skipping...")
                 self.warn_dict['slices']= True
         
-        # Extract tilt angles
-        angles_list= [float(general_and_tilt[1][k]['TiltAngle']) for k in general_and_tilt[1].keys()]
+        path_templates= self.pathTemplates()
         
-        # Sort by angle (Adapted from https://stackoverflow.com/a/7851166)
-        sorted_idx_list = [i for i, x in sorted(enumerate(angles_list), key=lambda x: x[1])]
-
-        sorted_angles_list=[]
-        for angle_idx, curr_angle in enumerate(angles_list):
-            sorted_angles_list.append(list( general_and_tilt[1].keys() )[ sorted_idx_list[angle_idx] ])  # .keys() is not a list and thus cannot be directly subscripted
+        # Loop through micrographs, sorted by angle (TODO: Move to function)
+        for sorted_idx, tilt_key in enumerate( general_and_tilt.sortedKeys() ):
+            tilt_idx= general_and_tilt[1][tilt_key]['ZValue']
 
-        # Loop through micrographs (TODO: Move to function)
-        for sorted_idx, tilt_key in enumerate(sorted_angles_list):
-            tilt_idx= sorted_idx_list[sorted_idx]
-
-            # Generate paths
+            # Generate paths (from the same templates used to compress them in the JSON file)
             movie_base= ntpath.basename(general_and_tilt[1][tilt_key]['SubFramePath'])
-            movie_path= os.path.join(self.options.movie_dir, movie_base)
-            mic_path= os.path.join(
-                re.sub('\$IN_DIR', self.options.in_dir, self.options.mic_dir), 
-                os.path.splitext(movie_base)[0] + self.options.mic_pattern
-                )
-            tiff_path= os.path.join(
-                re.sub('\$IN_DIR', self.options.in_dir, self.options.tif_dir), 
-                os.path.splitext(movie_base)[0] + '.tif'
-                )
-            curr_micthumb_dir= os.path.join(
-                os.path.dirname(curr_mdoc),
-                self.options.micthumb_dir
-                )
-            thumbnail_idx='.' + str(sorted_idx).zfill(3) + '.'  # pad to 3 digits
-            mic_thumb_path= os.path.join(
-                curr_micthumb_dir,
-                mdoc_base + self.micthumb_suffix + thumbnail_idx + self.thumb_format
-                )
-
-            ctf_thumb_base= mdoc_base + self.ctfthumb_suffix + thumbnail_idx + self.thumb_format
-            ctf_thumb_path=os.path.join(curr_micthumb_dir, ctf_thumb_base)
-            denoise_path= os.path.join(
-                re.sub('\$IN_DIR', self.options.in_dir, self.options.denoise_dir), 
-                os.path.splitext(movie_base)[0] + self.options.mic_pattern
-                )
+            movie_path, mic_path, tiff_path, mic_thumb_path, ctf_thumb_path, denoise_path= [
+                micPath(path_templates[path_key], curr_mdoc, mdoc_base, movie_base, sorted_idx) for path_key in PATH_KEYS
+                ]
             
             # Add to dictionary
             general_and_tilt[1][tilt_key] = self.setPathAndWarn(movie_path, general_and_tilt[1][tilt_key], 'MoviePath', 'Micrograph movie')
@@ -725,16 +1395,10 @@ class MdocTreeView(QtWidgets.QMainWindow):
             general_and_tilt[1][tilt_key] = self.setPathAndWarn(tiff_path, general_and_tilt[1][tilt_key], 'TiffFile', 'Compressed TIFF')
             general_and_tilt[1][tilt_key] = self.setPathAndWarn(mic_thumb_path, general_and_tilt[1][tilt_key], 'MicThumbnail', 'Micrograph thumbnail')
 
-            if self.warn_dict['MicThumbnail'] == True:
-                try:
-                    micrograph_data = open_mrc(mic_path)
-                    bin16_micrograph_data = bin_nparray(micrograph_data, 16)
-                    save_as_image(bin16_micrograph_data, mic_thumb_path)
-                    general_and_tilt[1][tilt_key]['MicThumbnail'] = mic_thumb_path
-                    if self.verbosity >= 6:
-                        print('  Saved thumbnail from motion-corrected micrograph under ' + mic_thumb_path)
-                except:
-                    print('  Could not create thumbnail image. Make sure motion-corrected MRCs exist!')
+            # Missing thumbnails will be created all at once afterward (see makeThumbnails), even with '--no_imgs', since the GUI may show them later
+            if general_and_tilt[1][tilt_key]['MicThumbnail'] == 'null':
+                if general_and_tilt[1][tilt_key]['McorrMic'] != 'null':
+                    with self.state_lock: self.missing_thumbs.append( [general_and_tilt[1][tilt_key], mic_path, mic_thumb_path] )
 
             general_and_tilt[1][tilt_key] = self.setPathAndWarn(ctf_thumb_path, general_and_tilt[1][tilt_key], 'CtfThumbnail', 'Power-spectrum image')
             general_and_tilt[1][tilt_key] = self.setPathAndWarn(denoise_path, general_and_tilt[1][tilt_key], 'DenoiseMic', 'Denoised micrograph')
@@ -745,22 +1409,211 @@ class MdocTreeView(QtWidgets.QMainWindow):
             if self.verbosity==8: print(f"  {sorted_idx}: ZValue {tilt_idx}, {mic_thumb_path}, {ctf_thumb_path}, {ntpath.basename(general_and_tilt[1][tilt_key]['SubFramePath'])}")
         # End micrograph loop
         
-        ctfbyts_plot= getLatest( self.options.ctfbyts_1ts, os.path.dirname(curr_mdoc) )
-        dosefit_plot= getLatest( self.options.dosefit_plot, os.path.dirname(curr_mdoc) )
+        ctfbyts_plot= ts_scan.latest('ctfbyts')
+        dosefit_plot= ts_scan.latest('dosefit')
             
         if ctfbyts_plot: general_and_tilt[0]['CtfBytsPlot'] = ctfbyts_plot
         if dosefit_plot: general_and_tilt[0]['DosefitPlot'] = dosefit_plot
         
-        if os.path.basename(curr_mdoc) in self.mdoc_lut:
-            if curr_mdoc in self.data4json[curr_target].keys():
-                print(f"WARNING! '{curr_mdoc}' already present in '{self.json}'")
-                print(f"  Use '--new' flag to force overwrite")
-        else:
-            # Remember full path of MDOC file
-            self.mdoc_lut[os.path.basename(curr_mdoc)] = curr_mdoc
-            
-            # Append data to running list to be written to JSON
-            self.data4json[curr_target][curr_mdoc] = general_and_tilt
+        # Remember the inputs (signatures were taken before parsing, so that later changes will be noticed)
+        for plot_key in ['CentralSlice', 'CtfBytsPlot', 'DosefitPlot']:
+            if plot_key in general_and_tilt[0] and isinstance(general_and_tilt[0][plot_key], str):
+                input_signature[ general_and_tilt[0][plot_key] ]= fileSignature( general_and_tilt[0][plot_key] )
+        with self.state_lock: self.new_manifest[curr_mdoc]= input_signature
+        
+        return general_and_tilt
+        
+    def pathTemplates(self):
+        """
+        Templates from which the paths of each micrograph are generated
+        They're saved once in the JSON file, so that paths matching them needn't be saved for each micrograph.
+        
+        Returns:
+            dictionary with a template for each of PATH_KEYS (see micPath)
+        """
+        
+        def escape(text):
+            return text.replace('{', '{{').replace('}', '}}')
+        
+        mic_dir= re.sub('\$IN_DIR', self.options.in_dir, self.options.mic_dir)
+        tif_dir= re.sub('\$IN_DIR', self.options.in_dir, self.options.tif_dir)
+        denoise_dir= re.sub('\$IN_DIR', self.options.in_dir, self.options.denoise_dir)
+        
+        return {
+            'MoviePath'   : {'dir': self.options.movie_dir,    'in_mdoc_dir': False, 'name': '{movie}'},
+            'McorrMic'    : {'dir': mic_dir,                   'in_mdoc_dir': False, 'name': '{stem}' + escape(self.options.mic_pattern)},
+            'TiffFile'    : {'dir': tif_dir,                   'in_mdoc_dir': False, 'name': '{stem}.tif'},
+            'MicThumbnail': {'dir': self.options.micthumb_dir, 'in_mdoc_dir': True,  'name': '{mdoc_base}' + escape(self.micthumb_suffix) + '.{idx}.' + escape(self.thumb_format)},
+            'CtfThumbnail': {'dir': self.options.micthumb_dir, 'in_mdoc_dir': True,  'name': '{mdoc_base}' + escape(self.ctfthumb_suffix) + '.{idx}.' + escape(self.thumb_format)},
+            'DenoiseMic'  : {'dir': denoise_dir,               'in_mdoc_dir': False, 'name': '{stem}' + escape(self.options.mic_pattern)},
+            }
+    
+    def scanTsDir(self, mdoc_dir):
+        """
+        Lists a tilt-series directory once, and classifies the files that heatwave knows about
+        
+        Parameter:
+            mdoc_dir (str) : tilt-series directory
+        
+        Returns:
+            ArtifactScan object
+        """
+        
+        pattern_dict= {
+            'slices'   : ['*' + self.options.slice_jpg], 
+            'ctfbyts'  : [self.options.ctfbyts_1ts], 
+            'dosefit'  : [self.options.dosefit_plot], 
+            'recons'   : self.options.recon_pattern.split(), 
+            'stacks'   : ["*" + self.micthumb_suffix + ".mrc", "*" + self.micthumb_suffix + ".st"], 
+            'ctfstacks': ["*" + self.ctfthumb_suffix + ".mrcs"], 
+            'fids'     : ["*.fid"], 
+            }
+        
+        return ArtifactScan(mdoc_dir, pattern_dict)
+    
+    def mdocSignature(self, curr_mdoc):
+        """
+        Gets signatures of the inputs for a tilt series:
+            MDOC file
+            original MDOC file
+            CTF summary
+            tilt-series directory (its timestamp changes when plots, slices, etc. are added or removed)
+            thumbnail directory
+        
+        The micrograph files themselves are checked against the stored entry instead (see reuseMdoc).
+        
+        Parameter:
+            curr_mdoc : MDOC file
+        
+        Returns:
+            dictionary of signatures, with the filename as the key
+        """
+        
+        mdoc_dir= os.path.dirname(curr_mdoc)
+        orig_mdoc= os.path.join(mdoc_dir, os.path.basename(curr_mdoc).split('.')[0] + self.options.orig_mdoc_suffix)
+        
+        input_list= [
+            curr_mdoc, 
+            orig_mdoc, 
+            os.path.join(mdoc_dir, self.options.ctf_summary), 
+            mdoc_dir, 
+            os.path.join(mdoc_dir, self.options.micthumb_dir)
+            ]
+        
+        return {curr_input: fileSignature(curr_input) for curr_input in input_list}
+    
+    def reuseMdoc(self, curr_mdoc):
+        """
+        Checks whether the inputs of a tilt series are the same as in the manifest from the previous build
+        
+        Parameter:
+            curr_mdoc : MDOC file
+        
+        Returns:
+            tilt-series data from the previous build (as if freshly parsed), or None if it needs to be parsed
+        """
+        
+        if curr_mdoc not in self.reuse_data or curr_mdoc not in self.manifest: return None
+        
+        # Any new, removed, or modified input means re-parsing
+        old_signature= self.manifest[curr_mdoc]
+        for curr_input in old_signature.keys():
+            if fileSignature(curr_input) != old_signature[curr_input]: return None
+        
+        general_and_tilt= self.reuse_data[curr_mdoc]
+        
+        # Micrographs are mostly in directories shared by all tilt series, whose signatures change whenever any tilt series is processed,
+        # so each generated path (see pathTemplates) is checked instead, from the directory listings
+        mdoc_base= mdocStem(curr_mdoc)
+        path_templates= self.pathTemplates()
+        reused_thumbs= []
+        
+        for sorted_idx, tilt_key in enumerate( general_and_tilt.sortedKeys() ):
+            mic_data= general_and_tilt[1][tilt_key]
+            movie_base= ntpath.basename( mic_data.get('SubFramePath', '') )
+            mic_paths= { path_key: micPath(path_templates[path_key], curr_mdoc, mdoc_base, movie_base, sorted_idx) for path_key in PATH_KEYS }
+            
+            for path_key in PATH_KEYS:
+                if self.fs_snapshot.exists(mic_paths[path_key]) != ( mic_data.get(path_key, 'null') != 'null' ): return None
+            
+            # Thumbnails which couldn't be made before
+            if mic_data['MicThumbnail'] == 'null' and mic_data['McorrMic'] != 'null':
+                reused_thumbs.append( [mic_data, mic_paths['McorrMic'], mic_paths['MicThumbnail']] )
+        # End micrograph loop
+        
+        with self.state_lock: self.missing_thumbs.extend(reused_thumbs)
+        
+        # A new build starts without selections or notes
+        for curr_key in ['MdocSelected', 'TextNote']:
+            if curr_key in general_and_tilt[0]: del general_and_tilt[0][curr_key]
+        for tilt_key in general_and_tilt[1].keys():
+            general_and_tilt[1][tilt_key]['MicSelected'] = True
+        
+        # Recomputed once the thumbnails have been made (see updateRollups)
+        if ROLLUP_KEY in general_and_tilt[0]: del general_and_tilt[0][ROLLUP_KEY]
+        
+        with self.state_lock:
+            self.new_manifest[curr_mdoc]= old_signature
+            self.num_reused+= 1
+        if self.verbosity>=7: print(f"  Inputs unchanged, reusing data for '{curr_mdoc}'")
+        
+        return general_and_tilt
+    
+    def updateManifest(self, curr_mdoc):
+        """
+        Replaces the input signatures of one tilt series in the manifest (see updateMdoc)
+        
+        Parameter:
+            curr_mdoc : MDOC file
+        """
+        
+        if curr_mdoc not in self.new_manifest: return
+        
+        # Other tilt series may be updated at the same time
+        with lockFile(self.manifest_file):
+            manifest= readManifest(self.manifest_file)
+            manifest[curr_mdoc]= self.new_manifest[curr_mdoc]
+            save_json(manifest, filename=self.manifest_file)
+    
+    def saveManifest(self):
+        """
+        Writes signatures of the inputs for each tilt series, so that the next build can skip unchanged tilt series
+        """
+        
+        new_manifest= {}
+        
+        for curr_target in self.data4json.keys():
+            for curr_mdoc in self.data4json[curr_target].keys():
+                if curr_mdoc in self.new_manifest:
+                    new_manifest[curr_mdoc]= self.new_manifest[curr_mdoc]
+                elif curr_mdoc in self.manifest:
+                    new_manifest[curr_mdoc]= self.manifest[curr_mdoc]
+        
+        save_json(new_manifest, filename=self.manifest_file)
+        
+        if self.verbosity>=2 and self.num_reused>0: 
+            print(f"Reused data for {self.num_reused} unchanged tilt series")
+        
+    def storeMdoc(self, curr_mdoc, curr_target, general_and_tilt):
+        """
+        Adds data for a tilt series to self.data4json, unless already present
+        
+        Parameters:
+            curr_mdoc : MDOC file
+            curr_target : target file (real or virtual)
+            general_and_tilt : output of parseMdoc
+        """
+        
+        if os.path.basename(curr_mdoc) in self.mdoc_lut:
+            if curr_mdoc in self.data4json[curr_target].keys():
+                print(f"WARNING! '{curr_mdoc}' already present in '{self.json}'")
+                print(f"  Use '--new' flag to force overwrite")
+        else:
+            # Remember full path of MDOC file
+            self.mdoc_lut[os.path.basename(curr_mdoc)] = curr_mdoc
+            
+            # Append data to running list to be written to JSON
+            self.data4json[curr_target][curr_mdoc] = general_and_tilt
         # End found-mdoc IF-THEN
         
     def readCtf(self, json_data, summary_file):
@@ -775,15 +1628,32 @@ class MdocTreeView(QtWidgets.QMainWindow):
             updated metadata which will be eventually written to JSON file
         """
         
+        # Read the summary only once for the whole tilt series
+        ctf_index= indexCtfSummary(summary_file)
+        
         for json_key in json_data.keys():
             search_string= os.path.splitext(ntpath.basename( json_data[json_key]['SubFramePath']) )[0]
             
-            # The CTF summary is appended to, so pick only the last match
-            search_result= grep(search_string, summary_file)[-1].split()
+            # The CTF summary is appended to, so the index keeps only the last match
+            if search_string in ctf_index:
+                search_result= ctf_index[search_string]
+            else:
+                # Summary line doesn't start with the micrograph name, so search the old-fashioned way
+                try:
+                    search_result= grep(search_string, summary_file)[-1].split()
+                
+                # The tilt series may still be in progress, in which case the summary (or the line) isn't written yet
+                except (OSError, IndexError):
+                    if self.verbosity>=7: print(f"  No CTF data for micrograph '{search_string}' in '{summary_file}'")
+                    json_data[json_key]['CtfFind4'] = '0.0'
+                    json_data[json_key]['MaxRes'] = '999.9'
+                    continue
+            
+            # A line which is still being written may be incomplete
             try:
                 avg_df= -1*(float(search_result[2]) + float(search_result[3]))/2
                 res_fit= float(search_result[7])
-            except ValueError as ve:
+            except (ValueError, IndexError) as ve:
                 print(f"\n{type(ve).__name__}: readCtf: `{ve}`")
                 print(f"  CTF summary file: '{summary_file}'")
                 print(f"  Result for micrograph '{search_string}'")
@@ -814,7 +1684,7 @@ class MdocTreeView(QtWidgets.QMainWindow):
             Updated dictionary
         """
         
-        if os.path.exists(curr_path):
+        if self.fs_snapshot.exists(curr_path):
             curr_dict[curr_key] = curr_path
             if self.verbosity>=8: print(f"  HOORAY! {curr_type} '{curr_path}' found :)")
         else:
@@ -830,18 +1700,16 @@ class MdocTreeView(QtWidgets.QMainWindow):
         If there are targets without associated MDOCs, then remove them
         """
         
-        data_copy= copy.deepcopy(self.data4json)  # Can't modify dict while iterating through it
-        
-        # Loop through targets
-        for curr_target in data_copy:
+        # Loop through targets (as a list, since can't modify dict while iterating through it)
+        for curr_target in list( self.data4json.keys() ):
             keep_target= False
             
             # Loop through MDOC candidates
-            for curr_mdoc in data_copy[curr_target]:
-                if isinstance(data_copy[curr_target][curr_mdoc], list):
+            for curr_mdoc in self.data4json[curr_target]:
+                if isinstance(self.data4json[curr_target][curr_mdoc], list):
                     keep_target= True
                 else:
-                    if curr_mdoc != 'CtfBytsPlot':
+                    if curr_mdoc not in ['CtfBytsPlot', ROLLUP_KEY]:
                         print(f"ERROR!! Unknown entry type '{curr_mdoc}' in target '{curr_target}'! Exiting...", file=sys.stderr)
                         exit(16)
         
@@ -856,13 +1724,81 @@ class MdocTreeView(QtWidgets.QMainWindow):
                 self.temp_targets.remove(curr_target)
                 if curr_target in self.new_targets : self.new_targets.remove(curr_target)
         
-        # Save to JSON
-        save_json(self.data4json, filename=self.json, verbosity=self.verbosity)
-        if self.verbosity >= 10:
+        # Save to JSON (with the rollups of new and rebuilt tilt series)
+        self.updateRollups()
+        self.writeStore()
+        self.saveManifest()
+        
+        # Finished, no need to resume
+        if os.path.exists(self.checkpoint_file): os.remove(self.checkpoint_file)
+        if self.verbosity >= 10 and not self.sqlite_store:
             print(f"\n{os.path.basename(self.json)}:")
             system_call_23('cat', self.json)
             print()
         
+    def findCtfbytsPlots(self, target_base, debug=False):
+        """
+        Find CTFFIND scatter plots
+        
+        Parameters:
+            target_base (str) : basename of target file
+            debug (bool) : flag to print debug information
+        
+        Returns:
+            plot filename
+        """
+        
+        fn=None  # initialize
+
+        # The plots are in one directory, so only glob once
+        if self.list_ctfplots is None: self.list_ctfplots= glob.glob(self.ctfbyts_tgts)
+        target_prefix= os.path.splitext(target_base)[0]
+        search_matches= [s for s in self.list_ctfplots if target_prefix in s]
+        
+        # If a unique match then use it
+        if len(search_matches) == 1:
+            fn= search_matches[0]
+        else:
+            # If there's a generic ctfbyts.png, use it
+            imgdir= os.path.dirname(self.ctfbyts_tgts)
+            generic_fn= os.path.join(imgdir, self.options.ctfbyts_1ts)
+            if self.fs_snapshot.exists(generic_fn): fn= generic_fn
+        
+        return fn
+
+class MdocTreeView(HeatwaveSession, QMainWindow):
+    """
+    Outline:
+        HeatwaveSession
+        buildStatMap
+        buildGUI
+            drawButtons
+            drawTargetData
+        fetchMicrographs (when a tilt series is expanded)
+            buildStatList
+                addMicWidget
+        releaseMicrographs (when a tilt series is collapsed)
+    """
+
+    def __init__(self, options, debug=False):
+        QMainWindow.__init__(self)
+        HeatwaveSession.__init__(self, options, debug=debug)
+        
+        # Set column widths & formats
+        self.stat_map= self.buildStatMap(debug=debug)
+        
+        # Initialize column list (in the order in which they will be displayed)
+        self.list_columns=['Micrograph', 'CtfFind4'] + self.stat_map.keys
+        self.building_rows= False  # Checkboxes set while creating or removing rows aren't edits
+        
+        # Images are decoded in the background, and shown once ready
+        thumb_cache= self.options.thumb_cache if self.options.thumb_cache else self.json + '.thumbs'
+        self.image_loader= ImageLoader(max_bytes=options.image_cache_mb*1024*1024, cache_dir=thumb_cache)
+        CustomStandardItem.image_loader= self.image_loader
+        
+        # Draw GUI
+        self.buildGUI()
+    
     def buildStatMap(self, debug=False):
         """
         Set up stat columns in the order in which they will be displayed.
@@ -888,6 +1824,9 @@ class MdocTreeView(QtWidgets.QMainWindow):
             self.tree_view
         """
         
+        # Files may have been added or removed since the last time the GUI was drawn
+        self.fs_snapshot.invalidate()
+        
         self.setWindowTitle('SNARTomo Heatwave')  # Set the window title
         win_height= 864
         if self.do_show_imgs:
@@ -917,11 +1856,16 @@ class MdocTreeView(QtWidgets.QMainWindow):
         selmod = self.tree_view.selectionModel()
         self.tree_view.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
 
-        self.item_model= QtGui.QStandardItemModel()
+        # Micrograph rows are only created when their tilt series is expanded
+        self.item_model= LazyTreeModel(self.fetchMicrographs)
         self.item_model.setHorizontalHeaderLabels(self.list_columns)
         self.item_model.itemChanged.connect(self.item_changed)
 
         self.tree_view.setModel(self.item_model)
+        self.tree_view.collapsed.connect(self.releaseMicrographs)
+        
+        # Micrograph checkboxes, which outlive the rows (movie basename as the key, for each MDOC)
+        self.mic_states= {}
         
         # Allow editing
         self.line_edit= LineEditDelegate(column=self.editable_column)
@@ -951,12 +1895,22 @@ class MdocTreeView(QtWidgets.QMainWindow):
             self.drawTargetData(curr_target)
 
         if self.options.expand: 
+            # Micrograph rows for all tilt series
+            for target_row in range( self.item_model.rowCount() ):
+                target_item= self.item_model.item(target_row)
+                for ts_row in range( target_item.rowCount() ):
+                    ts_index= target_item.child(ts_row).index()
+                    if self.item_model.canFetchMore(ts_index): self.item_model.fetchMore(ts_index)
+            
             self.tree_view.expandAll()
         else: 
             self.tree_view.expandToDepth(0)
 
         ## select last row (I don't know what this does)
         # selmod = self.tree_view.selectionModel()
+        
+        # Checkboxes set while drawing aren't edits
+        self.dirty_mdocs= set()
 
         self.show()
 
@@ -1074,10 +2028,7 @@ class MdocTreeView(QtWidgets.QMainWindow):
         """
         
         if curr_target != VIRTUAL_TARGET_FILE:
-            curr_list_mdocs=[]
-            for potential_mdoc in self.data4json[curr_target].keys():
-                if isinstance(self.data4json[curr_target][potential_mdoc], list):
-                    curr_list_mdocs.append(potential_mdoc)
+            curr_list_mdocs= [curr_mdoc for curr_mdoc, general_and_tilt in iterTiltSeries(self.data4json[curr_target])]
             target_base=os.path.basename(curr_target)
             target_item = QtGui.QStandardItem(target_base)
         else:
@@ -1104,7 +2055,7 @@ class MdocTreeView(QtWidgets.QMainWindow):
         disableTF= self.verbosity>6 or self.verbosity<2 or self.debug
 
         # Loop through tilt series
-        for mdoc_idx, curr_mdoc in enumerate( tqdm.tqdm(curr_list_mdocs, unit=' mdoc', disable=disableTF) ):
+        for mdoc_idx, curr_mdoc in enumerate( progressBar(curr_list_mdocs, unit=' mdoc', disable=disableTF) ):
             # Strip extensions from MDOC
             mdoc_base= re.sub( '.mrc.mdoc$', '', os.path.basename(curr_mdoc) )
             
@@ -1128,20 +2079,20 @@ class MdocTreeView(QtWidgets.QMainWindow):
                     self.warn_dict['slices']= True
                     # If we built the JSON file from scratch, there will have been a warning earlier
             
+            # Micrograph rows will be added when expanded (see fetchMicrographs)
             self.mic2qt_lut[curr_mdoc] = {}
-            ts_parent_item, ts_select, tilt_string, resolution_string= self.buildStatList(
-                ts_parent_item,
-                self.data4json[curr_target][curr_mdoc][1],
-                curr_mdoc
-                )
+            ts_parent_item.setData(curr_mdoc, QtCore.Qt.UserRole)
             ts_item_list= [ts_parent_item]
             ts_parent_item.setAutoTristate(True)
             
-            if 'MdocSelected' in self.data4json[curr_target][curr_mdoc][0]:
-                mdoc_select= self.data4json[curr_target][curr_mdoc][0]['MdocSelected']
-            ts_parent_item.setCheckState(ts_select)
-            self.mic2qt_lut[curr_mdoc]['widget']= ts_parent_item
-            
+            # Selection state and extrema come from the rollup, rather than from each micrograph
+            ts_rollup= self.data4json[curr_target][curr_mdoc][0][ROLLUP_KEY]
+            tilt_string, resolution_string= rollupStrings(ts_rollup)
+            ts_select= 1
+            if ts_rollup['NumDeselected'] == 0: 
+                ts_select= 2
+            elif ts_rollup['NumSelected'] == 0: 
+                ts_select= 0
             ts_parent_item.setCheckState(ts_select)
             self.mic2qt_lut[curr_mdoc]['widget']= ts_parent_item
             
@@ -1189,7 +2140,78 @@ class MdocTreeView(QtWidgets.QMainWindow):
         # Add to target-file parent
         self.item_model.appendRow(target_item_list)
         
-    def buildStatList(self, ts_parent_item, tilt_data, curr_mdoc):
+    def fetchMicrographs(self, ts_parent_item):
+        """
+        Adds the micrograph rows of a tilt series, when it's expanded (see LazyTreeModel)
+        
+        Parameter:
+            ts_parent_item : Qt item of the tilt series, with the MDOC under Qt.UserRole
+        """
+        
+        curr_mdoc= ts_parent_item.data(QtCore.Qt.UserRole)
+        general_and_tilt= self.mdocData(curr_mdoc)
+        if general_and_tilt is None: return
+        
+        self.building_rows= True
+        self.buildStatList(ts_parent_item, general_and_tilt[1], curr_mdoc, sorted_keys=general_and_tilt.sortedKeys())
+        self.building_rows= False
+        
+        # Start decoding all of the tilts, not only the rows on screen, so that scrolling doesn't wait
+        if self.do_show_imgs:
+            for tilt_key in general_and_tilt.sortedKeys():
+                for image_key in ['MicThumbnail', 'CtfThumbnail']:
+                    if definedAndExists(image_key, general_and_tilt[1][tilt_key], snapshot=self.fs_snapshot):
+                        self.image_loader.request(general_and_tilt[1][tilt_key][image_key], self.imgsize)
+        
+        if self.debug: print(f"DEBUG: Image cache: {self.image_loader.cache.summary()}")
+    
+    def releaseMicrographs(self, index):
+        """
+        Removes the micrograph rows of a tilt series when it's collapsed, keeping their checkboxes in self.mic_states
+        
+        Parameter:
+            index : QModelIndex of the collapsed item
+        """
+        
+        ts_parent_item= self.item_model.itemFromIndex(index)
+        if ts_parent_item is None or find_depth(ts_parent_item) != 1: return
+        curr_mdoc= ts_parent_item.data(QtCore.Qt.UserRole)
+        
+        self.building_rows= True
+        ts_parent_item.removeRows( 0, ts_parent_item.rowCount() )
+        self.mic2qt_lut[curr_mdoc]= {'widget': ts_parent_item}
+        ts_parent_item.setCheckState( self.tsCheckState(curr_mdoc) )
+        self.building_rows= False
+    
+    def micCheckState(self, curr_mdoc, mic_data):
+        """
+        Parameters:
+            curr_mdoc : MDOC file
+            mic_data (dict) : micrograph data
+        
+        Returns:
+            checkbox state of a micrograph (0 or 2), whether or not its row exists
+        """
+        
+        movie_base= ntpath.basename(mic_data['SubFramePath'])
+        if movie_base in self.mic_states.get(curr_mdoc, {}): return self.mic_states[curr_mdoc][movie_base]
+        
+        return 2 if mic_data.get('MicSelected', True) else 0
+    
+    def tsCheckState(self, curr_mdoc):
+        """
+        Returns:
+            checkbox state of a tilt series (0, 1, or 2), from those of its micrographs
+        """
+        
+        state_set= set( self.micCheckState(curr_mdoc, mic_data) for mic_data in self.mdocData(curr_mdoc)[1].values() )
+        
+        if state_set == {2}: return 2
+        if state_set == {0}: return 0
+        
+        return 1
+    
+    def buildStatList(self, ts_parent_item, tilt_data, curr_mdoc, sorted_keys=None):
         """
         Build GUI stat table for each micrograph
         
@@ -1197,29 +2219,17 @@ class MdocTreeView(QtWidgets.QMainWindow):
             ts_parent_item : Qt widget to which data will be added
             tilt_data (dict) : metadata which will be eventually written to JSON file
             curr_mdoc (str) : MDOC file
+            sorted_keys (list, optional) : keys of tilt_data, sorted by angle
             
         Returns:
             updated Qt widget
         """
         
-        # Extract tilt angles
-        angles_list= [float(tilt_data[k]['TiltAngle']) for k in tilt_data.keys()]
-        
-        # Sort by angle (Adapted from https://stackoverflow.com/a/7851166)
-        sorted_idx_list = [i for i, x in sorted(enumerate(angles_list), key=lambda x: x[1])]
-
-        sorted_angles_list=[]
-        for angle_idx, curr_angle in enumerate(angles_list):
-            sorted_angles_list.append(list( tilt_data.keys() )[ sorted_idx_list[angle_idx] ])  # .keys() is not a list and thus cannot be directly subscripted
-
-        all_selected= True
-        none_selected= True
-
-        # Store extrema as a dictionary
-        extrema_dict= {'tilt_min':999, 'tilt_max':-999, 'res_best':9999, 'res_worst':-1}
+        # Sort by angle
+        if sorted_keys is None: sorted_keys= sortTiltKeys(tilt_data)
 
         # Loop through micrographs
-        for sorted_idx, tilt_key in enumerate(sorted_angles_list):
+        for sorted_idx, tilt_key in enumerate(sorted_keys):
             # Initialize row of micrograph stats
             stat_list= self.addMicWidget(tilt_data, tilt_key, curr_mdoc, sorted_idx)
 
@@ -1242,14 +2252,6 @@ class MdocTreeView(QtWidgets.QMainWindow):
                                 stat_value= float(tilt_data[tilt_key][stat_key])
                                 stat_string=f"{stat_value:{stat_format}}"
 
-                            # Check against extrama
-                            if stat_key == 'TiltAngle':
-                                if stat_value < extrema_dict['tilt_min'] : extrema_dict['tilt_min']= stat_value
-                                if stat_value > extrema_dict['tilt_max'] : extrema_dict['tilt_max']= stat_value
-                            elif stat_key == 'MaxRes':
-                                if stat_value < extrema_dict['res_best'] : extrema_dict['res_best']= stat_value
-                                if stat_value > extrema_dict['res_worst'] : extrema_dict['res_worst']= stat_value
-
                     stat_item= QtGui.QStandardItem(stat_string)
                     
                     # Align if necessary
@@ -1266,21 +2268,7 @@ class MdocTreeView(QtWidgets.QMainWindow):
             if self.verbosity>=8: print()
         # End micrograph loop
         
-        # Set selection status for tilt series
-        ts_select= 1
-        if all_selected: 
-            ts_select=2
-        else:
-            if none_selected: ts_select= 0
-        
-        # Format extrema
-        if extrema_dict['tilt_max'] > 0:
-            tilt_string= f"{extrema_dict['tilt_min']:.1f} to +{extrema_dict['tilt_max']:.1f}"
-        else:
-            tilt_string= f"{extrema_dict['tilt_min']:.1f} to {extrema_dict['tilt_max']:.1f}"
-        resolution_string= f"{extrema_dict['res_best']:.1f} to {extrema_dict['res_worst']:.1f}"
-
-        return ts_parent_item, ts_select, tilt_string, resolution_string
+        return ts_parent_item
                     
     def addMicWidget(self, tilt_data, tilt_key, curr_mdoc, sorted_idx):
         """
@@ -1299,23 +2287,14 @@ class MdocTreeView(QtWidgets.QMainWindow):
         movie_base= ntpath.basename(tilt_data[tilt_key]['SubFramePath'])
         ctffind_val= "{:5.2f}".format( float(tilt_data[tilt_key]['CtfFind4']) )
         
-        # Check if selected
-        if not 'MicSelected' in tilt_data[tilt_key]:
-            mic_select=2
-            none_selected= False
-        else:
-            if tilt_data[tilt_key]['MicSelected'] == True:
-                mic_select=2
-                none_selected= False
-            else:
-                mic_select=0
-                all_selected= False
+        # Check if selected (the row may have been created before, and the checkbox changed)
+        mic_select= self.micCheckState(curr_mdoc, tilt_data[tilt_key])
 
         if self.do_show_imgs:
             mic_thumb_path= tilt_data[tilt_key]['MicThumbnail']
 
             # Add micrograph entry
-            if os.path.exists(mic_thumb_path):
+            if self.fs_snapshot.exists(mic_thumb_path):
                 mic_item= CustomStandardItem(mic_thumb_path, size=self.imgsize, text=movie_base, is_checkable=True)
                 mic_item.setCheckState(mic_select)
                 self.mic2qt_lut[curr_mdoc][movie_base] = mic_item
@@ -1333,7 +2312,7 @@ class MdocTreeView(QtWidgets.QMainWindow):
 
             ctf_thumb_path= tilt_data[tilt_key]['CtfThumbnail']
             
-            if os.path.exists(ctf_thumb_path):
+            if self.fs_snapshot.exists(ctf_thumb_path):
                 mic_item= CustomStandardItem(ctf_thumb_path, size=self.imgsize, text=ctffind_val)
                 stat_list.append(mic_item)
                 
@@ -1356,6 +2335,9 @@ class MdocTreeView(QtWidgets.QMainWindow):
         #self.mic2qt_lut[curr_mdoc][movie_base] = mic_item
         ##(For some reason, Python forgets the address mic_item after the IF-THEN, so I need to save it to the lookup table right away
         
+        # The checkbox is in the first column
+        stat_list[0].setData(movie_base, QtCore.Qt.UserRole)
+        
         return stat_list
 
     def openMenu(self, position):
@@ -1378,11 +2360,11 @@ class MdocTreeView(QtWidgets.QMainWindow):
         # Menu options for file types
         mdoc_dir= self.probeMdocDir(depth, mdlIdx)
         if mdoc_dir:
-            list_ctfstacks= glob.glob( os.path.join(mdoc_dir, "*" + self.ctfthumb_suffix + ".mrcs") )
+            ts_scan= self.scanTsDir(mdoc_dir)
+            list_ctfstacks= ts_scan.paths('ctfstacks')
             
             # Micrograph stacks might end in '.st'
-            list_newstacks= glob.glob( os.path.join(mdoc_dir, "*" + self.micthumb_suffix + ".mrc") )
-            list_newstacks+= glob.glob( os.path.join(mdoc_dir, "*" + self.micthumb_suffix + ".st") )
+            list_newstacks= ts_scan.paths('stacks')
 
             # list_newstacks might be empty
             if depth==2 and list_newstacks:
@@ -1392,21 +2374,18 @@ class MdocTreeView(QtWidgets.QMainWindow):
                 # Prepend slice number to filename (will have to parse it later for printing)
                 list_newstacks+= [ f"-z {mdlIdx.row() + 1} {list_newstacks[-1]}" ]
             
-            # Look for fiducial models (eTomo only)
-            list_fids= glob.glob( os.path.join(mdoc_dir, "*.fid") )
-
-            # Sort by date
-            list_fids.sort(key=os.path.getmtime)
+            # Look for fiducial models (eTomo only), sorted by date
+            list_fids= ts_scan.paths('fids', sort_by='st_mtime')
 
             if self.debug: print(f"DEBUG: 1424: list_fids='{list_fids}'")
 
-            list_recons, list_slices= self.findMrcs(mdoc_dir)
+            list_recons, list_slices= self.findMrcs(ts_scan)
 
             # CTF scatter plot
-            ts_ctf_plot= glob.glob( os.path.join(mdoc_dir, self.options.ctfbyts_1ts) )
+            ts_ctf_plot= ts_scan.paths('ctfbyts')
             
             # Dose-fitting plot
-            ts_dose_plot= glob.glob( os.path.join(mdoc_dir, self.options.dosefit_plot) )
+            ts_dose_plot= ts_scan.paths('dosefit')
             
             self.addListAction(list_newstacks, "tilt series", voltype='stack')
             self.addListAction(list_ctfstacks, "power-spectrum stack")
@@ -1494,13 +2473,13 @@ class MdocTreeView(QtWidgets.QMainWindow):
         
         return os.path.dirname(curr_mdoc)
         
-    def findMrcs(self, mdoc_dir):
+    def findMrcs(self, ts_scan):
         """
         Get lists of MRCs
         Check if MRCs are 2D or 3D
 
         Parameter:
-            mdoc_dir
+            ts_scan (ArtifactScan) : classified files in tilt-series directory
 
         Returns:
             list of volumes
@@ -1511,25 +2490,23 @@ class MdocTreeView(QtWidgets.QMainWindow):
         list_slices=[]
 
         # Check if MRCs are 2D or 3D
-        for curr_pattern in self.options.recon_pattern.split():
-            list2test= glob.glob( os.path.join(mdoc_dir, curr_pattern) )
-            for fn in list2test:
-                mrc_dims= self.getDimensions(fn)  # (x->0, y->1, z->2)
-
-                # If getDimensions fails, it will return None
-                if mrc_dims:
-                    if min(mrc_dims) > 1:
+        for fn in ts_scan.paths('recons'):
+            mrc_dims= self.getDimensions(fn)  # (x->0, y->1, z->2)
+
+            # If getDimensions fails, it will return None
+            if mrc_dims:
+                if min(mrc_dims) > 1:
+                    list_recons+= [fn]
+                else:
+                    # Make sure it's the z-dimension that's 1
+                    if mrc_dims.index( min(mrc_dims) ) != 2:
+                        print(f"WARNING! MRC file '{fn}' has thickness of 1 but not in z")
+
+                        # Open it as a volume anyway
                         list_recons+= [fn]
                     else:
-                        # Make sure it's the z-dimension that's 1
-                        if mrc_dims.index( min(mrc_dims) ) != 2:
-                            print(f"WARNING! MRC file '{fn}' has thickness of 1 but not in z")
-
-                            # Open it as a volume anyway
-                            list_recons+= [fn]
-                        else:
-                            list_slices+= [fn]
-                # End mrc_dims IF-THEN
+                        list_slices+= [fn]
+            # End mrc_dims IF-THEN
 
         return list_recons, list_slices
 
@@ -1612,40 +2589,18 @@ class MdocTreeView(QtWidgets.QMainWindow):
             list of dimensions (x->0, y->1, z->2)
         """
 
-        ###print(f"1615: Running getDimensions: fn='{fn}'")
-
-        # Check if IMOD in PATH
-        ###print(f"1618: Running check_exe('header')")
-        path_header= self.check_exe('header', verbose=self.verbosity>=7)
-        ###print(f"1620: Finished check_exe('header')")
-        if path_header is None: return
-
         # If single slice from stack, then 'fn' will have been prepended to
         if fn.split()[0] == '-z': fn= ' '.join(fn.split()[2:])
 
-        # Read header
-        hdr_out = subprocess.run([path_header, fn], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-        # Try to catch subprocess errors
-        if hdr_out.returncode!= 0:
-            print("\nWARNING! IMOD 'header' command failed!", file=sys.stderr)
-            print( f"  Command: {' '.join([path_header, fn])}", file=sys.stderr)
-            print( f"  Error: {hdr_out.stdout.decode('utf-8').rstrip()}", file=sys.stderr)
+        # Read header (in-process, rather than running IMOD's 'header')
+        mrc_header= readMrcHeader(fn)
+        if mrc_header is None:
+            print(f"\nWARNING! Couldn't read MRC header of '{fn}'", file=sys.stderr)
             return None
 
-        # Split into lines
-        hdr_lines = hdr_out.stdout.decode('utf-8').split('\n')
-
-        # Find line with 'sections'
-        section_lines= [x for x in hdr_lines if 'sections' in x]
-        assert len(section_lines) == 1, f"ERROR!! IMOD header output has multiple lines (or none) containing the string 'sections'! \n\t'{section_lines}'"
-
-        # Get last three entries containing dimensions
-        mrc_dims= [ eval(i) for i in section_lines[0].split()[-3:] ]
+        mrc_dims= list(mrc_header['dims'])
         # (x->0, y->1, z->2)
 
-        ###print(f"1647: Finished getDimensions: fn='{fn}'\n")
-
         return mrc_dims
 
     def openImgView(self, fn, voltype=None):
@@ -1661,35 +2616,6 @@ class MdocTreeView(QtWidgets.QMainWindow):
         if path_imgview:
             hdr_out = subprocess.run([path_imgview, fn], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     
-    def findCtfbytsPlots(self, target_base, debug=False):
-        """
-        Find CTFFIND scatter plots
-        
-        Parameters:
-            target_base (str) : basename of target file
-            debug (bool) : flag to print debug information
-        
-        Returns:
-            plot filename
-        """
-        
-        fn=None  # initialize
-
-        list_ctfplots= glob.glob(self.ctfbyts_tgts)
-        target_prefix= os.path.splitext(target_base)[0]
-        search_matches= [s for s in list_ctfplots if target_prefix in s]
-        
-        # If a unique match then use it
-        if len(search_matches) == 1:
-            fn= search_matches[0]
-        else:
-            # If there's a generic ctfbyts.png, use it
-            imgdir= os.path.dirname(self.ctfbyts_tgts)
-            generic_fn= os.path.join(imgdir, self.options.ctfbyts_1ts)
-            if os.path.exists(generic_fn): fn= generic_fn
-        
-        return fn
-    
     def addTSImgs(self, latest_plot, item_list):
         """
         Tries to find plot, and creates an empty widget if plot unavailable
@@ -1767,6 +2693,8 @@ class MdocTreeView(QtWidgets.QMainWindow):
         NOTE: "self" here refers to the QWidget containing the checkbox/textbox, while "parent" is the TreeView
         """
         
+        if parent.building_rows: return
+        
         if parent.unsaved_changes == False:
             parent.unsaved_changes= True
             if parent.debug: print("DEBUG: First click")
@@ -1802,29 +2730,25 @@ class MdocTreeView(QtWidgets.QMainWindow):
                         # Get full MDOC path
                         mdoc_path= parent.mdoc_lut[curr_parent_text]
                         curr_mdoc_item= mdoc_list[0]
+                        parent.dirty_mdocs.add(mdoc_path)
                         
-                        all_selected= True
-                        none_selected= True
-                        
-                        # Loop through micrographs
-                        for mic_idx in range( curr_mdoc_item.rowCount() ):
-                            mic_item= curr_mdoc_item.child(mic_idx)
-                            curr_state= mic_item.checkState()
-                            if curr_state==0: all_selected= False
-                            if curr_state==2: none_selected=False
-                        # End micrograph loop
+                        # Remember the checkbox, since the row will be removed when collapsed
+                        if mdoc_path not in parent.mic_states: parent.mic_states[mdoc_path]= {}
+                        parent.mic_states[mdoc_path][ self.data(QtCore.Qt.UserRole) ]= self.checkState()
                         
-                        # Update state, with sanity check
-                        assert not all_selected or not none_selected, "ERROR!! Unknown state!"
-                        if all_selected: 
-                            curr_mdoc_item.setCheckState(2)
-                        elif none_selected:
-                            curr_mdoc_item.setCheckState(0)
-                        else:
-                            curr_mdoc_item.setCheckState(1)
+                        # Update state
+                        curr_mdoc_item.setCheckState( parent.tsCheckState(mdoc_path) )
                             
                         if parent.debug: print(f"  1462 {curr_mdoc_item.text()} '{curr_mdoc_item.checkState()}'")
                     # End sanity IF-THEN
+                
+                # If a tilt series was (de)selected, then all of its micrographs were, including those without rows
+                elif find_depth(self) == 1 and self.checkState() != 1:
+                    mdoc_path= parent.mdoc_lut[self.text()]
+                    parent.dirty_mdocs.add(mdoc_path)
+                    parent.mic_states[mdoc_path]= { 
+                        ntpath.basename(mic_data['SubFramePath']): self.checkState() for mic_data in parent.mdocData(mdoc_path)[1].values() 
+                        }
                 # End depth=2 IF-THEN
             # End valid-index IF-THEN
         # If line-edit
@@ -1836,6 +2760,7 @@ class MdocTreeView(QtWidgets.QMainWindow):
             if parent.debug: print(f"1480 mdoc_base '{mdoc_base}', edited_text '{edited_text}', target_file {target_file}")
             curr_mdoc= parent.mdoc_lut[mdoc_base]
             parent.data4json[target_file][curr_mdoc][0]['TextNote'] = edited_text
+            parent.pending_changes.append([target_file, curr_mdoc, None, 'TextNote'])
         # End checkbox IF-THEN
         
     def testFunction(self):
@@ -1850,34 +2775,40 @@ class MdocTreeView(QtWidgets.QMainWindow):
             
             # Loop through (possible) MDOC files
             for curr_mdoc in target_data.keys():
-                # Might be the CtfByTS plot
-                if isinstance(target_data[curr_mdoc], list):
+                # Might be the CtfByTS plot (and only tilt series whose checkboxes have changed need to be checked)
+                if isinstance(target_data[curr_mdoc], list) and curr_mdoc in self.dirty_mdocs:
                     if not curr_mdoc in self.mic2qt_lut:
                         print(f"UH OH! Can't find widget dictionary for MDOC '{curr_mdoc}'")
                         return()
                     
                     if target_data[curr_mdoc][0]['MdocSelected'] != self.mic2qt_lut[curr_mdoc]['widget'].checkState():
                         self.data4json[curr_target][curr_mdoc][0]['MdocSelected'] = self.mic2qt_lut[curr_mdoc]['widget'].checkState()
+                        self.pending_changes.append([curr_target, curr_mdoc, None, 'MdocSelected'])
                     
-                    # Loop through micrographs
+                    # Loop through micrographs (whose rows may not exist)
                     for mic_idx, curr_mic in enumerate(target_data[curr_mdoc][1]):
-                        movie_base= ntpath.basename(target_data[curr_mdoc][1][curr_mic]['SubFramePath'])
-                        if not movie_base in self.mic2qt_lut[curr_mdoc]:
-                            print(f"UH OH! Can't find widget for micrograph '{movie_base}'")
-                            return
+                        mic_state= self.micCheckState(curr_mdoc, target_data[curr_mdoc][1][curr_mic])
                         
                         # Update only when necessary
-                        if target_data[curr_mdoc][1][curr_mic]['MicSelected'] and not self.mic2qt_lut[curr_mdoc][movie_base].checkState(): 
+                        if target_data[curr_mdoc][1][curr_mic]['MicSelected'] and not mic_state: 
                             self.data4json[curr_target][curr_mdoc][1][curr_mic]['MicSelected'] = False
-                        if self.mic2qt_lut[curr_mdoc][movie_base].checkState() and not target_data[curr_mdoc][1][curr_mic]['MicSelected']:
+                            self.pending_changes.append([curr_target, curr_mdoc, curr_mic, 'MicSelected'])
+                        if mic_state and not target_data[curr_mdoc][1][curr_mic]['MicSelected']:
                             self.data4json[curr_target][curr_mdoc][1][curr_mic]['MicSelected'] = True
+                            self.pending_changes.append([curr_target, curr_mdoc, curr_mic, 'MicSelected'])
                     # End micrograph loop
+                    
+                    updateSelectionRollup(target_data[curr_mdoc])
                 # End MDOC IF-THEN
             # End MDOC loop
+            
+            # Tilt series may also have been incinerated or restored
+            targetRollup(target_data)
         # End target loop
         
-        save_json(self.data4json, filename=self.json, verbosity=self.verbosity)
+        self.saveChanges()
         self.unsaved_changes= False
+        self.dirty_mdocs= set()
         
     def restackDeselected(self):
         if not self.unsaved_changes:
@@ -1902,14 +2833,11 @@ class MdocTreeView(QtWidgets.QMainWindow):
                     deselect_list = []
                     mic_list= []
                     
-                    # Loop through micrographs
+                    # Loop through micrographs (whose rows may not exist)
                     for mic_idx, curr_mic in enumerate(target_data[curr_mdoc][1]):
                         movie_base= ntpath.basename(target_data[curr_mdoc][1][curr_mic]['SubFramePath'])
-                        if not movie_base in self.mic2qt_lut[curr_mdoc]:
-                            print(f"UH OH! Can't find widget for movie '{movie_base}'")
-                            return
                         
-                        if self.mic2qt_lut[curr_mdoc][movie_base].checkState() == 0:
+                        if self.micCheckState(curr_mdoc, target_data[curr_mdoc][1][curr_mic]) == 0:
                             some_deselected= True
                             deselect_list.append(movie_base)
                         else:
@@ -1923,25 +2851,26 @@ class MdocTreeView(QtWidgets.QMainWindow):
                     
                     # Only if micrographs were deselected (TODO: Move to function)
                     if some_deselected:
-                        # Prepare MDOC file
-                        general_lines, tilt_data= readMdocHeader(curr_mdoc)
+                        # Prepare MDOC file (copy the header, since the parsed MDOC is cached)
+                        header_lines, zvalue_list= scanMdoc(curr_mdoc)
+                        general_lines= list(header_lines)
 
                         # Loop through ZValues
                         num_counter= 0
-                        for mic_data in tilt_data:
-                            movie_base= subframeFromZvalueData(mic_data)
+                        for zvalue_record in zvalue_list:
+                            movie_base= zvalue_record.subframe
                             
                             # Build corresponding micrograph
                             mic_base= os.path.splitext(movie_base)[0] + self.options.mic_pattern
                             if mic_base in mic_list:
                                 # Number ZValue consecutively
-                                for line_idx, line_text in enumerate(mic_data):
+                                for line_idx, line_text in enumerate(zvalue_record.lines):
                                     if line_text.startswith('[ZValue') :
                                         key_value = line_text.split('=')[1]
                                         int_value= int(key_value.split(']')[0])
                                         new_line= re.sub(str(int_value), str(num_counter), line_text)
                                         
-                                        # Replace in mic_data
+                                        # Replace in ZValue lines
                                         line_text= new_line
                                 
                                     general_lines.append(line_text)
@@ -1951,7 +2880,6 @@ class MdocTreeView(QtWidgets.QMainWindow):
                                 num_counter+= 1
                             else:
                                 # Sanity check if absent
-                                movie_base= subframeFromZvalueData(mic_data)
                                 assert movie_base in deselect_list, f"UH OH! Data for '{movie_base}' seems not to be in delesection list {deselect_list}"
                         # End ZValue loop
                         
@@ -1997,8 +2925,7 @@ class MdocTreeView(QtWidgets.QMainWindow):
             return
         
         # Get stack name(s) (TODO: Save to JSON rather than parse here)
-        list_newstacks= glob.glob( os.path.join(mdoc_dir, "*" + self.micthumb_suffix + ".mrc") )
-        list_newstacks+= glob.glob( os.path.join(mdoc_dir, "*" + self.micthumb_suffix + ".st") )
+        list_newstacks= self.scanTsDir(mdoc_dir).paths('stacks')
         
         # If more than 1, then throw error
         if len(list_newstacks) > 1: 
@@ -2027,6 +2954,7 @@ class MdocTreeView(QtWidgets.QMainWindow):
             else:
                 # TODO: Make sure MDOC has the same number of entries as the stack file
                 if self.verbosity>= 1: print(f"  Wrote new stack: {reordered_stack}")
+                self.fs_snapshot.invalidate(mdoc_dir)
                 newstack_log= re.sub('.mrc.mdoc$', self.options.stack_suffix + '.out', curr_mdoc)
                 writeAsText(newstack_out.stdout.decode('utf-8'), newstack_log, do_backup=True, verbose=self.verbosity>=3, description='restack output log')
     
@@ -2086,6 +3014,8 @@ class MdocTreeView(QtWidgets.QMainWindow):
                         
                         if not self.debug:
                             shutil.move(ts_dir, dest_dir)
+                            self.fs_snapshot.remove(ts_dir)
+                            self.fs_snapshot.add(dest_dir)
                         else:
                             if self.verbosity>=4: print(f"DEBUG: mv {ts_dir} {self.incinerate_subdirs['ts_dir']}")
                             
@@ -2106,11 +3036,10 @@ class MdocTreeView(QtWidgets.QMainWindow):
             # End MDOC loop
         # End target loop
         
-        # Update JSON data
-        data_copy= copy.deepcopy(self.data4json)
-        for curr_target in data_copy.keys():
-            target_data= data_copy[curr_target]
-            for curr_mdoc in target_data.keys():
+        # Update JSON data (looping through lists of keys, since can't modify dict while iterating through it)
+        for curr_target in list( self.data4json.keys() ):
+            target_data= self.data4json[curr_target]
+            for curr_mdoc in list( target_data.keys() ):
                 if isinstance(target_data[curr_mdoc], list):
                     if not curr_mdoc in self.mic2qt_lut:
                         print(f"UH OH! Can't find widget dictionary for MDOC '{curr_mdoc}'")
@@ -2124,6 +3053,7 @@ class MdocTreeView(QtWidgets.QMainWindow):
                         # Delete
                         del self.data4json[curr_target][curr_mdoc]
                         del self.mdoc_lut[os.path.basename(curr_mdoc)]
+                        self.pending_changes.append([curr_target, curr_mdoc, None, None])
                 # End deselected IF-THEN
             # End MDOC loop
         # End target loop
@@ -2184,6 +3114,8 @@ class MdocTreeView(QtWidgets.QMainWindow):
                 self.incinerated_mvlist.append([source, destination])
                 if not self.debug: 
                     shutil.move(source, destination)
+                    self.fs_snapshot.remove(source)
+                    self.fs_snapshot.add(destination)
                 else:
                     print(f"DEBUG:   mv {source} {destination}")
             else:
@@ -2249,6 +3181,8 @@ class MdocTreeView(QtWidgets.QMainWindow):
             if not self.debug:
                 assert not os.path.exists(destination), f"UH OH, {destination} already exists!"
                 shutil.move(source, destination)
+                self.fs_snapshot.remove(source)
+                self.fs_snapshot.add(destination)
                 
                 if os.path.isdir(destination):
                     # Look for MDOC files (TODO: Confirm that it's a tomo directory)
@@ -2270,6 +3204,7 @@ class MdocTreeView(QtWidgets.QMainWindow):
             self.data4json[curr_target][curr_mdoc] = self.incinerated_tsdict[curr_mdoc]['json_data']
             self.data4json[curr_target][curr_mdoc][0]['MdocSelected'] = 2
             self.mdoc_lut[os.path.basename(curr_mdoc)] = curr_mdoc
+            self.pending_changes.append([curr_target, curr_mdoc, None, None])
         
         self.saveSelection()
         
@@ -2289,6 +3224,8 @@ class MdocTreeView(QtWidgets.QMainWindow):
     
     # Adapted from https://stackoverflow.com/a/9249527
     def closeEvent(self, event=None):
+        if self.debug: print(f"DEBUG: Image cache: {self.image_loader.cache.summary()}")
+        
         if self.unsaved_changes == True:
             # Adapted from https://pythonprogramming.net/pop-up-messages-pyqt-tutorial/
             choice= QtWidgets.QMessageBox.question(
@@ -2300,6 +3237,7 @@ class MdocTreeView(QtWidgets.QMainWindow):
             # TODO: If there are 3+ buttons (e.g., Save+Quit), I don't know how to center them
 
             if choice== QtWidgets.QMessageBox.Yes:
+                self.compactJournal()
                 if self.verbosity>=1 : print("Exiting...")
                 if not event: exit()
 
@@ -2309,6 +3247,7 @@ class MdocTreeView(QtWidgets.QMainWindow):
             else:
                 print(f"Uh oh! Unknown option: {choice}")
         else:
+            self.compactJournal()
             if self.verbosity>=1 : print("Exiting...")
             exit()
 
@@ -2328,79 +3267,1250 @@ class MdocTreeView(QtWidgets.QMainWindow):
 
 ## END CLASS MDOCTREEVIEW ##
 
-class MdocColumnAttrs:
+class SqliteStore:
     """
-    Contains attributes for each item displayed from the MDOC file:
-        width
-        format
+    Metadata in an SQLite database, as an alternative to the JSON file.
+    
+    Tables:
+        targets : one row per target file (real or virtual)
+        tilt_series : one row per MDOC, with the header dictionary as JSON text
+        micrographs : one row per micrograph, with its dictionary as JSON text
+    
+    Selection, tilt angle, and resolution are also stored as columns, so that they can be queried.
+    read() and write() convert to and from the JSON layout.
     """
-
-    def __init__(self, column_list=[]):
-        self.keys=column_list
-        self.column_dict={}
-
-    def add_column(self, name, width, format, align=None):
-        self.keys.append(name)
-        self.column_dict[name]= argparse.Namespace()
-        self.column_dict[name].width=width
-        self.column_dict[name].format=format
+    
+    SCHEMA= """
+        CREATE TABLE IF NOT EXISTS targets (
+            target TEXT PRIMARY KEY,
+            position INTEGER,
+            ctfbyts_plot TEXT
+            );
+        CREATE TABLE IF NOT EXISTS tilt_series (
+            mdoc TEXT PRIMARY KEY,
+            target TEXT,
+            position INTEGER,
+            selected INTEGER,
+            text_note TEXT,
+            general TEXT
+            );
+        CREATE TABLE IF NOT EXISTS micrographs (
+            mdoc TEXT,
+            tilt_key TEXT,
+            position INTEGER,
+            movie TEXT,
+            tilt_angle REAL,
+            max_res REAL,
+            selected INTEGER,
+            data TEXT,
+            PRIMARY KEY (mdoc, tilt_key)
+            );
+        CREATE INDEX IF NOT EXISTS tilt_series_target ON tilt_series (target);
+        CREATE INDEX IF NOT EXISTS micrographs_movie ON micrographs (movie);
+    """
+    
+    def __init__(self, db_file):
+        self.db_file= db_file
+    
+    def connect(self):
+        """
+        Returns:
+            sqlite3.Connection, with the tables created if necessary
+        """
+        
+        connection= sqlite3.connect(self.db_file, timeout=60)
+        connection.executescript(self.SCHEMA)
+        
+        return connection
+    
+    def read(self):
+        """
+        Returns:
+            metadata, in the JSON layout
+        """
+        
+        data= {}
+        mdoc2target= {}
+        connection= self.connect()
+        
+        for curr_target, ctfbyts_plot in connection.execute("SELECT target, ctfbyts_plot FROM targets ORDER BY position"):
+            data[curr_target]= {}
+            if ctfbyts_plot: data[curr_target]['CtfBytsPlot']= ctfbyts_plot
+        
+        for curr_mdoc, curr_target, general in connection.execute("SELECT mdoc, target, general FROM tilt_series ORDER BY position"):
+            if curr_target not in data: data[curr_target]= {}
+            data[curr_target][curr_mdoc]= [json.loads(general), {}]
+            mdoc2target[curr_mdoc]= curr_target
+        
+        for curr_mdoc, tilt_key, mic_data in connection.execute("SELECT mdoc, tilt_key, data FROM micrographs ORDER BY mdoc, position"):
+            if curr_mdoc in mdoc2target:
+                data[ mdoc2target[curr_mdoc] ][curr_mdoc][1][tilt_key]= json.loads(mic_data)
+        
+        connection.close()
+        
+        return data
+    
+    def write(self, data, known_mdocs=None):
+        """
+        Replaces all metadata, in a single transaction
+        
+        Parameters:
+            data : metadata, in the JSON layout
+            known_mdocs (set, optional) : tilt series which were in the database when it was read
+                Other tilt series were added by another process in the meantime, and will be kept.
+        """
+        
+        connection= self.connect()
+        
+        with connection:
+            if known_mdocs is None:
+                connection.execute("DELETE FROM targets")
+                connection.execute("DELETE FROM tilt_series")
+                connection.execute("DELETE FROM micrographs")
+            else:
+                connection.executemany("DELETE FROM tilt_series WHERE mdoc=?", [(curr_mdoc,) for curr_mdoc in known_mdocs])
+                connection.executemany("DELETE FROM micrographs WHERE mdoc=?", [(curr_mdoc,) for curr_mdoc in known_mdocs])
+                connection.execute("DELETE FROM targets WHERE target NOT IN (SELECT target FROM tilt_series)")
+            
+            for curr_target in data.keys():
+                self.insertTarget(connection, curr_target, data[curr_target])
+                
+                for curr_mdoc in data[curr_target].keys():
+                    if isinstance(data[curr_target][curr_mdoc], list):
+                        self.insertMdoc(connection, curr_target, curr_mdoc, data[curr_target][curr_mdoc])
+        
+        connection.close()
+    
+    def readMdoc(self, curr_mdoc):
+        """
+        Returns:
+            data for one tilt series, or None if absent
+        """
+        
+        connection= self.connect()
+        row= connection.execute("SELECT general FROM tilt_series WHERE mdoc=?", (curr_mdoc,)).fetchone()
+        
+        if row is None: 
+            general_and_tilt= None
+        else:
+            tilt_data= { 
+                tilt_key: json.loads(mic_data) for tilt_key, mic_data in connection.execute("SELECT tilt_key, data FROM micrographs WHERE mdoc=? ORDER BY position", (curr_mdoc,)) 
+                }
+            general_and_tilt= TiltSeries( [json.loads(row[0]), tilt_data] )
+        
+        connection.close()
+        
+        return general_and_tilt
+    
+    def upsertMdoc(self, curr_target, curr_mdoc, target_data):
+        """
+        Adds or replaces one tilt series (and adds its target file if necessary), in a single transaction
+        The MDOC is the key, so a tilt series previously under another target file is moved.
+        
+        Parameters:
+            curr_target : target file (real or virtual)
+            curr_mdoc : MDOC file
+            target_data : dictionary containing the tilt series, and optionally 'CtfBytsPlot'
+        """
+        
+        connection= self.connect()
+        
+        with connection:
+            self.insertTarget(connection, curr_target, target_data)
+            if target_data.get('CtfBytsPlot'):
+                connection.execute("UPDATE targets SET ctfbyts_plot=? WHERE target=?", (target_data['CtfBytsPlot'], curr_target))
+            self.insertMdoc(connection, curr_target, curr_mdoc, target_data[curr_mdoc])
+            
+            # The tilt series may have been under another target file
+            connection.execute("DELETE FROM targets WHERE target NOT IN (SELECT target FROM tilt_series)")
+        
+        connection.close()
+    
+    def updateRows(self, data, change_list):
+        """
+        Updates only the changed rows, in a single transaction
+        The header of a tilt series is also updated when its micrographs are, since it contains the rollup.
+        
+        Parameters:
+            data : metadata, in the JSON layout
+            change_list : list of [target, MDOC, tilt key, field key]
+                If the tilt key is None, the tilt series is updated (or added, or deleted if absent from data)
+        """
+        
+        connection= self.connect()
+        edited_series= set()  # Tilt series whose micrographs were edited, whose rollups need to be updated
+        
+        with connection:
+            for curr_target, curr_mdoc, tilt_key, field_key in change_list:
+                target_data= data.get(curr_target, {})
+                
+                # Incinerated tilt series
+                if curr_mdoc not in target_data:
+                    connection.execute("DELETE FROM tilt_series WHERE mdoc=?", (curr_mdoc,))
+                    connection.execute("DELETE FROM micrographs WHERE mdoc=?", (curr_mdoc,))
+                
+                elif tilt_key is None:
+                    general= target_data[curr_mdoc][0]
+                    num_updated= connection.execute(
+                        "UPDATE tilt_series SET selected=?, text_note=?, general=? WHERE mdoc=?", 
+                        ( general.get('MdocSelected'), general.get('TextNote'), json.dumps(general), curr_mdoc )
+                        ).rowcount
+                    
+                    # Restored tilt series
+                    if num_updated == 0:
+                        self.insertTarget(connection, curr_target, target_data)
+                        self.insertMdoc(connection, curr_target, curr_mdoc, target_data[curr_mdoc])
+                
+                else:
+                    mic_data= target_data[curr_mdoc][1][tilt_key]
+                    connection.execute(
+                        "UPDATE micrographs SET selected=?, data=? WHERE mdoc=? AND tilt_key=?", 
+                        ( mic_data.get('MicSelected'), json.dumps(mic_data), curr_mdoc, tilt_key )
+                        )
+                    edited_series.add( (curr_target, curr_mdoc) )
+            # End change loop
+            
+            connection.executemany(
+                "UPDATE tilt_series SET general=? WHERE mdoc=?", 
+                [ ( json.dumps( data[curr_target][curr_mdoc][0] ), curr_mdoc ) for curr_target, curr_mdoc in edited_series ]
+                )
+        
+        connection.close()
+    
+    def insertTarget(self, connection, curr_target, target_data):
+        """
+        Adds a target file, unless already present
+        """
+        
+        connection.execute(
+            "INSERT OR IGNORE INTO targets (target, position, ctfbyts_plot) VALUES (?, (SELECT COALESCE(MAX(position) + 1, 0) FROM targets), ?)", 
+            ( curr_target, target_data.get('CtfBytsPlot') )
+            )
+    
+    def insertMdoc(self, connection, curr_target, curr_mdoc, general_and_tilt):
+        """
+        Adds (or replaces) a tilt series and its micrographs
+        A replaced tilt series keeps its position, and a new one goes last.
+        """
+        
+        general, tilt_data= general_and_tilt
+        
+        connection.execute(
+            """INSERT OR REPLACE INTO tilt_series (mdoc, target, position, selected, text_note, general) VALUES (?, ?, 
+                COALESCE( (SELECT position FROM tilt_series WHERE mdoc=?), (SELECT COALESCE(MAX(position) + 1, 0) FROM tilt_series) ), ?, ?, ?)""", 
+            ( curr_mdoc, curr_target, curr_mdoc, general.get('MdocSelected'), general.get('TextNote'), json.dumps(general) )
+            )
+        connection.execute("DELETE FROM micrographs WHERE mdoc=?", (curr_mdoc,))
+        connection.executemany(
+            "INSERT INTO micrographs (mdoc, tilt_key, position, movie, tilt_angle, max_res, selected, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", 
+            [
+                (
+                    curr_mdoc, 
+                    tilt_key, 
+                    mic_idx, 
+                    ntpath.basename( tilt_data[tilt_key].get('SubFramePath', '') ), 
+                    tilt_data[tilt_key].get('TiltAngle'), 
+                    tilt_data[tilt_key].get('MaxRes'), 
+                    tilt_data[tilt_key].get('MicSelected'), 
+                    json.dumps(tilt_data[tilt_key])
+                )
+                for mic_idx, tilt_key in enumerate(tilt_data)
+            ]
+            )
+
+class SessionCatalog:
+    """
+    SQLite index of the tilt series from many sessions (i.e., many JSON files or SQLite stores), for queries across sessions.
+    
+    Tables:
+        sessions : one row per session store, with the signatures of its files when last ingested
+        tilt_series : one row per tilt series, with the statistics from its rollup (see tiltSeriesRollup)
+    
+    A session is read again only if its store, journal, or manifest has changed since it was last ingested, 
+    and then only the rows which have changed are rewritten.
+    """
+    
+    SCHEMA= """
+        CREATE TABLE IF NOT EXISTS sessions (
+            store TEXT PRIMARY KEY,
+            signature TEXT,
+            num_series INTEGER,
+            ingested REAL
+            );
+        CREATE TABLE IF NOT EXISTS tilt_series (
+            store TEXT,
+            mdoc TEXT,
+            target TEXT,
+            tilt_min REAL,
+            tilt_max REAL,
+            res_best REAL,
+            res_worst REAL,
+            num_mics INTEGER,
+            num_selected INTEGER,
+            num_deselected INTEGER,
+            mdoc_selected INTEGER,
+            text_note TEXT,
+            inputs TEXT,
+            PRIMARY KEY (store, mdoc)
+            );
+        CREATE INDEX IF NOT EXISTS tilt_series_res_best ON tilt_series (res_best);
+        CREATE INDEX IF NOT EXISTS tilt_series_num_selected ON tilt_series (num_selected);
+    """
+    
+    # Columns of tilt_series after the key, in order
+    COLUMNS= ['target', 'tilt_min', 'tilt_max', 'res_best', 'res_worst', 'num_mics', 'num_selected', 'num_deselected', 'mdoc_selected', 'text_note', 'inputs']
+    
+    def __init__(self, db_file, verbosity=3):
+        self.db_file= db_file
+        self.verbosity= verbosity
+    
+    def connect(self):
+        """
+        Returns:
+            sqlite3.Connection, with the tables created if necessary
+        """
+        
+        connection= sqlite3.connect(self.db_file, timeout=60)
+        connection.executescript(self.SCHEMA)
+        
+        return connection
+    
+    def sessionSignature(self, store_file):
+        """
+        Returns:
+            signatures of the files of a session store (as JSON text), which change whenever the store is saved
+        """
+        
+        return json.dumps( [fileSignature(store_file + suffix) for suffix in ['', '.journal', '.manifest']] )
+    
+    def readSession(self, store_file):
+        """
+        Reads a session store, with its journal applied and a rollup for each tilt series
+        
+        Parameter:
+            store_file : JSON file, or SQLite store (with a '.sqlite' extension)
+        
+        Returns:
+            metadata, in the JSON layout
+        """
+        
+        if os.path.splitext(store_file)[1] == '.sqlite':
+            json_data= SqliteStore(store_file).read()
+        else:
+            with lockFile(store_file, shared=True):
+                json_data= expandPaths( read_json(store_file) )
+                replayJournal(json_data, store_file + '.journal')
+        
+        # Stores written before rollups were kept
+        for curr_target in json_data.keys():
+            for curr_mdoc, general_and_tilt in iterTiltSeries(json_data[curr_target]):
+                if ROLLUP_KEY not in general_and_tilt[0]: tiltSeriesRollup(general_and_tilt)
+        
+        return json_data
+    
+    def addSessions(self, store_list):
+        """
+        Ingests session stores, skipping those which haven't changed since they were last ingested
+        
+        Parameter:
+            store_list (list) : JSON files or SQLite stores
+        """
+        
+        connection= self.connect()
+        known_signatures= dict( connection.execute("SELECT store, signature FROM sessions") )
+        num_skipped= 0
+        
+        for store_file in store_list:
+            store_path= os.path.abspath(store_file)
+            
+            if not os.path.exists(store_path):
+                print(f"WARNING! Session store '{store_file}' not found, skipping...")
+                continue
+            
+            signature= self.sessionSignature(store_path)
+            if known_signatures.get(store_path) == signature:
+                num_skipped+= 1
+                continue
+            
+            try:
+                json_data= self.readSession(store_path)
+            except (ValueError, sqlite3.Error) as e:
+                print(f"WARNING! Can't read session store '{store_file}' ({type(e).__name__}: {e}), skipping...")
+                continue
+            
+            manifest= readManifest(store_path + '.manifest')
+            
+            with connection:
+                num_changed= self.updateSession(connection, store_path, json_data, manifest)
+                connection.execute(
+                    "INSERT OR REPLACE INTO sessions (store, signature, num_series, ingested) VALUES (?, ?, (SELECT COUNT(*) FROM tilt_series WHERE store=?), ?)", 
+                    (store_path, signature, store_path, time.time())
+                    )
+            
+            if self.verbosity>=2: print(f"Updated {num_changed} tilt series from '{store_file}'")
+        # End session loop
+        
+        connection.close()
+        
+        if self.verbosity>=2 and num_skipped>0: print(f"Skipped {num_skipped} unchanged sessions")
+    
+    def updateSession(self, connection, store_path, json_data, manifest):
+        """
+        Rewrites only the rows of a session which have changed, and removes those of tilt series no longer in the session
+        Relative MDOC paths are taken relative to the directory of the store (i.e., the session directory) and stored as absolute paths, so that rows from any session can be resolved.
+        
+        Returns:
+            number of rows added, changed, or removed
+        """
+        
+        old_rows= { 
+            row[0]: row[1:] for row in connection.execute(f"SELECT mdoc, {', '.join(self.COLUMNS)} FROM tilt_series WHERE store=?", (store_path,)) 
+            }
+        new_rows= {}
+        
+        for curr_target in json_data.keys():
+            for curr_mdoc, general_and_tilt in iterTiltSeries(json_data[curr_target]):
+                general= general_and_tilt[0]
+                rollup= general[ROLLUP_KEY]
+                
+                # The pipeline writes the store in the directory it runs from, which MDOC paths are relative to
+                mdoc_path= os.path.normpath( os.path.join(os.path.dirname(store_path), curr_mdoc) )
+                
+                # The input signatures from the manifest show whether the tilt series was rebuilt
+                inputs= hashlib.sha1( json.dumps(manifest.get(curr_mdoc), sort_keys=True).encode() ).hexdigest()
+                
+                new_rows[mdoc_path]= (
+                    curr_target, 
+                    rollup['TiltMin'], 
+                    rollup['TiltMax'], 
+                    rollup['ResBest'], 
+                    rollup['ResWorst'], 
+                    rollup['NumMics'], 
+                    rollup['NumSelected'], 
+                    rollup['NumDeselected'], 
+                    general.get('MdocSelected'), 
+                    general.get('TextNote'), 
+                    inputs
+                    )
+        # End target loop
+        
+        changed_list= [ (store_path, curr_mdoc) + curr_row for curr_mdoc, curr_row in new_rows.items() if old_rows.get(curr_mdoc) != curr_row ]
+        removed_list= [ (store_path, curr_mdoc) for curr_mdoc in old_rows.keys() if curr_mdoc not in new_rows ]
+        
+        connection.executemany(
+            f"INSERT OR REPLACE INTO tilt_series (store, mdoc, {', '.join(self.COLUMNS)}) VALUES ({', '.join( ['?']*(len(self.COLUMNS) + 2) )})", 
+            changed_list
+            )
+        connection.executemany("DELETE FROM tilt_series WHERE store=? AND mdoc=?", removed_list)
+        
+        return len(changed_list) + len(removed_list)
+    
+    def query(self, max_res=None, min_selected=None):
+        """
+        Finds tilt series across all sessions
+        
+        Parameters:
+            max_res (float, optional) : best resolution (MaxRes) must be better (i.e., smaller) than this
+            min_selected (int, optional) : minimum number of selected micrographs
+        
+        Returns:
+            list of rows (store, MDOC, best & worst resolution, number of selected & total micrographs, min & max tilt angle), best resolution first (tilt series without CTF data last)
+        """
+        
+        condition_list= []
+        parameter_list= []
+        
+        if max_res is not None:
+            condition_list.append("res_best < ?")
+            parameter_list.append(max_res)
+        if min_selected is not None:
+            condition_list.append("num_selected >= ?")
+            parameter_list.append(min_selected)
+        
+        where_clause= f"WHERE {' AND '.join(condition_list)}" if condition_list else ''
+        connection= self.connect()
+        row_list= connection.execute(
+            f"SELECT store, mdoc, res_best, res_worst, num_selected, num_mics, tilt_min, tilt_max FROM tilt_series {where_clause} ORDER BY res_best IS NULL, res_best, store, mdoc", 
+            parameter_list
+            ).fetchall()
+        connection.close()
+        
+        return row_list
+    
+    def printQuery(self, max_res=None, min_selected=None):
+        """
+        Prints the output of query() as a table
+        """
+        
+        row_list= self.query(max_res=max_res, min_selected=min_selected)
+        
+        if self.verbosity>=1:
+            connection= self.connect()
+            num_sessions, num_series= connection.execute("SELECT COUNT(*), SUM(num_series) FROM sessions").fetchone()
+            connection.close()
+            print(f"Found {len(row_list)}/{num_series or 0} tilt series in {num_sessions} sessions")
+        
+        print('\t'.join(['Session', 'MDOC', 'MaxRes', 'Selected', 'TiltRange']))
+        
+        for store_path, curr_mdoc, res_best, res_worst, num_selected, num_mics, tilt_min, tilt_max in row_list:
+            tilt_string, resolution_string= rollupStrings( {'TiltMin': tilt_min, 'TiltMax': tilt_max, 'ResBest': res_best, 'ResWorst': res_worst} )
+            print('\t'.join([store_path, curr_mdoc, resolution_string, f"{num_selected}/{num_mics}", tilt_string]))
+
+class ArtifactScan:
+    """
+    Files in a tilt-series directory, classified by pattern
+    
+    The directory is listed once, and the stat results from the listing are used to find the newest file.
+    """
+    
+    def __init__(self, dir_name, pattern_dict):
+        """
+        Parameters:
+            dir_name (str) : directory to list
+            pattern_dict (dict) : list of filename patterns for each category
+        """
+        
+        self.dir_name= dir_name
+        self.entry_dict= {category : [] for category in pattern_dict}
+        
+        try:
+            with os.scandir(dir_name if dir_name else '.') as entry_iter:
+                for entry in entry_iter:
+                    # Like glob, skip hidden files
+                    if entry.name.startswith('.'): continue
+                    
+                    for category, pattern_list in pattern_dict.items():
+                        if any( fnmatch.fnmatchcase(entry.name, curr_pattern) for curr_pattern in pattern_list ):
+                            self.entry_dict[category].append(entry)
+                    # End category loop
+            # End entry loop
+        except OSError:
+            pass
+    
+    def entries(self, category, prefix=''):
+        """
+        Returns:
+            directory entries in a category, optionally only those starting with a prefix
+        """
+        
+        return [entry for entry in self.entry_dict[category] if entry.name.startswith(prefix)]
+    
+    def paths(self, category, prefix='', sort_by=None):
+        """
+        Parameters:
+            category (str) : file category
+            prefix (str, optional) : required start of filename
+            sort_by (str, optional) : stat attribute to sort by, e.g., 'st_mtime'
+        
+        Returns:
+            list of filenames, including the directory
+        """
+        
+        entry_list= self.entries(category, prefix)
+        if sort_by: entry_list.sort( key=lambda entry: getattr(entry.stat(), sort_by) )
+        
+        return [os.path.join(self.dir_name, entry.name) for entry in entry_list]
+    
+    def latest(self, category, prefix=''):
+        """
+        Parameters:
+            category (str) : file category
+            prefix (str, optional) : required start of filename
+        
+        Returns:
+            newest file (by ctime), or None if no file found
+        """
+        
+        entry_list= self.entries(category, prefix)
+        if len(entry_list) == 0: return None
+        
+        latest_entry= max( entry_list, key=lambda entry: entry.stat().st_ctime )
+        
+        return os.path.join(self.dir_name, latest_entry.name)
+
+class DirectorySnapshot:
+    """
+    Answers file-existence queries from a single listing of each directory, 
+    rather than one (network) round trip per file.
+    
+    Files created, moved, or deleted by Heatwave itself need to be reported with 
+    add(), remove(), or invalidate(), since listings aren't refreshed otherwise.
+    """
+    
+    def __init__(self):
+        self.dir_dict= {}  # Set of filenames, with the directory as the key
+    
+    def listDir(self, dir_name):
+        """
+        Parameter:
+            dir_name : directory
+        
+        Returns:
+            set of filenames (empty if directory doesn't exist)
+        """
+        
+        dir_key= os.path.normpath(dir_name)
+        
+        if dir_key not in self.dir_dict:
+            try:
+                with os.scandir(dir_key) as dir_iterator:
+                    self.dir_dict[dir_key]= set(entry.name for entry in dir_iterator)
+            except OSError:
+                self.dir_dict[dir_key]= set()
+        
+        return self.dir_dict[dir_key]
+    
+    def exists(self, filename):
+        """
+        Parameter:
+            filename : file or directory
+        
+        Returns:
+            boolean : whether file exists
+        """
+        
+        if not filename or filename == 'null': return False
+        
+        dir_name, base_name= os.path.split( os.path.normpath(filename) )
+        
+        # Top-level directory, etc.
+        if base_name in ['', '.', '..']: return os.path.exists(filename)
+        
+        return base_name in self.listDir(dir_name if dir_name else '.')
+    
+    def add(self, filename):
+        """
+        Records a file created since the directory was listed
+        """
+        
+        dir_name, base_name= os.path.split( os.path.normpath(filename) )
+        dir_key= os.path.normpath(dir_name if dir_name else '.')
+        if dir_key in self.dir_dict: self.dir_dict[dir_key].add(base_name)
+    
+    def remove(self, filename):
+        """
+        Records a file (or directory) moved or deleted since the directory was listed
+        """
+        
+        dir_name, base_name= os.path.split( os.path.normpath(filename) )
+        dir_key= os.path.normpath(dir_name if dir_name else '.')
+        if dir_key in self.dir_dict: self.dir_dict[dir_key].discard(base_name)
+        
+        # If it was a directory, forget its contents
+        self.invalidate(filename)
+    
+    def invalidate(self, dir_name=None):
+        """
+        Forgets the listing of a directory, or of all directories if none specified
+        """
+        
+        if dir_name is None:
+            self.dir_dict.clear()
+        else:
+            self.dir_dict.pop(os.path.normpath(dir_name), None)
+
+class DirectoryWatcher:
+    """
+    Reports files added, modified, or removed in a set of directories.
+    Uses inotify if the inotify_simple package is installed (and the platform supports it), and otherwise compares directory listings.
+    Directories which don't exist yet are watched once they appear.
+    """
+    
+    def __init__(self, poll_secs=5):
+        self.poll_secs= poll_secs
+        self.listings= {}  # For polling: size and modification time of each file, with the directory as the key
+        self.missing_dirs= set()  # For inotify: directories to be added once they exist
+        self.wd2dir= {}  # For inotify: directory, with the watch descriptor as the key
+        
+        try:
+            import inotify_simple
+            self.inotify= inotify_simple.INotify()
+            watch_flags= inotify_simple.flags
+            self.watch_mask= watch_flags.CREATE | watch_flags.CLOSE_WRITE | watch_flags.MOVED_TO | watch_flags.MOVED_FROM | watch_flags.DELETE
+        except (ImportError, OSError):
+            self.inotify= None
+    
+    def method(self):
+        return 'inotify' if self.inotify else f"polling every {self.poll_secs} seconds"
+    
+    def dirs(self):
+        """
+        Returns:
+            set of watched directories (including those which don't exist yet)
+        """
+        
+        if self.inotify: return set( self.wd2dir.values() ) | self.missing_dirs
+        
+        return set( self.listings.keys() )
+    
+    def add(self, dir_name):
+        """
+        Starts watching a directory, unless already watched
+        """
+        
+        dir_name= os.path.normpath(dir_name)
+        
+        if self.inotify:
+            if dir_name in self.wd2dir.values(): return
+            try:
+                watch_descriptor= self.inotify.add_watch(dir_name, self.watch_mask)
+                self.wd2dir[watch_descriptor]= dir_name
+                self.missing_dirs.discard(dir_name)
+            except OSError:
+                self.missing_dirs.add(dir_name)
+        elif dir_name not in self.listings:
+            self.listings[dir_name]= self.listDir(dir_name)
+    
+    def listDir(self, dir_name):
+        """
+        Returns:
+            dictionary of [size, mtime (ns)], with the filename as the key (empty if directory doesn't exist)
+            Subdirectories are 'dir' instead, since only their appearance counts (as with inotify), not changes to their files
+        """
+        
+        try:
+            with os.scandir(dir_name) as dir_iterator:
+                return { entry.name: 'dir' if entry.is_dir() else [entry.stat().st_size, entry.stat().st_mtime_ns] for entry in dir_iterator }
+        except OSError:
+            return {}
+    
+    def wait(self, timeout):
+        """
+        Waits for changes
+        
+        Parameter:
+            timeout (float) : maximum time to wait, in seconds (with polling, it's the poll interval instead)
+        
+        Returns:
+            set of paths which changed (empty if none)
+        """
+        
+        changed_paths= set()
+        
+        if self.inotify:
+            for event in self.inotify.read(timeout=int(timeout*1000)):
+                if event.wd in self.wd2dir and event.name: changed_paths.add( os.path.join(self.wd2dir[event.wd], event.name) )
+            
+            # Directories which have appeared in the meantime (their files count as new)
+            for dir_name in list(self.missing_dirs):
+                self.add(dir_name)
+                if dir_name not in self.missing_dirs: 
+                    changed_paths.update( os.path.join(dir_name, file_name) for file_name in self.listDir(dir_name) )
+        else:
+            time.sleep(self.poll_secs)
+            dir_list= list( self.listings.keys() )
+            
+            for dir_name, new_listing in zip( dir_list, parallelMap(self.listDir, dir_list, jobs=IO_WORKERS) ):
+                old_listing= self.listings[dir_name]
+                if new_listing == old_listing: continue
+                
+                for file_name in set(old_listing) | set(new_listing):
+                    if old_listing.get(file_name) != new_listing.get(file_name): changed_paths.add( os.path.join(dir_name, file_name) )
+                
+                self.listings[dir_name]= new_listing
+            # End directory loop
+        
+        return changed_paths
+    
+    def close(self):
+        if self.inotify: self.inotify.close()
+
+class MdocZValue:
+    """
+    Data for a single ZValue (i.e., micrograph) of an MDOC file
+    
+    Attributes:
+        lines (list) : stripped lines, in order
+        items (dict) : values (str) of 'key = value' lines, with the key as the dictionary key
+        zvalue (int)
+        tilt_angle (float)
+        dose_rate (float)
+        exposure_time (float)
+        subframe_path (str) : as written in the MDOC (may be a Windows path)
+        datetime (str)
+    """
+    
+    __slots__= ['lines', 'items', 'zvalue', 'tilt_angle', 'dose_rate', 'exposure_time', 'subframe_path', 'datetime']
+    
+    def __init__(self):
+        self.lines= []
+        self.items= {}
+        self.zvalue= None
+        self.tilt_angle= None
+        self.dose_rate= None
+        self.exposure_time= None
+        self.subframe_path= ''
+        self.datetime= None
+    
+    def addLine(self, line):
+        """
+        Parameter:
+            line (str) : stripped MDOC line
+        """
+        
+        self.lines.append(line)
+        
+        key_value= line.split('=')
+        if len(key_value) < 2: return
+        key= key_value[0].strip()
+        value= key_value[1].strip()
+        self.items[key]= value
+        
+        try:
+            if key == '[ZValue':
+                self.zvalue= int( value.split(']')[0] )
+            elif key == 'TiltAngle':
+                self.tilt_angle= float(value)
+            elif key == 'DoseRate':
+                self.dose_rate= float(value)
+            elif key == 'ExposureTime':
+                self.exposure_time= float(value)
+            elif key == 'SubFramePath':
+                self.subframe_path= value
+            elif key == 'DateTime':
+                self.datetime= value
+        except ValueError:
+            print(f"WARNING! Can't parse MDOC line '{line}'")
+    
+    @property
+    def subframe(self):
+        """
+        Basename of SubFramePath
+        """
+        
+        return ntpath.basename(self.subframe_path)
+
+class TiltSeries(list):
+    """
+    Data for one tilt series: [general dictionary, dictionary for each micrograph]
+    
+    It's a list, so it's saved in the same JSON layout as before, 
+    but it also remembers the order of the micrographs, sorted by angle.
+    Micrographs remain plain dictionaries, with the values as in the MDOC file.
+    """
+    
+    __slots__= ['sorted_keys']
+    
+    def __init__(self, general_and_tilt=None):
+        super().__init__( general_and_tilt if general_and_tilt is not None else [{}, {}] )
+        self.sorted_keys= None
+    
+    def sortedKeys(self):
+        """
+        Returns:
+            micrograph keys, sorted by angle (sorted only once)
+        """
+        
+        if self.sorted_keys is None or len(self.sorted_keys) != len(self[1]): 
+            self.sorted_keys= sortTiltKeys(self[1])
+        
+        return self.sorted_keys
+
+class MdocColumnAttrs:
+    """
+    Contains attributes for each item displayed from the MDOC file:
+        width
+        format
+    """
+
+    def __init__(self, column_list=[]):
+        self.keys=column_list
+        self.column_dict={}
+
+    def add_column(self, name, width, format, align=None):
+        self.keys.append(name)
+        self.column_dict[name]= argparse.Namespace()
+        self.column_dict[name].width=width
+        self.column_dict[name].format=format
         self.column_dict[name].align=align
 
-    def list_info(self):
-        longest=-1
-        for key in self.keys:
-            if len(key)>longest: longest=len(key)
+    def list_info(self):
+        longest=-1
+        for key in self.keys:
+            if len(key)>longest: longest=len(key)
+
+        print("Keys:")
+        for key in self.keys:
+            string2print=f"  {key.ljust(longest)}: "
+            string2print+=f"{self.column_dict[key].width}\t"
+            string2print+=f"{self.column_dict[key].format}\t"
+            print(string2print)
+
+class CustomStandardItem(QStandardItem):
+    """
+    A QStandardItem plus an image
+    The image is decoded in the background by image_loader (an ImageLoader), with a placeholder shown until it's ready.
+    Only the filename and size are kept, since the pixmap may be evicted from the cache (see PixmapCache).
+    """
+    
+    image_loader= None  # Shared by all items (see MdocTreeView.__init__)
+    
+    def __init__(self, icon, text='', size=256, debug=False, id=None, is_checkable=False):
+        """
+        Parameters:
+            icon : image file
+            text (optional) : text places to the right of the image
+            size (optional) : image size
+            debug (optional) : print debug info
+            id (optional) : text label for debug info
+            is_checkable (boolean) : flag to add checkbox
+        """
+        
+        super().__init__(text)
+        self.debug=debug
+        if id: self.filename= os.path.basename(id)
+        
+        self.image_path= icon
+        self.image_size= size
+        
+        if is_checkable: 
+            self.setCheckable(True)
+            self.setCheckState(2)  # 1 is intermediate
+
+    def data(self, role):
+        if role == QtCore.Qt.DecorationRole:
+            # If not decoded yet, the item will be refreshed once it is
+            pixmap= self.image_loader.pixmap(self.image_path, self.image_size, item=self)
+            if pixmap is None: pixmap= self.image_loader.placeholder(self.image_size)
+            
+            return pixmap
+        
+        return super().data(role)
+
+class ImageLoader(QObject):
+    """
+    Decodes images, scaled to fit a given size, on a QThreadPool, so that the GUI doesn't wait for the file system or the decoding
+    Pixmaps have to be created in the GUI thread, so the decoded QImage is signaled back.
+    
+    Scaled images are also saved in a cache directory, so that later sessions needn't decode the originals again. 
+    Cached files are named after the original's path, and its size and modification time (see cacheFile), 
+    so that a modified original won't match, and its outdated files are removed.
+    """
+    
+    loaded= pyqtSignal(object, object)  # (path, size), QImage
+    
+    def __init__(self, max_bytes=256*1024*1024, cache_dir=None):
+        """
+        Parameters:
+            max_bytes (int) : memory budget for decoded images
+            cache_dir (optional) : directory for scaled images (None: no cache)
+        """
+        
+        super().__init__()
+        self.cache_dir= cache_dir
+        
+        if self.cache_dir:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+            except OSError as e:
+                print(f"WARNING! Can't create image cache '{self.cache_dir}' ({e}), continuing without it")
+                self.cache_dir= None
+        
+        self.thread_pool= QtCore.QThreadPool()
+        self.cache= PixmapCache(max_bytes)  # Decoded images, with (path, size) as the key
+        self.queued= set()  # Keys being decoded
+        self.waiting_items= {}  # Items to refresh once their image is ready (by id), with (path, size) as the key
+        self.placeholders= {}  # Blank pixmap for each size
+        self.loaded.connect(self.storeImage)
+    
+    def pixmap(self, path, size, item=None):
+        """
+        Parameters:
+            path : image file
+            size (int) : maximum width and height
+            item (optional) : item to refresh (with emitDataChanged) once the image is ready
+        
+        Returns:
+            QPixmap, or None if it isn't ready yet (decoding is started if necessary)
+        """
+        
+        image_key= (path, size)
+        
+        # Already being decoded (which doesn't count as a miss again)
+        if image_key not in self.queued:
+            pixmap= self.cache.get(image_key)
+            if pixmap is not None: 
+                self.cache.unpin(image_key)  # Shown now, so it may be evicted
+                return pixmap
+        
+        if item is not None: self.waiting_items.setdefault(image_key, {})[ id(item) ]= item
+        self.request(path, size)
+        
+        return None
+    
+    def request(self, path, size):
+        """
+        Starts decoding an image, unless already decoded or queued
+        """
+        
+        image_key= (path, size)
+        if image_key in self.queued or self.cache.contains(image_key): return
+        
+        self.queued.add(image_key)
+        self.thread_pool.start( ImageTask(self, path, size) )
+    
+    def storeImage(self, image_key, image):
+        """
+        Receives a decoded image (in the GUI thread), and refreshes the items waiting for it
+        """
+        
+        self.queued.discard(image_key)
+        self.cache.put( image_key, QtGui.QPixmap.fromImage(image) )
+        
+        # Kept until painted, since otherwise, if the images on screen exceed the budget, they would keep evicting each other
+        if image_key in self.waiting_items: self.cache.pin(image_key)
+        
+        for item in self.waiting_items.pop(image_key, {}).values():
+            try:
+                item.emitDataChanged()
+            except RuntimeError:
+                pass  # The row was removed in the meantime (see MdocTreeView.releaseMicrographs)
+    
+    def cacheFile(self, path, size):
+        """
+        Parameters:
+            path : original image file
+            size (int) : maximum width and height
+        
+        Returns:
+            filename in the cache directory (which may not exist yet), or None if there's no cache or the original is absent
+        """
+        
+        if not self.cache_dir: return None
+        
+        return thumbCacheFile(self.cache_dir, path, size)
+    
+    def saveCached(self, cache_file, image):
+        """
+        Saves a scaled image in the cache, and removes files from older versions of the same original
+        (This runs in the worker threads.)
+        """
+        
+        # Written under a temporary name, so that other sessions never read an incomplete file
+        temp_file= f"{cache_file}.{os.getpid()}.tmp"
+        try:
+            if not image.save(temp_file, 'PNG'): return
+            os.replace(temp_file, cache_file)
+        except OSError:
+            return
+        
+        removeOutdatedCacheFiles(cache_file)
+    
+    def placeholder(self, size):
+        """
+        Returns:
+            blank QPixmap, shown while an image is being decoded
+        """
+        
+        if size not in self.placeholders:
+            self.placeholders[size]= QtGui.QPixmap(size, size)
+            self.placeholders[size].fill( QtGui.QColor('lightgray') )
+        
+        return self.placeholders[size]
+
+def thumbCacheFile(cache_dir, path, size):
+    """
+    Names a scaled image in the cache directory after the original's path, and its size and modification time, 
+    so that a modified original won't match
+    
+    Parameters:
+        cache_dir : cache directory
+        path : original image file
+        size (int) : maximum width and height
+    
+    Returns:
+        filename in the cache directory (which may not exist yet), or None if the original is absent
+    """
+    
+    try:
+        file_stat= os.stat(path)
+    except OSError:
+        return None
+    
+    path_hash= hashlib.sha1( os.path.abspath(path).encode() ).hexdigest()[:16]
+    version_hash= hashlib.sha1( f"{file_stat.st_size} {file_stat.st_mtime_ns}".encode() ).hexdigest()[:12]
+    
+    return os.path.join(cache_dir, f"{path_hash}_{version_hash}_{size}.png")
+
+def removeOutdatedCacheFiles(cache_file):
+    """
+    Removes the scaled images of older versions of the same original (see thumbCacheFile), of any size
+    
+    Parameter:
+        cache_file : current file in the cache directory
+    """
+    
+    cache_dir= os.path.dirname(cache_file)
+    path_hash, version_hash= os.path.basename(cache_file).split('_')[:2]
+    
+    for old_file in glob.glob( os.path.join(cache_dir, path_hash + '_*.png') ):
+        if not os.path.basename(old_file).startswith(f"{path_hash}_{version_hash}_"):
+            try:
+                os.remove(old_file)
+            except OSError:
+                pass  # Maybe removed by another session
+
+class PixmapCache:
+    """
+    Pixmaps, up to a memory budget, evicting the least recently used
+    Pinned pixmaps (i.e., decoded but not shown yet) aren't evicted, up to the budget.
+    """
+    
+    MIN_BYTES= 16*1024*1024  # Smaller budgets are raised to this
+    
+    def __init__(self, max_bytes):
+        """
+        Parameter:
+            max_bytes (int) : memory budget
+        """
+        
+        self.max_bytes= max(max_bytes, self.MIN_BYTES)
+        self.num_bytes= 0
+        self.pixmaps= collections.OrderedDict()  # Least recently used first
+        self.pinned= collections.OrderedDict()  # Keys not to be evicted (values unused), oldest first
+        self.num_hits= 0
+        self.num_misses= 0
+    
+    def contains(self, key):
+        return key in self.pixmaps
+    
+    def get(self, key):
+        """
+        Returns:
+            QPixmap, or None if not cached
+        """
+        
+        if key not in self.pixmaps:
+            self.num_misses+= 1
+            return None
+        
+        self.num_hits+= 1
+        self.pixmaps.move_to_end(key)
+        
+        return self.pixmaps[key]
+    
+    def put(self, key, pixmap):
+        """
+        Adds a pixmap, evicting others (except pinned ones) if over budget (the newest is kept, even if over budget by itself)
+        """
+        
+        if key in self.pixmaps: self.num_bytes-= pixmapBytes( self.pixmaps.pop(key) )
+        
+        self.pixmaps[key]= pixmap
+        self.num_bytes+= pixmapBytes(pixmap)
+        
+        for old_key in list( self.pixmaps.keys() ):
+            if self.num_bytes <= self.max_bytes: break
+            if old_key == key or old_key in self.pinned: continue
+            self.num_bytes-= pixmapBytes( self.pixmaps.pop(old_key) )
+        # End eviction loop
+    
+    def pin(self, key):
+        """
+        Keeps a cached pixmap from being evicted until unpinned.
+        Pins of items which are never shown (e.g., scrolled away before the image was ready) would otherwise accumulate, 
+        so if the pinned pixmaps exceed the budget, the oldest pins are dropped.
+        """
+        
+        if key not in self.pixmaps: return
+        
+        self.pinned[key]= None
+        self.pinned.move_to_end(key)
+        
+        pinned_bytes= sum( pixmapBytes(self.pixmaps[pinned_key]) for pinned_key in self.pinned.keys() if pinned_key in self.pixmaps )
+        while pinned_bytes > self.max_bytes and len(self.pinned) > 1:
+            old_key= self.pinned.popitem(last=False)[0]
+            if old_key in self.pixmaps: pinned_bytes-= pixmapBytes(self.pixmaps[old_key])
+    
+    def unpin(self, key):
+        self.pinned.pop(key, None)
+    
+    def summary(self):
+        """
+        Returns:
+            string with the hit & miss counts, and the memory used
+        """
+        
+        num_lookups= self.num_hits + self.num_misses
+        hit_rate= 100*self.num_hits/num_lookups if num_lookups else 0
+        
+        return f"{self.num_hits} hits, {self.num_misses} misses ({hit_rate:.1f}%), {len(self.pixmaps)} images, {self.num_bytes/1024/1024:.1f}/{self.max_bytes/1024/1024:.0f} MB"
+
+def pixmapBytes(pixmap):
+    """
+    Returns:
+        approximate memory used by a QPixmap
+    """
+    
+    return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
 
-        print("Keys:")
-        for key in self.keys:
-            string2print=f"  {key.ljust(longest)}: "
-            string2print+=f"{self.column_dict[key].width}\t"
-            string2print+=f"{self.column_dict[key].format}\t"
-            print(string2print)
+class ImageTask(QRunnable):
+    """
+    Decodes one image for ImageLoader, in a worker thread
+    """
+    
+    def __init__(self, loader, path, size):
+        super().__init__()
+        self.loader= loader
+        self.path= path
+        self.size= size
+    
+    def run(self):
+        cache_file= self.loader.cacheFile(self.path, self.size)
+        
+        # Scaled previously
+        if cache_file and os.path.exists(cache_file):
+            image= QtGui.QImage(cache_file)
+            if not image.isNull():
+                self.loader.loaded.emit( (self.path, self.size), image )
+                return
+        
+        image= QtGui.QImage(self.path)
+        
+        # Like QIcon.pixmap, images are shrunk to fit, but not enlarged (in which case there's nothing to save)
+        if not image.isNull() and ( image.width() > self.size or image.height() > self.size ):
+            image= image.scaled(self.size, self.size, QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)
+            if cache_file: self.loader.saveCached(cache_file, image)
+        
+        self.loader.loaded.emit( (self.path, self.size), image )
 
-class CustomStandardItem(QtGui.QStandardItem):
+class LazyTreeModel(QStandardItemModel):
     """
-    A QStandardItem plus an image
+    A QStandardItemModel whose tilt series get their micrograph rows only when expanded
+    
+    Tilt-series items have their MDOC under Qt.UserRole. 
+    Until they have rows, they report children anyway, so that they can be expanded.
     """
     
-    def __init__(self, icon, text='', size=256, debug=False, id=None, is_checkable=False):
+    def __init__(self, fetch_function):
         """
-        Parameters:
-            icon : image
-            text (optional) : text places to the right of the image
-            size (optional) : image size
-            debug (optional) : print debug info
-            id (optional) : text label for debug info
-            is_checkable (boolean) : flag to add checkbox
+        Parameter:
+            fetch_function : function which adds the rows to a tilt-series item
         """
         
-        super().__init__(text)
-        self.debug=debug
-        if id: self.filename= os.path.basename(id)
+        super().__init__()
+        self.fetch_function= fetch_function
+    
+    def isUnfetched(self, index):
+        if not index.isValid() or index.column() != 0: return False
+        item= self.itemFromIndex(index)
         
-        if isinstance(icon, QtGui.QIcon):
-            self.my_icon= icon
+        return item.rowCount() == 0 and find_depth(item) == 1 and item.data(QtCore.Qt.UserRole) is not None
+    
+    def hasChildren(self, index=None):
+        if index is None: index= QtCore.QModelIndex()
+        return self.isUnfetched(index) or super().hasChildren(index)
+    
+    def canFetchMore(self, index):
+        return self.isUnfetched(index) or super().canFetchMore(index)
+    
+    def fetchMore(self, index):
+        if self.isUnfetched(index):
+            self.fetch_function( self.itemFromIndex(index) )
         else:
-            self.my_icon= QtGui.QIcon(icon)
-        
-        self.setIcon(self.my_icon)
-        self._icon_size = QtCore.QSize(size, size)
-        
-        if is_checkable: 
-            self.setCheckable(True)
-            self.setCheckState(2)  # 1 is intermediate
-
-    def data(self, role):
-        # Refreshes the image (I think?)
-        
-        if role == QtCore.Qt.DecorationRole:
-            icon = super().data(role)
-            if icon and isinstance(icon, QtGui.QIcon):
-                pixmap = self.my_icon.pixmap(self._icon_size)
-                return pixmap
-        return super().data(role)
+            super().fetchMore(index)
 
-class LineEditDelegate(QtWidgets.QStyledItemDelegate):
+class LineEditDelegate(QStyledItemDelegate):
     def __init__(self, column=1):
         super().__init__()
         self.column= column 
@@ -2419,59 +4529,517 @@ class LineEditDelegate(QtWidgets.QStyledItemDelegate):
         else:
             super().setEditorData(editor, index)
 
-    def setModelData(self, editor, model, index):
-        if index.column() == self.column:
-            model.setData(index, editor.text(), QtCore.Qt.EditRole)
-        else:
-            super().setModelData(editor, model, index)
+    def setModelData(self, editor, model, index):
+        if index.column() == self.column:
+            model.setData(index, editor.text(), QtCore.Qt.EditRole)
+        else:
+            super().setModelData(editor, model, index)
+
+def grep(pattern, file):
+    """
+    Looks for string in a file (From https://blog.gitnux.com/code/python-grep/)
+    
+    Parameters:
+        pattern (str) : pattern to search
+        file (str) : filename
+    
+    Returns:
+        list of matching lines
+    """
+    
+    with open(file, 'r') as f:
+        lines = f.readlines()
+
+    matched_lines = [line for line in lines if re.search(pattern, line)]
+
+    return matched_lines
+
+def progressBar(iterable, unit='', disable=False):
+    """
+    Wraps an iterable in a tqdm progress bar (tqdm is only imported if the bar is shown)
+    
+    Parameters:
+        iterable : items to loop through
+        unit (str) : label for the count
+        disable (bool) : flag to not show the bar
+    
+    Returns:
+        iterable
+    """
+    
+    if disable: return iterable
+    
+    import tqdm
+    
+    return tqdm.tqdm(iterable, unit=unit)
+
+def parallelMap(function, item_list, jobs=1):
+    """
+    Applies a function to each item of a list, optionally using a pool of threads
+    
+    Threads rather than processes are used, since the work is mostly waiting on the (network) file system, 
+    and since bound methods of a Qt window can't be pickled.
+    
+    Parameters:
+        function : function taking a single argument
+        item_list (list) : list of arguments
+        jobs (int) : number of parallel workers (1: serial)
+    
+    Returns:
+        generator of results, in the same order as item_list 
+        (closing it early, e.g., after a KeyboardInterrupt, cancels the items not yet started)
+    """
+    
+    if jobs is None or jobs <= 1 or len(item_list) <= 1:
+        for item in item_list: yield function(item)
+        return
+    
+    executor= concurrent.futures.ThreadPoolExecutor( max_workers=min(jobs, len(item_list)) )
+    
+    # Submit everything up front, and hand back results in order
+    try:
+        future_list= [executor.submit(function, item) for item in item_list]
+        for future in future_list: yield future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def indexCtfSummary(summary_file):
+    """
+    Reads a CTF summary in one pass, e.g.:
+        MOVIE_STEM:    	1.000000 25123.45 24987.65 -45.67 0.000000 0.09876 6.543210
+    
+    The summary is appended to, so if a micrograph occurs more than once, the last entry wins.
+    The result is cached until the file changes.
+    
+    Parameter:
+        summary_file : CTF summary file
+    
+    Returns:
+        dictionary of split lines, with the micrograph stem as the key
+    """
+    
+    summary_signature= fileSignature(summary_file)
+    
+    if summary_file in CTF_SUMMARY_CACHE:
+        cached_signature, ctf_index= CTF_SUMMARY_CACHE[summary_file]
+        if cached_signature == summary_signature: return ctf_index
+    
+    ctf_index= {}
+    
+    if summary_signature:
+        with open(summary_file, 'r') as f:
+            for line in f:
+                split_line= line.split()
+                if split_line: ctf_index[ split_line[0].rstrip(':') ]= split_line
+    
+    CTF_SUMMARY_CACHE[summary_file]= (summary_signature, ctf_index)
+    
+    return ctf_index
+
+def expandInputFiles(string2split, extension=None):
+    """
+    Expands a space-delimited string (which may include wild cards) and returns a list of files
+    
+    Parameters:
+        string2split : space-delimited string (which may include wild cards)
+        extension (optional) : only files with this extension will be used
+    
+    Returns:
+        a list of files
+    """
+    
+    file_list=[]
+    list_strings=string2split.split()
+    
+    for curr_string in list_strings:
+        list_expanded= parallelGlob(curr_string)
+        list_sorted= sorted(list_expanded)
+        
+        for fn in list_sorted:
+            if extension:
+                if os.path.splitext(fn)[1] == extension: 
+                    file_list.append(fn)
+            else:
+                file_list.append(fn)
+    
+    # Remove duplicates (if patterns overlap), keeping the first
+    return list( dict.fromkeys(file_list) )
+
+def parallelGlob(pattern, jobs=IO_WORKERS):
+    """
+    Like glob.glob, but the directories at each level of the pattern are listed concurrently
+    (e.g., for '5-Tomo/*/*.mdoc', all of the tilt-series directories are listed at the same time).
+    
+    Parameters:
+        pattern (str) : file pattern, which may include wild cards
+        jobs (int) : number of threads
+    
+    Returns:
+        list of matching paths (unsorted, as with glob.glob)
+    """
+    
+    magic_check= re.compile('[*?[]')
+    component_list= pattern.split(os.sep)
+    
+    # Leave unusual patterns (e.g., with double separators or a trailing separator) to glob
+    if '' in component_list[1:]: return glob.glob(pattern)
+    
+    # Directory before the first wild card
+    first_magic= next( (comp_idx for comp_idx, comp in enumerate(component_list) if magic_check.search(comp)), None )
+    if first_magic is None: return [pattern] if os.path.lexists(pattern) else []
+    
+    base_dir= os.sep.join(component_list[:first_magic])
+    if component_list[0] == '' and first_magic == 1: base_dir= os.sep  # absolute path
+    path_list= [base_dir]
+    
+    for comp_idx in range(first_magic, len(component_list)):
+        curr_comp= component_list[comp_idx]
+        is_last= comp_idx == len(component_list) - 1
+        
+        def matchDir(dir_name):
+            # Like glob, hidden files match only if the pattern starts with a dot
+            try:
+                with os.scandir(dir_name if dir_name else os.curdir) as entry_iter:
+                    return [
+                        os.path.join(dir_name, entry.name) for entry in entry_iter 
+                        if ( curr_comp.startswith('.') or not entry.name.startswith('.') ) 
+                        and fnmatch.fnmatch(entry.name, curr_comp) 
+                        and ( is_last or entry.is_dir() )
+                        ]
+            except OSError:
+                return []
+        
+        def matchLiteral(dir_name):
+            curr_path= os.path.join(dir_name, curr_comp)
+            return [curr_path] if ( os.path.lexists(curr_path) if is_last else os.path.isdir(curr_path) ) else []
+        
+        match_function= matchDir if magic_check.search(curr_comp) else matchLiteral
+        path_list= [curr_path for match_list in parallelMap(match_function, path_list, jobs=jobs) for curr_path in match_list]
+    # End component loop
+    
+    return path_list
+        
+def iterTiltSeries(target_data):
+    """
+    Iterates through the tilt series of a target file, skipping other entries (e.g., the CtfByTS plot)
+    
+    Parameter:
+        target_data (dict) : data for one target file
+    
+    Yields:
+        MDOC filename, tilt-series data
+    """
+    
+    for curr_mdoc, general_and_tilt in target_data.items():
+        if isinstance(general_and_tilt, list): yield curr_mdoc, general_and_tilt
+
+def sortTiltKeys(tilt_data):
+    """
+    Sorts micrographs of a tilt series by angle
+    
+    Parameter:
+        tilt_data (dict) : data for each micrograph
+    
+    Returns:
+        list of keys of tilt_data
+    """
+    
+    return sorted( tilt_data.keys(), key=lambda tilt_key: float(tilt_data[tilt_key]['TiltAngle']) )
+
+def typeJsonData(json_data):
+    """
+    Converts tilt series as read from JSON (lists) to TiltSeries objects
+    
+    Parameter:
+        json_data (dict, modified) : metadata, in the JSON layout
+    
+    Returns:
+        json_data
+    """
+    
+    for curr_target in json_data.keys():
+        target_data= json_data[curr_target]
+        for curr_mdoc, general_and_tilt in iterTiltSeries(target_data):
+            if isinstance(general_and_tilt, TiltSeries): continue
+            target_data[curr_mdoc]= TiltSeries(general_and_tilt)
+    
+    return json_data
+
+def tiltSeriesRollup(general_and_tilt, snapshot=None):
+    """
+    Computes summary statistics for a tilt series, so that they needn't be recomputed from each micrograph
+    Micrographs without a selection flag are counted as selected, and the flag is set.
+    
+    Parameters:
+        general_and_tilt (list, modified) : tilt-series data
+        snapshot (DirectorySnapshot, optional) : directory listings to check instead of the file system
+    
+    Returns:
+        dictionary, which is also stored in the header dictionary under ROLLUP_KEY
+    """
+    
+    general, tilt_data= general_and_tilt
+    tilt_list= [ float(mic_data['TiltAngle']) for mic_data in tilt_data.values() if 'TiltAngle' in mic_data ]
+    res_list= [ float(mic_data['MaxRes']) for mic_data in tilt_data.values() if mic_data.get('MaxRes') is not None ]
+    
+    rollup= {
+        'TiltMin': min(tilt_list, default=None),
+        'TiltMax': max(tilt_list, default=None),
+        'ResBest': min(res_list, default=None),
+        'ResWorst': max(res_list, default=None),
+        'NumMics': len(tilt_data),
+        'Artifacts': artifactRollup(general_and_tilt, snapshot=snapshot),
+        }
+    
+    general[ROLLUP_KEY]= rollup
+    updateSelectionRollup(general_and_tilt)
+    
+    return rollup
+
+def artifactRollup(general_and_tilt, snapshot=None):
+    """
+    Counts the files of a tilt series which exist, for the tilt series itself and summed over its micrographs
+    
+    Parameters:
+        general_and_tilt (list) : tilt-series data
+        snapshot (DirectorySnapshot, optional) : directory listings to check instead of the file system
+    
+    Returns:
+        dictionary of counts, for each of TS_ARTIFACT_KEYS & MIC_ARTIFACT_KEYS
+    """
+    
+    general, tilt_data= general_and_tilt
+    artifacts= { curr_key: int( definedAndExists(curr_key, general, snapshot=snapshot) ) for curr_key in TS_ARTIFACT_KEYS }
+    
+    for curr_key in MIC_ARTIFACT_KEYS:
+        artifacts[curr_key]= sum( definedAndExists(curr_key, mic_data, snapshot=snapshot) for mic_data in tilt_data.values() )
+    
+    return artifacts
+
+def updateSelectionRollup(general_and_tilt):
+    """
+    Updates the selection counts in the rollup of a tilt series (computing the whole rollup if there is none yet)
+    
+    Parameter:
+        general_and_tilt (list, modified) : tilt-series data
+    """
+    
+    general, tilt_data= general_and_tilt
+    if ROLLUP_KEY not in general: 
+        tiltSeriesRollup(general_and_tilt)
+        return
+    
+    for mic_data in tilt_data.values():
+        if 'MicSelected' not in mic_data: mic_data['MicSelected']= True
+    
+    num_selected= sum( bool(mic_data['MicSelected']) for mic_data in tilt_data.values() )
+    general[ROLLUP_KEY]['NumSelected']= num_selected
+    general[ROLLUP_KEY]['NumDeselected']= len(tilt_data) - num_selected
+
+def targetRollup(target_data):
+    """
+    Combines the rollups of the tilt series of a target file (i.e., without looking at any micrographs)
+    
+    Parameter:
+        target_data (dict, modified) : data for one target file
+    
+    Returns:
+        dictionary, which is also stored in target_data under ROLLUP_KEY
+    """
+    
+    ts_rollups= [ general_and_tilt[0][ROLLUP_KEY] for curr_mdoc, general_and_tilt in iterTiltSeries(target_data) ]
+    
+    def combine(stat_key, function):
+        stat_list= [ ts_rollup[stat_key] for ts_rollup in ts_rollups if ts_rollup[stat_key] is not None ]
+        return function(stat_list, default=None)
+    
+    rollup= {
+        'TiltMin': combine('TiltMin', min),
+        'TiltMax': combine('TiltMax', max),
+        'ResBest': combine('ResBest', min),
+        'ResWorst': combine('ResWorst', max),
+        'NumTiltSeries': len(ts_rollups),
+        'NumSelectedTiltSeries': sum( ts_rollup['NumSelected'] > 0 for ts_rollup in ts_rollups ),
+        'NumMics': sum( ts_rollup['NumMics'] for ts_rollup in ts_rollups ),
+        'NumSelected': sum( ts_rollup['NumSelected'] for ts_rollup in ts_rollups ),
+        'NumDeselected': sum( ts_rollup['NumDeselected'] for ts_rollup in ts_rollups ),
+        'Artifacts': { curr_key: sum( ts_rollup['Artifacts'].get(curr_key, 0) for ts_rollup in ts_rollups ) for curr_key in TS_ARTIFACT_KEYS + MIC_ARTIFACT_KEYS },
+        }
+    
+    target_data[ROLLUP_KEY]= rollup
+    
+    return rollup
+
+def rollupStrings(rollup):
+    """
+    Formats the extrema of a rollup for display
+    
+    Parameter:
+        rollup (dict) : output of tiltSeriesRollup or targetRollup
+    
+    Returns:
+        tilt range (str), resolution range (str)
+    """
+    
+    if rollup['TiltMin'] is None:
+        tilt_string= ''
+    elif rollup['TiltMax'] > 0:
+        tilt_string= f"{rollup['TiltMin']:.1f} to +{rollup['TiltMax']:.1f}"
+    else:
+        tilt_string= f"{rollup['TiltMin']:.1f} to {rollup['TiltMax']:.1f}"
+    
+    if rollup['ResBest'] is None:
+        resolution_string= ''
+    else:
+        resolution_string= f"{rollup['ResBest']:.1f} to {rollup['ResWorst']:.1f}"
+    
+    return tilt_string, resolution_string
+
+def carryEdits(general_and_tilt, old_entry):
+    """
+    Copies selections and notes from a previous version of a tilt series, matching micrographs by movie
+    
+    Parameters:
+        general_and_tilt (list, modified) : new tilt-series data
+        old_entry (list) : previous tilt-series data
+    """
+    
+    for curr_key in ['MdocSelected', 'TextNote']:
+        if curr_key in old_entry[0]: general_and_tilt[0][curr_key]= old_entry[0][curr_key]
+    
+    old_selections= { subframeStem( mic_data.get('SubFramePath') ): mic_data.get('MicSelected', True) for mic_data in old_entry[1].values() }
+    
+    for mic_data in general_and_tilt[1].values():
+        movie_stem= subframeStem( mic_data.get('SubFramePath') )
+        if movie_stem in old_selections: mic_data['MicSelected']= old_selections[movie_stem]
+    
+    updateSelectionRollup(general_and_tilt)
+
+def subframeStem(subframe_path):
+    """
+    Returns:
+        movie filename without directory (Windows or Linux) or extension, used to match micrographs between MDOCs
+        None if no path
+    """
+    
+    if not subframe_path: return None
+    
+    return os.path.splitext( ntpath.basename(subframe_path) )[0]
+
+def mdocStem(curr_mdoc):
+    """
+    Returns:
+        MDOC basename without extension, or None if the extension isn't '.mdoc'
+        (TFS MDOCs may end in simply '.mdoc' rather than '.mrc.mdoc')
+    """
+    
+    mdoc_base= os.path.basename(curr_mdoc)
+    
+    if mdoc_base.endswith('.mrc.mdoc'):
+        return mdoc_base[:-len('.mrc.mdoc')]
+    elif mdoc_base.endswith('.mdoc'):
+        return mdoc_base[:-len('.mdoc')]
+    else:
+        return None
 
-def grep(pattern, file):
+def micPath(path_template, curr_mdoc, mdoc_base, movie_base, thumb_idx):
     """
-    Looks for string in a file (From https://blog.gitnux.com/code/python-grep/)
+    Generates a micrograph path from a template (see MdocTreeView.pathTemplates)
     
     Parameters:
-        pattern (str) : pattern to search
-        file (str) : filename
+        path_template (dict) : directory, whether it's relative to the MDOC directory, and filename pattern
+        curr_mdoc (str) : MDOC file
+        mdoc_base (str) : MDOC basename without extension
+        movie_base (str) : movie basename
+        thumb_idx (int) : index of micrograph when sorted by angle
     
     Returns:
-        list of matching lines
+        path
     """
     
-    with open(file, 'r') as f:
-        lines = f.readlines()
-
-    matched_lines = [line for line in lines if re.search(pattern, line)]
-
-    return matched_lines
+    directory= path_template['dir']
+    if path_template['in_mdoc_dir']: directory= os.path.join(os.path.dirname(curr_mdoc), directory)
+    
+    filename= path_template['name'].format(
+        movie= movie_base, 
+        stem= os.path.splitext(movie_base)[0], 
+        mdoc_base= mdoc_base, 
+        idx= str(thumb_idx).zfill(3)  # pad to 3 digits
+        )
+    
+    return os.path.join(directory, filename)
 
-def expandInputFiles(string2split, extension=None):
+def compactPaths(json_data, path_templates):
     """
-    Expands a space-delimited string (which may include wild cards) and returns a list of files
+    Compresses micrograph paths: those which match the templates are omitted, and the templates are saved once
     
     Parameters:
-        string2split : space-delimited string (which may include wild cards)
-        extension (optional) : only files with this extension will be used
+        json_data : metadata, in the JSON layout (not modified)
+        path_templates (dict) : template for each of PATH_KEYS
     
     Returns:
-        a list of files
+        compressed copy of the metadata, with the templates under PATHS_KEY
     """
     
-    file_list=[]
-    list_strings=string2split.split()
+    compact_data= {PATHS_KEY: path_templates}
     
-    for curr_string in list_strings:
-        list_expanded= glob.glob(curr_string)
-        list_sorted= sorted(list_expanded)
+    for curr_target in json_data.keys():
+        compact_data[curr_target]= dict( json_data[curr_target] )
         
-        for fn in list_sorted:
-            if extension:
-                if os.path.splitext(fn)[1] == extension: 
-                    file_list.append(fn)
-            else:
-                file_list.append(fn)
+        for curr_mdoc, general_and_tilt in iterTiltSeries(json_data[curr_target]):
+            mdoc_base= mdocStem(curr_mdoc)
+            tilt_data= general_and_tilt[1]
+            compact_tilt= {}
+            
+            for sorted_idx, tilt_key in enumerate( sortTiltKeys(tilt_data) ):
+                mic_data= tilt_data[tilt_key]
+                movie_base= ntpath.basename( mic_data.get('SubFramePath', '') )
+                
+                compact_tilt[tilt_key]= { 
+                    mic_key: mic_value for mic_key, mic_value in mic_data.items() 
+                    if mic_key not in path_templates or mdoc_base is None or 
+                    mic_value != micPath(path_templates[mic_key], curr_mdoc, mdoc_base, movie_base, sorted_idx) 
+                    }
+            # End micrograph loop
+            
+            # Keep the original order of the micrographs
+            compact_data[curr_target][curr_mdoc]= [ general_and_tilt[0], {tilt_key: compact_tilt[tilt_key] for tilt_key in tilt_data} ]
+        # End MDOC loop
+    # End target loop
     
-    return file_list
-        
+    return compact_data
+
+def expandPaths(json_data):
+    """
+    Restores micrograph paths omitted by compactPaths
+    
+    Parameter:
+        json_data (dict, modified) : metadata, possibly compressed
+    
+    Returns:
+        json_data, with all paths
+    """
+    
+    path_templates= json_data.pop(PATHS_KEY, None)
+    if not path_templates: return json_data
+    
+    for curr_target in json_data.keys():
+        for curr_mdoc, general_and_tilt in iterTiltSeries(json_data[curr_target]):
+            mdoc_base= mdocStem(curr_mdoc)
+            tilt_data= general_and_tilt[1]
+            
+            for sorted_idx, tilt_key in enumerate( sortTiltKeys(tilt_data) ):
+                mic_data= tilt_data[tilt_key]
+                movie_base= ntpath.basename( mic_data.get('SubFramePath', '') )
+                
+                for path_key, path_template in path_templates.items():
+                    if path_key not in mic_data:
+                        mic_data[path_key]= micPath(path_template, curr_mdoc, mdoc_base, movie_base, sorted_idx)
+            # End micrograph loop
+    # End target loop
+    
+    return json_data
+
 def read_mdoc(mdoc_file):
     """
     Parses MDOC file
@@ -2486,7 +5054,7 @@ def read_mdoc(mdoc_file):
     """
     
     # Initialize MDOC data
-    general_lines, tilt_data= readMdocHeader(mdoc_file)
+    general_lines, tilt_data= scanMdoc(mdoc_file)
     
     # Parse general Information
     general_information = {}
@@ -2520,16 +5088,14 @@ def read_mdoc(mdoc_file):
         num_counter += 1
         tilt_num = 'tilt_no_' + str(num_counter)
         tilt_information[tilt_num] = {}
-        for line in mic_data:
-            key_value = line.split('=')
-            key = key_value[0].strip()
-            value = key_value[1].strip()
+        for key, value in mic_data.items.items():
             if key in desired_items_general:
                 general_information[key] = value
             elif key in desired_items_tilt:
+                # Angles and dose rates are kept as in the MDOC (the parsed numbers are only used in memory, see MdocZValue)
                 if key == '[ZValue' :
                     key= key.split('[')[1]
-                    value= int(value.split(']')[0])
+                    value= mic_data.zvalue
                 tilt_information[tilt_num][key] = value
     
     # Returning list of two dictionaries containing general and tilt specific information
@@ -2546,65 +5112,97 @@ def readMdocHeader(mdoc_file):
     
     Returns:
         list : header data
-        list : micrograph-specific data
+        list : micrograph-specific data (one list of lines per ZValue)
+    """
+    
+    # Copies, since the parsed MDOC is cached
+    header_lines, zvalue_list= scanMdoc(mdoc_file)
+    
+    return list(header_lines), [list(zvalue_record.lines) for zvalue_record in zvalue_list]
+
+def scanMdoc(mdoc_file):
+    """
+    Parses MDOC once, and caches the result until the file changes
+    
+    Parameter: 
+        mdoc_file : filename
+    
+    Returns:
+        tuple : header lines
+        list : MdocZValue records, one per ZValue
     """
     
-    # Read file
+    mdoc_signature= fileSignature(mdoc_file)
+    
+    if mdoc_file in MDOC_CACHE:
+        cached_signature, mdoc_data= MDOC_CACHE[mdoc_file]
+        if cached_signature == mdoc_signature: return mdoc_data
+    
     with open(mdoc_file) as fin:
-        lines= fin.readlines()
+        mdoc_stream= streamMdoc(fin)
+        header_lines= next(mdoc_stream)
+        mdoc_data= ( header_lines, list(mdoc_stream) )
+    
+    MDOC_CACHE[mdoc_file]= (mdoc_signature, mdoc_data)
+    
+    return mdoc_data
 
-    # Initialize
-    general_lines= []
-    tilt_data= []
-    z_block= []
+def streamMdoc(line_iterator):
+    """
+    Parses MDOC lines in a single pass
+    
+    A ZValue section starts with a line beginning with '[Z', and ends at a blank line.
+    A section that hasn't ended yet (e.g., an MDOC still being written) isn't yielded.
+    
+    Parameter: 
+        line_iterator : open MDOC file, or list of lines
+    
+    Yields:
+        first, a tuple of header lines
+        then, an MdocZValue record for each ZValue
+    """
+    
+    header_lines= []
+    zvalue_record= None
     in_z= False
     prev_line= None
     
-    for curr_line in lines:
+    for curr_line in line_iterator:
         curr_line= curr_line.strip()
+        
         if curr_line[0:2] != "[Z" and not in_z:
-            general_lines.append(curr_line)
+            header_lines.append(curr_line)
         elif curr_line[0:2] == "[Z":
-            # Start a new z_block
-            z_block= [curr_line]
+            # The header ends at the first ZValue
+            if header_lines is not None:
+                yield tuple(header_lines)
+                header_lines= None
+            
+            # Start a new ZValue
+            zvalue_record= MdocZValue()
+            zvalue_record.addLine(curr_line)
             in_z= True
         elif in_z and curr_line != "":
-            z_block.append(curr_line)
+            zvalue_record.addLine(curr_line)
         else:
             if prev_line != "": 
-                tilt_data.append(z_block)
-            
+                yield zvalue_record
+        
         # Remember previous line in case MDOC ends in multiple carriage returns
         prev_line= curr_line
     # End line loop
-
-    return general_lines, tilt_data
-
-def subframeFromZvalueData(mic_data):
-    """
-    Find list element which starts with SubFramePath
-    
-    Parameter:
-        mic_data : list of data corresponding to a ZValue in an MDOC
-        
-    Returns:
-        basename of SubFramePath entry
-    """
-
-    result = [i for i in mic_data if i.startswith('SubFramePath')]
-    assert len(result) == 1, f"UH OH! more than one MDOC entry starts with 'SubFramePath': {result}"
-    key_value= result[0].split('=')
-    value= key_value[1].strip()
     
-    return ntpath.basename(value)
+    # No ZValues
+    if header_lines is not None: yield tuple(header_lines)
 
-def definedAndExists(curr_key, curr_dict):
+def definedAndExists(curr_key, curr_dict, snapshot=None):
     """
     Checks if dictionary has key, and whether that key's value corresponds to a valid path
     
     Parameters:
         curr_key : potential dictionary key, whose value corresponds to a path
         curr_dict : dictionary
+        snapshot (DirectorySnapshot, optional) : directory listings to check instead of the file system
     
     Returns:
         boolean : whether value is a valid file path
@@ -2618,7 +5216,9 @@ def definedAndExists(curr_key, curr_dict):
     # Check first if dictionary has key
     if curr_key in curr_dict:
         if isinstance(curr_dict[curr_key], str):
-            if os.path.exists(curr_dict[curr_key]):
+            if snapshot:
+                does_it_exist= snapshot.exists(curr_dict[curr_key])
+            elif os.path.exists(curr_dict[curr_key]):
                 does_it_exist= True
             
     return does_it_exist
@@ -2633,9 +5233,13 @@ def save_json(data, filename='output.json', verbosity=0):
         verbosity (int) : verbosity (1+, prints save message, 9+ prints contents)
     """
     
-    # Save as JSON
-    with open(filename, 'w') as f:
+    # Save as JSON, to a temporary file which then replaces the old one, so that readers never see a partial file
+    temp_file= f"{filename}.{os.getpid()}.tmp"
+    with open(temp_file, 'w') as f:
         json.dump(data, f, indent=3)
+        f.flush()
+        os.fsync( f.fileno() )
+    os.replace(temp_file, filename)
     
     if verbosity>=1: print(f'Data exported and saved as {filename}')
     if verbosity>=9: 
@@ -2661,23 +5265,235 @@ def read_json(json_file):
         json_data = json.load(f)
     return json_data
 
-def getLatest(file_pattern, dir_name='.', debug=False):
+def appendJournal(entry_list, journal_file):
     """
-    Returns latest file from a file pattern.
-    Returns 'None' if no file found
+    Appends edits to the journal, one JSON object per line
+    
+    Parameters:
+        entry_list (list) : dictionaries with keys 'target', 'mdoc', 'tilt', and one of 'data', 'general' (edited header fields only), or 'micrograph' (edited micrograph fields only)
+        journal_file : journal filename
     """
     
-    file_list= glob.glob( os.path.join(dir_name, file_pattern) )
+    with open(journal_file, 'a') as f:
+        f.write( ''.join(json.dumps(entry) + '\n' for entry in entry_list) )
+        
+        # Make sure it's on disk, in case of a crash
+        f.flush()
+        os.fsync( f.fileno() )
+
+def replayJournal(json_data, journal_file, offset=0):
+    """
+    Applies edits from the journal, in order
     
-    # If more than one, get latest (adapted from https://stackoverflow.com/a/39327156)
-    if len(file_list) > 0 : 
-        latest_file= max(file_list, key=os.path.getctime)
-    else:
-        latest_file= None
+    Parameters:
+        json_data (dict, modified) : metadata, in the JSON layout
+        journal_file : journal filename
+        offset (int, optional) : position in bytes from which to start (i.e., skipping edits already applied)
+    
+    Returns:
+        number of edits applied
+    """
+    
+    if not os.path.exists(journal_file): return 0
+    
+    num_entries= 0
+    edited_series= {}  # Tilt series whose micrographs were edited, whose rollups need to be updated
+    
+    with open(journal_file, 'r') as f:
+        f.seek(offset)
+        for line in f:
+            try:
+                entry= json.loads(line)
+            except ValueError:
+                # A crash while writing may leave the last line incomplete
+                print(f"WARNING! Skipping unreadable line in journal '{journal_file}'")
+                continue
+            
+            general_and_tilt= applyJournalEntry(json_data, entry)
+            if general_and_tilt is not None: edited_series[ (entry['target'], entry['mdoc']) ]= general_and_tilt
+            
+            num_entries+= 1
+        # End line loop
+    
+    for general_and_tilt in edited_series.values(): updateSelectionRollup(general_and_tilt)
+    
+    return num_entries
+
+def applyJournalEntry(json_data, entry):
+    """
+    Applies a single edit (see appendJournal)
+    
+    Parameters:
+        json_data (dict, modified) : metadata, in the JSON layout
+        entry (dict) : edit
+    
+    Returns:
+        tilt-series data, if its micrographs were edited (so that its rollup needs to be updated), otherwise None
+    """
+    
+    curr_target, curr_mdoc, tilt_key, entry_data= entry['target'], entry['mdoc'], entry['tilt'], entry.get('data')
+    if curr_target not in json_data: json_data[curr_target]= {}
+    target_data= json_data[curr_target]
+    
+    if 'general' in entry:
+        if curr_mdoc in target_data: target_data[curr_mdoc][0].update(entry['general'])
+    elif 'micrograph' in entry:
+        if curr_mdoc in target_data and tilt_key in target_data[curr_mdoc][1]: 
+            target_data[curr_mdoc][1][tilt_key].update(entry['micrograph'])
+            return target_data[curr_mdoc]
+    elif entry_data is None:
+        target_data.pop(curr_mdoc, None)
+    elif tilt_key is None:
+        target_data[curr_mdoc]= entry_data
+        
+        # A tilt series belongs to only one target file (e.g., it may have been moved by '--update_mdoc')
+        if isinstance(entry_data, list): removeFromOtherTargets(json_data, curr_target, curr_mdoc)
+    elif curr_mdoc in target_data:
+        target_data[curr_mdoc][1][tilt_key]= entry_data
+        return target_data[curr_mdoc]
+    
+    return None
+
+def removeFromOtherTargets(json_data, curr_target, curr_mdoc):
+    """
+    Removes a tilt series from all target files except one, and removes target files left without tilt series
+    
+    Parameters:
+        json_data (dict, modified) : metadata, in the JSON layout
+        curr_target : target file which keeps the tilt series
+        curr_mdoc : MDOC file
+    """
+    
+    for other_target in list( json_data.keys() ):
+        if other_target == curr_target or curr_mdoc not in json_data[other_target]: continue
         
-    if debug: print(f"DEBUG getLatest 863: Looking for '{file_pattern}', found '{latest_file}'")
+        del json_data[other_target][curr_mdoc]
+        if not any( iterTiltSeries(json_data[other_target]) ): del json_data[other_target]
+
+def journalSize(journal_file):
+    """
+    Returns:
+        size of the journal in bytes (0 if absent)
+    """
+    
+    try:
+        return os.path.getsize(journal_file)
+    except OSError:
+        return 0
+
+@contextlib.contextmanager
+def lockFile(data_file, shared=False):
+    """
+    Advisory lock on '<data_file>.lock', so that several processes (e.g., parallel pipeline workers) can update the same metadata
+    The lock isn't re-entrant, so it shouldn't be requested again while held.
+    
+    Parameters:
+        data_file (str) : file to protect
+        shared (bool) : flag to request a shared (reading) lock rather than an exclusive (writing) one
+    """
+    
+    if fcntl is None: 
+        yield
+        return
+    
+    with open(data_file + '.lock', 'a') as lock_obj:
+        fcntl.flock(lock_obj, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_obj, fcntl.LOCK_UN)
+
+def readManifest(manifest_file, verbosity=0):
+    """
+    Reads signatures of the input files from a previous build
+    
+    Parameters:
+        manifest_file : manifest filename
+        verbosity (int) : verbosity (7+ prints a message if found)
+    
+    Returns:
+        dictionary (empty if not found or unreadable), with the MDOC as the key
+    """
+    
+    if not os.path.exists(manifest_file): return {}
+    
+    try:
+        manifest= read_json(manifest_file)
+    except ValueError:
+        print(f"WARNING! Can't read manifest '{manifest_file}', will re-parse all tilt series")
+        return {}
+    
+    if verbosity>=7: print(f"Found manifest for {len(manifest)} tilt series: {manifest_file}")
+    
+    return manifest
+
+def readMrcHeader(mrc_file):
+    """
+    Reads the 1024-byte header of an MRC file
+    Results are cached by filename and modification time.
+    
+    Parameter:
+        mrc_file (str) : MRC filename
+    
+    Returns:
+        dictionary with keys 'dims' (x, y, z), 'mode', 'pixel_size' (x, y, z), 'ext_header' (length in bytes)
+        None if the file can't be read
+    """
+    
+    try:
+        mrc_mtime= os.stat(mrc_file).st_mtime_ns
+    except OSError:
+        return None
+    
+    cache_key= (mrc_file, mrc_mtime)
+    if cache_key in MRC_HEADER_CACHE: return MRC_HEADER_CACHE[cache_key]
+    
+    try:
+        with open(mrc_file, 'rb') as mrc_obj:
+            header_bytes= mrc_obj.read(1024)
+    except OSError:
+        return None
+    
+    if len(header_bytes) < 1024: return None
+    
+    # Machine stamp (bytes 213-214) is 0x11 0x11 for big-endian, and 0x44 0x41 or 0x44 0x44 for little-endian
+    byte_order= '>' if header_bytes[212] == 0x11 else '<'
+    
+    nx, ny, nz, mode= struct.unpack_from(byte_order + '4i', header_bytes, 0)
+    mx, my, mz= struct.unpack_from(byte_order + '3i', header_bytes, 28)
+    cella= struct.unpack_from(byte_order + '3f', header_bytes, 40)
+    nsymbt= struct.unpack_from(byte_order + 'i', header_bytes, 92)[0]
     
-    return latest_file
+    # Pixel size is cell dimension divided by sampling
+    pixel_size= [ cella[axis]/sampling if sampling > 0 else 0.0 for axis, sampling in enumerate([mx, my, mz]) ]
+    
+    mrc_header= {
+        'dims'       : (nx, ny, nz), 
+        'mode'       : mode, 
+        'pixel_size' : pixel_size, 
+        'ext_header' : nsymbt, 
+        }
+    MRC_HEADER_CACHE[cache_key]= mrc_header
+    
+    return mrc_header
+
+def fileSignature(filename):
+    """
+    Gets the size, modification time, and inode of a file or directory
+    
+    Parameter:
+        filename
+    
+    Returns:
+        list of [size, mtime (ns), inode], or None if absent
+    """
+    
+    try:
+        file_stat= os.stat(filename)
+    except OSError:
+        return None
+    
+    return [file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino]
 
 def system_call_23(cmd, args, lenient=False, stdout=None, stderr=None, usempi=False, log=None, verbose=False):
     """
@@ -2737,37 +5553,43 @@ def find_depth(item, depth=0):
         return depth
     
 # Image creation & manipulation functions
-def open_mrc(mrc_file):
+def makeThumbnail(mrc_file, filename, binning=16):
     """
-    Reads MRC file
+    Writes a downsampled image of a micrograph, without reading the full micrograph into memory
     
     Parameters:
         mrc_file (str) : MRC filename
-    
-    Returns:
-        MRC data as NumPy array
+        filename (str) : output image filename
+        binning (int) : downsampling factor
     """
     
-    # Opens a mrc and returns it as a numpy array
-    with mrcfile.open(mrc_file) as mrc:
-        # Read the data from the MRC-stack as a NumPy array
-        data = np.array(mrc.data)
-        # Flipping around the X-axis because by default the x-axis is mirrored in numpy
-        mirrored_data = np.flipud(data)
-    return mirrored_data
+    import mrcfile
+    import numpy as np
+    
+    # Memory-map rather than read, only the binned image will be in memory
+    with mrcfile.mmap(mrc_file, mode='r', permissive=True) as mrc:
+        data= mrc.data
+        if data.ndim == 3: data= data[0]
+        
+        # Flipping around the X-axis because by default the x-axis is mirrored in numpy (np.flipud only creates a view)
+        binned_data= bin_nparray( np.flipud(data), binning )
+    
+    save_as_image(binned_data, filename)
 
 def bin_nparray(data, binning=1):
     """
     Downsamples NumPy array
     
     Parameters:
-        data : NumPy array
+        data : NumPy array (can be a view or memory-mapped)
         binning (int) : downsampling factor
     
     Returns:
-        downsampled NumPy array
+        downsampled NumPy array (float32)
     """
     
+    import numpy as np
+    
     # Bins a 2D numpy array according to binning factor provided
     height, width = data.shape
     
@@ -2775,11 +5597,11 @@ def bin_nparray(data, binning=1):
     new_height = height // binning
     new_width = width // binning
     
-    # Reshape the matrix into a new shape with the binned dimensions
+    # Reshape the matrix into a new shape with the binned dimensions (a view, not a copy)
     reshaped_matrix = data[:new_height * binning, :new_width * binning].reshape(new_height, binning, new_width, binning)
     
-    # Take the mean along the binned axes (axis=1 and axis=3)
-    binned_matrix = np.mean(reshaped_matrix, axis=(1, 3))
+    # Take the mean along the binned axes (axis=1 and axis=3), accumulating in single precision
+    binned_matrix = reshaped_matrix.mean(axis=(1, 3), dtype=np.float32)
     
     return binned_matrix
 
@@ -2791,6 +5613,8 @@ def display_nparray(data):
         data : NumPy array
     """
     
+    import matplotlib.pyplot as plt
+    
     plt.imshow(data, cmap='gray')
     plt.axis('off')
     plt.show()
@@ -2805,15 +5629,20 @@ def save_as_image(data, filename='file'):
         filename (str) : filename
     """
 
-    # Check if directory exists, if not create it
+    import numpy as np
+    from PIL import Image
+    
+    # Check if directory exists, if not create it (other workers may be creating it at the same time)
     file_path = filename
     directory = os.path.dirname(file_path)
-    if not os.path.exists(directory):
-        # Create the directory if it doesn't exist
-        os.makedirs(directory)
+    if directory: os.makedirs(directory, exist_ok=True)
     
-    # Scale the array values to the range [0, 255]
-    scaled_matrix = (data - np.min(data)) / (np.max(data) - np.min(data)) * 255
+    # Scale the array values to the range [0, 255], in place in a single-precision copy
+    scaled_matrix = np.array(data, dtype=np.float32)
+    data_min = scaled_matrix.min()
+    data_range = scaled_matrix.max() - data_min
+    scaled_matrix -= data_min
+    if data_range > 0: scaled_matrix *= 255/data_range
     
     # Convert the scaled array to unsigned 8-bit integers
     scaled_matrix = scaled_matrix.astype(np.uint8)
@@ -2885,7 +5714,8 @@ def parse_command_line():
     parser = argparse.ArgumentParser(
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
         usage=USAGE,
-        epilog=MODIFIED
+        epilog=MODIFIED,
+        allow_abbrev=False  # Headless mode is decided from the exact flag names, before parsing (see HEADLESS)
     )
 
     parser.add_argument(
@@ -2897,6 +5727,30 @@ def parse_command_line():
         type=str,
         default='heatwave.json',
         help="JSON metadata file, will be created if it doesn't exist, and if the necessary inputs are provided")
+    parser.add_argument(
+        "--store",
+        type=str,
+        choices=['json', 'sqlite'],
+        default='json',
+        help="Metadata storage: the JSON file, or an SQLite database (JSON filename with '.sqlite' extension), imported from the JSON file if absent")
+    parser.add_argument(
+        "--compact_paths",
+        action="store_true",
+        help="Save only the micrograph paths which differ from the path templates in the JSON file (smaller, but can't be read by older versions)")
+    parser.add_argument(
+        "--export_json",
+        action="store_true",
+        help="With '--store sqlite', also write the JSON file whenever the database is saved")
+    parser.add_argument(
+        "--journal_max",
+        type=int,
+        default=500,
+        help="Edits are appended to a journal (JSON filename + '.journal'), and the JSON file is rewritten after this many edits (0: always)")
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        default=None,
+        help="Signatures of input files, so that a rebuild re-parses only changed tilt series (default: JSON filename + '.manifest')")
     
     required= parser.add_argument_group(
         title="Input target or MDOC files",
@@ -2912,6 +5766,41 @@ def parse_command_line():
         type=str,
         help="MDOC files (surrounded by quotes if more than one)")
 
+    required.add_argument(
+        "--update_mdoc",
+        type=str,
+        default=None,
+        help="Parse only this MDOC file, and add it to the existing JSON file (or replace it), without the GUI. The target file, if any, is found among '--target_files'")
+
+
+    catalog= parser.add_argument_group(
+        title="Catalog",
+        description="Index of the tilt series from many sessions, for queries across sessions. No GUI is shown.")
+    
+    catalog.add_argument(
+        "--catalog",
+        type=str,
+        default=None,
+        help="Catalog database (SQLite), will be created if it doesn't exist")
+
+    catalog.add_argument(
+        "--catalog_add",
+        type=str,
+        default=None,
+        help="Session JSON files or SQLite stores to add to the catalog (surrounded by quotes if more than one). Sessions already in the catalog are updated if changed.")
+
+    catalog.add_argument(
+        "--max_res",
+        type=float,
+        default=None,
+        help="Catalog query: best MaxRes of the tilt series must be smaller than this, Angstroms")
+
+    catalog.add_argument(
+        "--min_selected",
+        type=int,
+        default=None,
+        help="Catalog query: minimum number of selected micrographs in the tilt series")
+
 
     parameters= parser.add_argument_group(
         title="Parameters"
@@ -2928,6 +5817,18 @@ def parse_command_line():
         default=160,
         help=f"Image size")
 
+    parameters.add_argument(
+        "--image_cache_mb",
+        type=int,
+        default=256,
+        help="Memory budget for decoded images in the GUI, MB (the least recently shown are dropped first)")
+
+    parameters.add_argument(
+        "--thumb_cache",
+        type=str,
+        default=None,
+        help="Directory of images scaled to '--imgsize', so that later sessions needn't decode the originals again (default: JSON filename + '.thumbs')")
+
     parameters.add_argument(
         '--expand',
         action="store_true",
@@ -2952,6 +5853,41 @@ def parse_command_line():
     10: Dump JSON contents to screen
     """
 
+    parameters.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of parallel workers when reading tilt series")
+
+    parameters.add_argument(
+        "--checkpoint_every",
+        type=int,
+        default=100,
+        help="While building, save a checkpoint (JSON filename + '.ckpt') after this many tilt series, from which an interrupted build will resume (0: never)")
+
+    parameters.add_argument(
+        "--checkpoint_secs",
+        type=float,
+        default=300,
+        help="While building, also save a checkpoint after this many seconds (0: never)")
+
+    parameters.add_argument(
+        '--watch',
+        action="store_true",
+        help="Flag to keep running without the GUI, and update tilt series as new files appear (selections and notes are kept)")
+
+    parameters.add_argument(
+        "--watch_secs",
+        type=float,
+        default=5,
+        help="With '--watch', interval between directory listings, if inotify (Python package inotify_simple) isn't available")
+
+    parameters.add_argument(
+        "--debounce_secs",
+        type=float,
+        default=2,
+        help="With '--watch', seconds without further changes before updating")
+
     parameters.add_argument(
         '--no_rotate',
         action="store_true",
@@ -3140,6 +6076,18 @@ if __name__ == '__main__':
     # exit(14)
     verbosity=options.verbose
 
+    # Catalog mode doesn't use the current session
+    if options.catalog:
+        session_catalog= SessionCatalog(options.catalog, verbosity=options.verbose)
+        if options.catalog_add: session_catalog.addSessions( expandInputFiles(options.catalog_add) )
+        session_catalog.printQuery(max_res=options.max_res, min_selected=options.min_selected)
+        sys.exit(0)
+    
+    # Without the GUI, there's no need for a QApplication
+    if options.no_gui or options.update_mdoc or options.watch:
+        HeatwaveSession(options, debug=options.debug)
+        sys.exit(0)
+    
     tree_app = QtWidgets.QApplication(sys.argv)
     window = MdocTreeView(options, debug=options.debug)
     sys.exit( tree_app.exec_() )
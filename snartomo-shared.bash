@@ -348,7 +348,7 @@ function create_directories() {
     fi
     # End outdir-exists IF-THEN
 
-    rm -r ${heatwave_json} 2> /dev/null
+    rm -r ${heatwave_json} ${heatwave_json}.manifest ${heatwave_json}.journal ${heatwave_json}.lock ${heatwave_json}.ckpt ${heatwave_json}.thumbs ${heatwave_json%.*}.sqlite 2> /dev/null
   fi
   # End overwrite IF-THEN
   
@@ -5302,6 +5302,7 @@ function create_json() {
 #   Positional variables:
 #     1) (optional) output log
 #     2) (OPTIONAL) string before command
+#     3) (OPTIONAL) MDOC file, if only a single tilt series needs to be added/updated
 #
 #   Calls functions:
 #     vprint
@@ -5321,11 +5322,20 @@ function create_json() {
   
   local outlog=$1
   local prestring=$2
+  local update_mdoc=$3
   
   local heatwave_cmd="$python_exe ${SNARTOMO_DIR}/snartomo-heatwave.py --no_gui --json ${heatwave_json} "
   
+  # Only a single tilt series (the target file is needed to know where it belongs)
+  if [[ "${update_mdoc}" != "" ]]; then
+    heatwave_cmd+=" --update_mdoc ${update_mdoc} "
+    
+    if [[ "${do_pace}" == true ]] && [[ "${vars[mdoc_files]}" == "" ]] ; then
+      heatwave_cmd+=" --target_files \'${vars[target_files]}\' "
+    fi
+  
   # If MDOC files are provided, vars[target_files] will be a dummy file
-  if [[ "${do_pace}" == true ]]; then
+  elif [[ "${do_pace}" == true ]]; then
     if [[ "${vars[overwrite]}" == true ]]; then
       heatwave_cmd+=" --new "
     fi
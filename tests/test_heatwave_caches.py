@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+"""
+Headless smoke tests for the image caches of snartomo-heatwave.py (PixmapCache, and the names of the scaled images on disk)
+Neither Qt nor a display is needed. Run with:
+    python -m unittest discover tests
+"""
+
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+HEATWAVE_PY= os.path.join( os.path.dirname( os.path.dirname( os.path.abspath(__file__) ) ), 'snartomo-heatwave.py' )
+
+def loadHeatwave():
+    """
+    Imports snartomo-heatwave.py (which has a hyphen in its name) in headless mode, i.e., without Qt
+    """
+
+    old_argv= sys.argv
+    sys.argv= [HEATWAVE_PY, '--no_gui']
+    try:
+        spec= importlib.util.spec_from_file_location('snartomo_heatwave', HEATWAVE_PY)
+        module= importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.argv= old_argv
+
+    return module
+
+heatwave= loadHeatwave()
+MB= 1024*1024
+
+class FakePixmap:
+    """
+    Stands in for a QPixmap, with only what pixmapBytes uses: 1 MB per unit at 32 bits per pixel
+    """
+
+    def __init__(self, num_mb):
+        self.num_mb= num_mb
+
+    def width(self):
+        return 512
+
+    def height(self):
+        return 512*self.num_mb
+
+    def depth(self):
+        return 32
+
+class TestPixmapCache(unittest.TestCase):
+
+    def testBudgetClamped(self):
+        self.assertEqual(heatwave.PixmapCache(1).max_bytes, heatwave.PixmapCache.MIN_BYTES)
+        self.assertEqual(heatwave.PixmapCache(64*MB).max_bytes, 64*MB)
+
+    def testLeastRecentlyUsedEvicted(self):
+        cache= heatwave.PixmapCache(16*MB)
+        for key in range(4): cache.put(key, FakePixmap(4))
+
+        # Reading key 0 makes key 1 the oldest
+        self.assertIsNotNone( cache.get(0) )
+        cache.put(4, FakePixmap(4))
+
+        self.assertEqual( sorted(cache.pixmaps.keys()), [0, 2, 3, 4] )
+        self.assertEqual(cache.num_bytes, 16*MB)
+        self.assertIsNone( cache.get(1) )
+        self.assertEqual( (cache.num_hits, cache.num_misses), (1, 1) )
+
+    def testNewestKeptOverBudget(self):
+        cache= heatwave.PixmapCache(16*MB)
+        cache.put('small', FakePixmap(4))
+        cache.put('big', FakePixmap(32))
+
+        self.assertEqual( list(cache.pixmaps.keys()), ['big'] )
+
+    def testReplacedPixmapCountedOnce(self):
+        cache= heatwave.PixmapCache(16*MB)
+        cache.put('key', FakePixmap(4))
+        cache.put('key', FakePixmap(8))
+
+        self.assertEqual(cache.num_bytes, 8*MB)
+
+    def testPinnedNotEvicted(self):
+        cache= heatwave.PixmapCache(16*MB)
+        for key in range(4): cache.put(key, FakePixmap(4))
+        cache.pin(0)
+        cache.pin(1)
+
+        # Images waiting to be painted stay, even though they're the oldest
+        cache.put(4, FakePixmap(4))
+        cache.put(5, FakePixmap(4))
+        self.assertEqual( sorted(cache.pixmaps.keys()), [0, 1, 4, 5] )
+
+        # Once painted, they can be evicted again
+        cache.unpin(0)
+        cache.put(6, FakePixmap(4))
+        self.assertEqual( sorted(cache.pixmaps.keys()), [1, 4, 5, 6] )
+
+    def testPinsCappedAtBudget(self):
+        cache= heatwave.PixmapCache(16*MB)
+
+        # More images waiting than the budget (e.g., rows scrolled away before their images were ready)
+        for key in range(6):
+            cache.put(key, FakePixmap(4))
+            cache.pin(key)
+
+        self.assertEqual( list(cache.pinned.keys()), [2, 3, 4, 5] )
+        self.assertEqual( sorted(cache.pixmaps.keys()), [1, 2, 3, 4, 5] )
+
+        # Unpinned ones are evicted first
+        cache.put(6, FakePixmap(4))
+        self.assertEqual( sorted(cache.pixmaps.keys()), [2, 3, 4, 5, 6] )
+
+    def testPinAbsentKeyIgnored(self):
+        cache= heatwave.PixmapCache(16*MB)
+        cache.pin('absent')
+        cache.unpin('absent')
+
+        self.assertEqual( len(cache.pinned), 0 )
+
+class TestThumbCacheFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir= tempfile.TemporaryDirectory()
+        self.cache_dir= os.path.join(self.temp_dir.name, 'cache')
+        os.makedirs(self.cache_dir)
+        self.image_file= os.path.join(self.temp_dir.name, 'mic.jpg')
+        self.writeImage(self.image_file, b'version 1')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def writeImage(self, filename, contents):
+        with open(filename, 'wb') as f: f.write(contents)
+
+    def touchCacheFile(self, cache_file):
+        with open(cache_file, 'wb') as f: f.write(b'png')
+
+        return cache_file
+
+    def testStableName(self):
+        cache_file= heatwave.thumbCacheFile(self.cache_dir, self.image_file, 160)
+
+        self.assertEqual(os.path.dirname(cache_file), self.cache_dir)
+        self.assertTrue( cache_file.endswith('_160.png') )
+        self.assertEqual( cache_file, heatwave.thumbCacheFile(self.cache_dir, self.image_file, 160) )
+
+    def testSizeAndPathInName(self):
+        cache_file= heatwave.thumbCacheFile(self.cache_dir, self.image_file, 160)
+        other_size= heatwave.thumbCacheFile(self.cache_dir, self.image_file, 320)
+        other_file= os.path.join(self.temp_dir.name, 'other.jpg')
+        self.writeImage(other_file, b'version 1')
+
+        # Same original and version, other size
+        self.assertNotEqual(cache_file, other_size)
+        self.assertEqual( os.path.basename(cache_file).split('_')[:2], os.path.basename(other_size).split('_')[:2] )
+
+        # Same contents, other original
+        self.assertNotEqual( os.path.basename(cache_file).split('_')[0], os.path.basename( heatwave.thumbCacheFile(self.cache_dir, other_file, 160) ).split('_')[0] )
+
+    def testModifiedOriginalDoesntMatch(self):
+        old_file= heatwave.thumbCacheFile(self.cache_dir, self.image_file, 160)
+
+        self.writeImage(self.image_file, b'version 2, longer')
+        new_time= time.time() + 10
+        os.utime(self.image_file, (new_time, new_time))
+
+        self.assertNotEqual( old_file, heatwave.thumbCacheFile(self.cache_dir, self.image_file, 160) )
+
+    def testMissingOriginal(self):
+        self.assertIsNone( heatwave.thumbCacheFile(self.cache_dir, os.path.join(self.temp_dir.name, 'absent.jpg'), 160) )
+
+    def testOutdatedFilesRemoved(self):
+        old_files= [ self.touchCacheFile( heatwave.thumbCacheFile(self.cache_dir, self.image_file, size) ) for size in [160, 320] ]
+
+        other_file= os.path.join(self.temp_dir.name, 'other.jpg')
+        self.writeImage(other_file, b'other')
+        unrelated_file= self.touchCacheFile( heatwave.thumbCacheFile(self.cache_dir, other_file, 160) )
+
+        # New version of the original
+        self.writeImage(self.image_file, b'version 2, longer')
+        new_time= time.time() + 10
+        os.utime(self.image_file, (new_time, new_time))
+        new_files= [ self.touchCacheFile( heatwave.thumbCacheFile(self.cache_dir, self.image_file, size) ) for size in [160, 320] ]
+
+        heatwave.removeOutdatedCacheFiles(new_files[0])
+
+        for old_file in old_files: self.assertFalse( os.path.exists(old_file) )
+        for new_file in new_files: self.assertTrue( os.path.exists(new_file) )
+        self.assertTrue( os.path.exists(unrelated_file) )
+
+if __name__ == '__main__':
+    unittest.main()